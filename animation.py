@@ -0,0 +1,408 @@
+import io
+import math
+import os
+import random
+
+from PIL import Image, features
+
+import config
+from background import expand_background, get_blur_style, get_blurred_artwork
+from cache import atomic_write_bytes
+from gen_poster import (
+    create_gradient_background,
+    draw_titles,
+    find_poster_files,
+    get_cell_sprite,
+    get_format_config,
+    load_poster_manifest,
+    load_poster_palette,
+    make_poster_seed,
+    pick_render_colors,
+    plan_format,
+)
+from planner import match_any
+
+# 超出文件大小上限时最少保留的帧数
+MIN_FRAMES = 8
+
+# 超出文件大小上限时 WebP 质量依次降低的幅度
+QUALITY_STEPS = (0, 20, 40)
+
+
+def is_animated_library(library):
+    """媒体库是否生成动态海报（匹配 animation.libraries 中的任意规则）"""
+    return match_any(library, config.ANIMATION_CONFIG["LIBRARIES"])
+
+
+def get_animation_format():
+    """实际使用的动态图片格式，Pillow 不支持动态 WebP 时改用 APNG"""
+    image_format = config.ANIMATION_CONFIG["FORMAT"].lower()
+    if image_format == "webp" and not features.check("webp_anim"):
+        print("当前 Pillow 不支持动态 WebP，改为生成 APNG")
+        return "apng"
+    return "apng" if image_format == "apng" else "webp"
+
+
+def get_animation_path(name):
+    """动态海报的保存路径（与静态海报放在一起，不参与上传）"""
+    ext = "png" if get_animation_format() == "apng" else "webp"
+    return os.path.join(config.get_output_folder(), f"{name}_animated.{ext}")
+
+
+def get_frame_count():
+    """一次循环的帧数（不超过帧数上限）"""
+    anim = config.ANIMATION_CONFIG
+    return max(MIN_FRAMES, min(anim["FRAMES"], anim["MAX_FRAMES"]))
+
+
+def _bounding_box(matrix, points):
+    xs = [matrix[0] * x + matrix[1] * y + matrix[2] for x, y in points]
+    ys = [matrix[3] * x + matrix[4] * y + matrix[5] for x, y in points]
+    return (
+        math.floor(min(xs)),
+        math.floor(min(ys)),
+        math.ceil(max(xs)),
+        math.ceil(max(ys)),
+    )
+
+
+def build_column_strip(column, plan, sprites, poster_count, rows, direction):
+    """
+    预先生成一列海报循环滚动所需的整条贴图，并只旋转一次
+
+    列中的海报按行数循环排列，滚动一个周期（rows 个海报间隔）后与起点重合；
+    贴图覆盖画布在整个滚动过程中能看到的区域，每一帧只需平移粘贴
+
+    参数:
+        column: 渲染计划中的一列
+        plan: plan_format 的结果
+        sprites: {海报序号: 单元贴图}
+        poster_count: 可用的海报数量
+        rows: 每列海报数
+        direction: 1 为沿列向下滚动，-1 为向上
+
+    返回:
+        (旋转后的贴图, 滚动起点时在画布上的左上角坐标, 滚动一个周期的位移 (dx, dy))，
+        该列没有海报时返回 None
+    """
+    width, height = plan["size"]
+    sprite_width, sprite_height = plan["sprite_size"]
+    first_index = column["index"] * rows
+    if first_index >= poster_count:
+        return None
+
+    period = rows * column["pitch"]
+    forward = column["forward"]
+    shift = (forward[1] * period * direction, forward[4] * period * direction)
+
+    # 画布在滚动过程中看到的区域（转换到贴图坐标后取外接框）
+    canvas = [(0, 0), (width, 0), (width, height), (0, height)]
+    region = canvas + [(x - shift[0], y - shift[1]) for x, y in canvas]
+    left = math.floor(min(x for x, _ in region))
+    top = math.floor(min(y for _, y in region))
+    right = math.ceil(max(x for x, _ in region))
+    bottom = math.ceil(max(y for _, y in region))
+    _, strip_top, _, strip_bottom = _bounding_box(
+        column["inverse"],
+        [(left, top), (right, top), (right, bottom), (left, bottom)],
+    )
+
+    # 按行数循环排列海报，覆盖可见的纵向范围
+    strip = Image.new("RGBA", (sprite_width, strip_bottom - strip_top), (0, 0, 0, 0))
+    pitch = column["pitch"]
+    for k in range(
+        math.floor((strip_top - sprite_height) / pitch),
+        math.ceil(strip_bottom / pitch) + 1,
+    ):
+        poster_index = first_index + k % rows
+        sprite = sprites.get(poster_index)
+        if poster_index >= poster_count or sprite is None:
+            continue
+        strip.paste(sprite, (0, k * pitch - strip_top), sprite)
+
+    # 只变换贴图与滚动区域相交的部分
+    box = _bounding_box(
+        forward,
+        [
+            (0, strip_top),
+            (sprite_width, strip_top),
+            (sprite_width, strip_bottom),
+            (0, strip_bottom),
+        ],
+    )
+    box = (max(box[0], left), max(box[1], top), min(box[2], right), min(box[3], bottom))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+
+    a, b, c, d, e, f = column["inverse"]
+    rotated = strip.transform(
+        (box[2] - box[0], box[3] - box[1]),
+        Image.AFFINE,
+        (
+            a,
+            b,
+            c + a * box[0] + b * box[1],
+            d,
+            e,
+            f + d * box[0] + e * box[1] - strip_top,
+        ),
+        Image.BICUBIC,
+    )
+    return rotated, (box[0], box[1]), shift
+
+
+def render_frames(background, strips, overlay, frame_count):
+    """
+    逐帧合成：背景和标题层只生成一次，每帧只平移粘贴预先旋转好的列贴图
+
+    返回:
+        RGB 帧列表
+    """
+    overlay_box = overlay.getbbox()
+    if overlay_box:
+        overlay = overlay.crop(overlay_box)
+
+    frames = []
+    for frame_index in range(frame_count):
+        progress = frame_index / frame_count
+        frame = background.copy()
+        for rotated, (left, top), shift in strips:
+            position = (
+                left + round(shift[0] * progress),
+                top + round(shift[1] * progress),
+            )
+            frame.paste(rotated, position, rotated)
+        if overlay_box:
+            frame.alpha_composite(overlay, overlay_box[:2])
+        frames.append(frame.convert("RGB"))
+    return frames
+
+
+def encode_animation(frames, duration, image_format, quality):
+    """
+    编码动态图片，两种格式的编码器都只写入与上一帧不同的区域
+
+    返回:
+        编码后的字节
+    """
+    buffer = io.BytesIO()
+    if image_format == "apng":
+        frames[0].save(
+            buffer,
+            "PNG",
+            save_all=True,
+            append_images=frames[1:],
+            duration=duration,
+            loop=0,
+        )
+    else:
+        frames[0].save(
+            buffer,
+            "WEBP",
+            save_all=True,
+            append_images=frames[1:],
+            duration=duration,
+            loop=0,
+            quality=quality,
+            method=4,
+        )
+    return buffer.getvalue()
+
+
+def encode_within_budget(render, frame_count, image_format):
+    """
+    在文件大小上限内编码：先降低 WebP 质量，仍然超出时减少帧数
+
+    减少帧数时按一次循环重新均匀生成 frame_count // step 帧（每帧显示时间相应加长），
+    帧数不能整除时首尾也能无缝衔接，滚动速度不变
+
+    参数:
+        render: 生成指定帧数的一次循环的函数
+        frame_count: 完整的帧数
+
+    返回:
+        (编码后的字节, 帧数, 质量)，无法满足上限时返回 (None, 0, 0)
+    """
+    anim = config.ANIMATION_CONFIG
+    max_bytes = anim["MAX_SIZE_KB"] * 1024
+    qualities = [None]
+    if image_format == "webp":
+        qualities = [max(1, anim["QUALITY"] - step) for step in QUALITY_STEPS]
+
+    step = 1
+    while True:
+        count = frame_count // step
+        frames = render(count)
+        duration = round(anim["DURATION_MS"] * frame_count / count)
+        for quality in qualities:
+            data = encode_animation(frames, duration, image_format, quality)
+            if len(data) <= max_bytes:
+                return data, count, quality
+            print(
+                f"动态海报 {count} 帧（质量 {quality or '-'}）"
+                f"大小 {len(data) / 1024:.0f} KB 超出上限"
+            )
+        frames = None
+
+        # 文件大小大致与帧数成正比，直接跳到预计能满足上限的帧数
+        size = len(data)
+        while True:
+            step *= 2
+            if frame_count // step < MIN_FRAMES:
+                return None, 0, 0
+            size /= 2
+            if size <= max_bytes:
+                break
+
+
+def estimate_animation_memory():
+    """
+    估算一次动态海报生成的内存峰值（未乘估算系数，供 render_scheduler 使用）
+
+    同时持有所有帧（编码时还有一份副本）、背景和标题层、每列的循环贴图及旋转结果
+    """
+    output_format = config.OUTPUT_FORMATS[0]
+    plan = plan_format(output_format, config.ANIMATION_CONFIG["SCALE"])
+    width, height = plan["size"]
+    sprite_width, sprite_height = plan["sprite_size"]
+    frames = width * height * 3 * (get_frame_count() + 1) * 2
+    layers = width * height * 4 * 3
+    strips = 0
+    for column in plan["columns"]:
+        period = len(column["cells"]) * column["pitch"]
+        strip_height = height * 2 + period + sprite_height
+        strips += sprite_width * strip_height * 4 + width * strip_height * 4
+    sprites = sprite_width * sprite_height * 4 * plan["poster_count"]
+    return 16 * 1024 * 1024 + frames + layers + strips + sprites
+
+
+def render_animation_workflow(name, library_id=None, seed=None, output_path=None):
+    """
+    生成各列缓慢滚动、循环播放的动态海报（使用第一个输出格式的布局）
+
+    背景、标题和色块只生成一次，每列的循环贴图只旋转一次，
+    每一帧只是把旋转好的列贴图平移后粘贴到背景上
+
+    参数:
+        name: 媒体库名称
+        library_id: 媒体库 ID，用于生成随机种子（与静态海报相同，配色一致）
+        seed: 指定随机种子，为None时自动生成
+        output_path: 保存路径，为None时使用 get_animation_path
+
+    返回:
+        bool: 是否生成成功
+    """
+    try:
+        print("\n[3/4] 正在生成动态海报...")
+        print("-" * 40)
+        anim = config.ANIMATION_CONFIG
+        image_format = get_animation_format()
+        if output_path is None:
+            output_path = get_animation_path(name)
+
+        output_format = config.OUTPUT_FORMATS[0]
+        gen_config = get_format_config(output_format)
+        scale = anim["SCALE"]
+        plan = plan_format(output_format, scale)
+        rows = gen_config["ROWS"]
+
+        poster_folder = os.path.join(config.get_poster_folder(), name)
+        poster_files = find_poster_files(poster_folder)[: plan["poster_count"]]
+        if not poster_files:
+            print(f"错误: 在 {poster_folder} 中没有找到支持的图片文件")
+            return False
+
+        manifest = load_poster_manifest(poster_folder)
+        if seed is None:
+            seed = make_poster_seed(library_id or name, poster_files, manifest)
+        rng = random.Random(seed)
+
+        def get_entry(poster_index):
+            return manifest.get(os.path.basename(poster_files[poster_index]), {})
+
+        def open_poster(poster_index):
+            poster = Image.open(poster_files[poster_index])
+            if scale < 1:
+                poster.draft("RGB", plan["cell_size"])
+            poster.load()
+            return poster
+
+        first_entry = get_entry(0)
+        palette = None
+        try:
+            palette = load_poster_palette(
+                first_entry.get("Id"),
+                first_entry.get("ImageTag"),
+                lambda: open_poster(0),
+                store=scale == 1,
+            )
+        except Exception as e:
+            print(f"获取海报主色时出错: {e}")
+        color1, color2, accent_color = pick_render_colors(palette, rng)
+
+        # 静态图层：背景和标题只生成一次
+        background = None
+        style = get_blur_style(gen_config, plan["scale"])
+        if style:
+            small = get_blurred_artwork(
+                first_entry.get("Id"),
+                first_entry.get("ImageTag"),
+                lambda: open_poster(0),
+                plan["size"],
+                style,
+                store=scale == 1,
+            )
+            if small is not None:
+                background = expand_background(small, plan["size"])
+        if background is None:
+            background = create_gradient_background(
+                plan["size"][0], plan["size"][1], color1, color2
+            )
+        overlay = draw_titles(
+            Image.new("RGBA", plan["size"], (0, 0, 0, 0)), name, accent_color, plan
+        )
+
+        # 滚动时整列的海报都会进入画面，需要每一张海报的单元贴图
+        sprites = {}
+        for poster_index in range(len(poster_files)):
+            try:
+                sprites[poster_index] = get_cell_sprite(
+                    get_entry(poster_index), plan, lambda: open_poster(poster_index)
+                )
+            except Exception as e:
+                print(
+                    f"错误: 处理图片 {os.path.basename(poster_files[poster_index])} "
+                    f"时出错: {e}"
+                )
+
+        # 相邻列反向滚动
+        strips = []
+        for column in plan["columns"]:
+            direction = 1 if column["index"] % 2 == 0 else -1
+            strip = build_column_strip(
+                column, plan, sprites, len(poster_files), rows, direction
+            )
+            if strip is not None:
+                strips.append(strip)
+        sprites.clear()
+
+        data, frame_count, quality = encode_within_budget(
+            lambda count: render_frames(background, strips, overlay, count),
+            get_frame_count(),
+            image_format,
+        )
+        strips.clear()
+        if data is None:
+            print(f"错误: 动态海报无法压缩到 {anim['MAX_SIZE_KB']} KB 以内")
+            return False
+
+        atomic_write_bytes(output_path, data)
+        print(
+            f"成功: 动态海报（{frame_count} 帧，{len(data) / 1024:.0f} KB）"
+            f"已保存到 {output_path}"
+        )
+        return True
+
+    except Exception as e:
+        print(f"错误: 创建动态海报时出错: {e}")
+        return False
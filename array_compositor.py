@@ -0,0 +1,220 @@
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFilter
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，未安装时使用 Pillow 合成
+    np = None
+
+# 每种海报单元参数共用的遮罩和阴影数据 {(单元尺寸, 圆角半径, 阴影参数): dict}，
+# 每组约 5 MB，只保留最近使用的 MAX_CELL_PLANES 组
+_CELL_PLANES = OrderedDict()
+_CELL_PLANES_LOCK = threading.Lock()
+MAX_CELL_PLANES = 4
+
+# 每个线程复用的临时缓冲区（生成服务在多个线程中同时生成）
+_SCRATCH = threading.local()
+
+
+def is_available():
+    """是否可以使用数组合成（已安装 numpy）"""
+    return np is not None
+
+
+def _scratch(name, shape, dtype="float32"):
+    """
+    获取当前线程指定名称的临时缓冲区，容量不足时才重新分配
+
+    返回:
+        指定形状的数组（内容未初始化）
+    """
+    buffers = getattr(_SCRATCH, "buffers", None)
+    if buffers is None:
+        buffers = _SCRATCH.buffers = {}
+    count = 1
+    for length in shape:
+        count *= length
+    buffer = buffers.get(name)
+    if buffer is None or buffer.size < count or buffer.dtype != dtype:
+        buffer = buffers[name] = np.empty(count, dtype=dtype)
+    return buffer[:count].reshape(shape)
+
+
+def _to_uint8(values, out):
+    """把 0-255 的浮点数组四舍五入写入 uint8 数组（原地修改 values）"""
+    values += 0.5
+    np.clip(values, 0, 255, out=values)
+    np.copyto(out, values, casting="unsafe")
+    return out
+
+
+def get_cell_planes(cell_width, cell_height, corner_radius, shadow):
+    """
+    计算一种海报单元参数共用的遮罩和阴影数据，同一参数只计算一次
+
+    与 gen_poster.render_cell 的结果一致：圆角遮罩在粘贴时对颜色和透明度各作用两次，
+    阴影按 add_shadow 的方式生成后放在海报下层。这些都与海报内容无关，
+    每张海报只需要 颜色 * weight + shadow 一次运算
+
+    返回:
+        dict，包括
+            base: 只有阴影的贴图 (高, 宽, 4) uint8，海报区域之外的最终像素
+            box: 海报在贴图中的区域 (left, top, right, bottom)
+            weight: 海报颜色的权重 (单元高, 单元宽, 1)
+            shadow: 阴影对海报区域颜色的贡献 (单元高, 单元宽, 3)，0-255
+    """
+    key = ((cell_width, cell_height), corner_radius, tuple(shadow))
+    with _CELL_PLANES_LOCK:
+        planes = _CELL_PLANES.get(key)
+        if planes is not None:
+            _CELL_PLANES.move_to_end(key)
+            return planes
+
+    offset, blur_radius, shadow_color = shadow
+    sprite_width = cell_width + offset + blur_radius * 2
+    sprite_height = cell_height + offset + blur_radius * 2
+
+    # 圆角遮罩（与 render_cell 相同的绘制方式）
+    if corner_radius > 0:
+        mask_image = Image.new("L", (cell_width, cell_height), 0)
+        ImageDraw.Draw(mask_image).rounded_rectangle(
+            [(0, 0), (cell_width, cell_height)], radius=corner_radius, fill=255
+        )
+        mask = np.asarray(mask_image, dtype="float32")[..., None] / 255
+    else:
+        mask = np.ones((cell_height, cell_width, 1), dtype="float32")
+
+    # 阴影层（与 add_shadow 相同：偏移后的矩形再模糊）
+    shadow_image = Image.new("RGBA", (sprite_width, sprite_height), (0, 0, 0, 0))
+    shadow_image.paste(
+        Image.new("RGBA", (cell_width, cell_height), tuple(shadow_color)),
+        (blur_radius + offset, blur_radius + offset),
+    )
+    shadow_image = shadow_image.filter(ImageFilter.GaussianBlur(blur_radius))
+    shadow_pixels = np.asarray(shadow_image, dtype="float32")
+    shadow_alpha = shadow_pixels[..., 3:] / 255
+
+    # 海报层的透明度：圆角遮罩在两次带遮罩粘贴中各作用一次
+    poster_alpha = np.zeros((sprite_height, sprite_width, 1), dtype="float32")
+    box = (
+        blur_radius,
+        blur_radius,
+        blur_radius + cell_width,
+        blur_radius + cell_height,
+    )
+    poster_alpha[box[1] : box[3], box[0] : box[2]] = mask * mask
+
+    # 海报层叠加在阴影上（alpha_composite）
+    alpha = poster_alpha + shadow_alpha * (1 - poster_alpha)
+    safe_alpha = np.where(alpha > 0, alpha, 1)
+    shadow_rgb = (
+        shadow_pixels[..., :3] * shadow_alpha * (1 - poster_alpha) / safe_alpha
+    )
+
+    base = np.empty((sprite_height, sprite_width, 4), dtype="uint8")
+    _to_uint8(np.concatenate([shadow_rgb, alpha * 255], axis=2), base)
+
+    # 海报颜色在海报层中已乘过一次透明度，叠加时再乘一次
+    region = (slice(box[1], box[3]), slice(box[0], box[2]))
+    planes = {
+        "base": base,
+        "box": box,
+        "weight": np.ascontiguousarray(
+            poster_alpha[region] * poster_alpha[region] / safe_alpha[region]
+        ),
+        "shadow": np.ascontiguousarray(shadow_rgb[region]),
+    }
+    with _CELL_PLANES_LOCK:
+        _CELL_PLANES[key] = planes
+        while len(_CELL_PLANES) > MAX_CELL_PLANES:
+            _CELL_PLANES.popitem(last=False)
+    return planes
+
+
+def render_cell(poster, cell_width, cell_height, corner_radius, shadow):
+    """
+    把海报处理成带圆角和阴影的单元贴图（gen_poster.render_cell 的数组实现）
+
+    除缩放后的海报和结果贴图外不再创建完整尺寸的中间图片
+
+    返回:
+        带阴影的 RGBA 贴图（只读）
+    """
+    planes = get_cell_planes(cell_width, cell_height, corner_radius, shadow)
+    resized_poster = poster.resize((cell_width, cell_height), Image.LANCZOS)
+    if resized_poster.mode != "RGB":
+        resized_poster = resized_poster.convert("RGB")
+
+    pixels = planes["base"].copy()
+    left, top, right, bottom = planes["box"]
+    work = _scratch("cell", (cell_height, cell_width, 3))
+    np.multiply(np.asarray(resized_poster), planes["weight"], out=work)
+    work += planes["shadow"]
+    _to_uint8(work, pixels[top:bottom, left:right, :3])
+
+    height, width = pixels.shape[:2]
+    return Image.frombuffer("RGBA", (width, height), pixels, "raw", "RGBA", 0, 1)
+
+
+def get_pixels(sprite):
+    """把贴图转换为 (高, 宽, 4) uint8 数组，每张贴图只需转换一次"""
+    return np.asarray(sprite)
+
+
+def compose_column(placements, size, save_path=None):
+    """
+    在一个数组中合成一列海报单元贴图，得到可直接旋转的预乘透明度图片
+
+    与 gen_poster.compose_format 中的 Pillow 流程一致：贴图按顺序带遮罩粘贴到列画布，
+    列画布再带遮罩粘贴到透明图层，旋转前转换为预乘透明度（RGBa）。
+    所有运算都在同一个列缓冲区上原地完成，每张海报不再创建中间图片
+
+    参数:
+        placements: [(贴图数组, 在列画布上的纵向位置)]，按粘贴顺序排列
+        size: 列画布尺寸 (宽, 高)
+        save_path: 保存列画布（旋转前）的路径，为None时不保存
+
+    返回:
+        RGBa 模式的列图层
+    """
+    width, height = size
+    column = _scratch("column", (height, width, 4))
+    column.fill(0)
+
+    for pixels, y_position in placements:
+        top = max(0, y_position)
+        bottom = min(height, y_position + pixels.shape[0])
+        if bottom <= top:
+            continue
+        source = pixels[top - y_position : bottom - y_position, :width]
+        target = column[top:bottom, : source.shape[1]]
+        rows, columns = source.shape[:2]
+
+        # 带遮罩粘贴：每个通道 = 贴图 * 透明度 + 列画布 * (1 - 透明度)
+        alpha = _scratch("alpha", (rows, columns, 1))
+        np.multiply(source[..., 3:], 1 / 255, out=alpha)
+        term = _scratch("term", (rows, columns, 4))
+        np.multiply(source, alpha, out=term)
+        np.subtract(1, alpha, out=alpha)
+        target *= alpha
+        target += term
+
+    output = _scratch("output", (height, width, 4), "uint8")
+    if save_path:
+        saved = _scratch("saved", (height, width, 4))
+        np.copyto(saved, column)
+        _to_uint8(saved, output)
+        Image.frombuffer("RGBA", size, output, "raw", "RGBA", 0, 1).save(save_path)
+
+    # 粘贴到透明图层（每个通道再乘一次透明度），再把颜色预乘图层的透明度
+    alpha = _scratch("alpha", (height, width, 1))
+    np.multiply(column[..., 3:], 1 / 255, out=alpha)
+    column *= alpha
+    np.multiply(column[..., 3:], 1 / 255, out=alpha)
+    column[..., :3] *= alpha
+
+    # RGBa 不能直接映射缓冲区，这里会复制一次（每列一次）
+    _to_uint8(column, output)
+    return Image.frombuffer("RGBa", size, output, "raw", "RGBa", 0, 1)
@@ -2,6 +2,7 @@ import requests
 import json
 import os
 import config
+import http_client
 
 
 def authenticate_jellyfin(base_url, username, password):
@@ -21,7 +22,7 @@ def authenticate_jellyfin(base_url, username, password):
     }
 
     try:
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = http_client.post(url, headers=headers, data=payload, timeout=30)
         response.raise_for_status()  # 检查HTTP错误
 
         data = response.json()
@@ -59,7 +60,7 @@ def authenticate_emby(base_url, username, password, api_key=None):
         try:
             # 使用API Key获取用户列表
             url = f"{base_url}/Users?api_key={api_key}"
-            response = requests.get(url)
+            response = http_client.get(url, timeout=30)
             response.raise_for_status()
             
             users = response.json()
@@ -92,7 +93,7 @@ def authenticate_emby(base_url, username, password, api_key=None):
     }
     
     try:
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = http_client.post(url, headers=headers, data=payload, timeout=30)
         response.raise_for_status()
         
         data = response.json()
@@ -117,14 +118,15 @@ def authenticate_emby(base_url, username, password, api_key=None):
         return None
 
 
-def authenticate(base_url, username, password, api_key=None):
+def authenticate(base_url, username, password, api_key=None, server_type=None):
     """
     根据服务器类型选择适当的认证方法
     
     Returns:
         dict: 包含认证信息的字典，验证失败则返回None
     """
-    server_type = config.SERVER_TYPE
+    if server_type is None:
+        server_type = config.get_server_type()
     
     if server_type == "jellyfin":
         return authenticate_jellyfin(base_url, username, password)
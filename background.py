@@ -0,0 +1,136 @@
+import os
+
+from PIL import Image, ImageFilter
+
+from cache import atomic_write_bytes, get_cache_dir, make_cache_key
+
+# 可选的背景样式：gradient 为随机渐变，blur 为模糊、压暗并放大的海报
+BACKGROUND_STYLES = ("gradient", "blur")
+
+# 在缩小后的图片上模糊时使用的半径，缩小倍数按目标模糊半径计算
+WORK_BLUR_RADIUS = 4
+
+
+def _cache_dir():
+    """模糊背景缓存目录"""
+    return get_cache_dir("backgrounds")
+
+
+def get_blur_style(gen_config, scale=1.0):
+    """
+    读取布局参数中的背景样式
+
+    参数:
+        gen_config: 输出格式的布局参数（get_format_config 的结果）
+        scale: 渲染计划的缩放比例（包括按画布尺寸的缩放）
+
+    返回:
+        {"blur": 模糊半径（已缩放）, "dim": 亮度系数, "zoom": 放大倍数}，
+        使用渐变背景时返回 None
+    """
+    style = gen_config.get("BACKGROUND", "gradient")
+    if style not in BACKGROUND_STYLES:
+        print(f"不支持的背景样式: {style}，使用渐变背景")
+        return None
+    if style != "blur":
+        return None
+    return {
+        "blur": max(1.0, gen_config["BACKGROUND_BLUR"] * scale),
+        "dim": gen_config["BACKGROUND_DIM"],
+        "zoom": max(1.0, gen_config["BACKGROUND_ZOOM"]),
+    }
+
+
+def get_work_size(size, style):
+    """
+    模糊时使用的缩小尺寸：缩小到目标模糊半径约为 WORK_BLUR_RADIUS 像素，
+    大半径模糊的开销与原图尺寸无关
+    """
+    factor = max(1.0, style["blur"] / WORK_BLUR_RADIUS)
+    return max(1, round(size[0] / factor)), max(1, round(size[1] / factor))
+
+
+def blur_artwork(img, size, style):
+    """
+    把海报裁剪成画布比例后缩小、模糊、压暗
+
+    参数:
+        img: 已解码的海报
+        size: 画布尺寸 (宽, 高)
+        style: get_blur_style 的结果
+
+    返回:
+        缩小后的 RGB 图片（尺寸为 get_work_size 的结果）
+    """
+    work_size = get_work_size(size, style)
+    blur_radius = style["blur"] * work_size[0] / size[0]
+
+    # 按画布比例居中裁剪，再按 zoom 放大
+    target_ratio = size[0] / size[1]
+    crop_width = min(img.width, img.height * target_ratio) / style["zoom"]
+    crop_height = crop_width / target_ratio
+    left = (img.width - crop_width) / 2
+    top = (img.height - crop_height) / 2
+    box = (left, top, left + crop_width, top + crop_height)
+
+    # 缩放时直接从裁剪区域采样，不创建全尺寸的中间图片
+    small = img.convert("RGB") if img.mode != "RGB" else img
+    small = small.resize(work_size, Image.LANCZOS, box=box, reducing_gap=2.0)
+    small = small.filter(ImageFilter.GaussianBlur(blur_radius))
+    return small.point(lambda value: int(value * style["dim"]))
+
+
+def make_background_key(item_id, image_tag, work_size, style):
+    """模糊背景的缓存键，缺少 ID 或图片标签时返回 None"""
+    if not item_id or not image_tag:
+        return None
+    return make_cache_key(
+        "background", item_id, image_tag, list(work_size), sorted(style.items())
+    )
+
+
+def get_blurred_artwork(item_id, image_tag, open_image, size, style, store=True):
+    """
+    获取模糊背景（缩小后的结果），优先使用按 (ID, 图片标签, 样式) 缓存的结果
+
+    参数:
+        item_id: 媒体项 ID
+        image_tag: 图片标签
+        open_image: 返回已解码海报的函数，只在缓存未命中时调用
+        size: 画布尺寸 (宽, 高)
+        style: get_blur_style 的结果
+        store: 是否写入缓存（预览时海报是缩小解码的，不写入）
+
+    返回:
+        缩小后的 RGB 图片，失败时返回 None
+    """
+    work_size = get_work_size(size, style)
+    key = make_background_key(item_id, image_tag, work_size, style)
+    path = os.path.join(_cache_dir(), f"{key}.rgb") if key else None
+
+    if path:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) == work_size[0] * work_size[1] * 3:
+                return Image.frombytes("RGB", work_size, data)
+        except OSError:
+            pass
+
+    try:
+        small = blur_artwork(open_image(), size, style)
+    except Exception as e:
+        print(f"生成模糊背景时出错: {e}")
+        return None
+
+    if path and store:
+        try:
+            atomic_write_bytes(path, small.tobytes())
+        except OSError as e:
+            print(f"警告: 保存模糊背景缓存失败: {e}")
+    return small
+
+
+def expand_background(small, size):
+    """把缩小后的模糊背景放大到画布尺寸"""
+    return small.resize(size, Image.BICUBIC).convert("RGBA")
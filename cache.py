@@ -0,0 +1,69 @@
+import os
+import hashlib
+import json
+import tempfile
+
+import config
+
+
+def get_cache_dir(name):
+    """获取缓存子目录，不存在则创建"""
+    cache_dir = os.path.join(config.CACHE_FOLDER, name)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def make_cache_key(*parts):
+    """
+    根据任意参数生成稳定的缓存键
+
+    参数:
+        parts: 参与计算的参数（需可被 JSON 序列化）
+
+    返回:
+        sha1 十六进制字符串
+    """
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def atomic_write_bytes(path, data):
+    """先写入临时文件再替换，避免进程中断时留下半个文件"""
+    directory = os.path.dirname(path) or "."
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_save_image(image, path, **kwargs):
+    """以原子方式保存 PIL 图片，格式根据扩展名推断"""
+    directory = os.path.dirname(path) or "."
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    image_format = kwargs.pop("format", None)
+    if image_format is None:
+        ext = os.path.splitext(path)[1].lower()
+        image_format = {".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP"}.get(
+            ext, "PNG"
+        )
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        # JPEG 不支持透明通道
+        image = image.convert("RGB")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format=image_format, **kwargs)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
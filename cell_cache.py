@@ -0,0 +1,134 @@
+import os
+import threading
+
+from PIL import Image
+
+import config
+from cache import atomic_write_bytes, get_cache_dir, make_cache_key
+
+
+# 每个缓存目录的估计总大小（字节），首次保存时扫描一次，之后按写入累加，
+# 只有超出上限时才重新扫描目录并淘汰
+_CACHE_SIZE = {}
+_CACHE_SIZE_LOCK = threading.Lock()
+
+# 超出上限时淘汰到上限的这一比例，之后要再写入一部分贴图才需要重新扫描
+EVICT_TARGET = 0.9
+
+
+def _cache_dir():
+    """海报单元贴图缓存目录"""
+    return get_cache_dir("cells")
+
+
+def make_cell_key(item_id, image_tag, cell_size, corner_radius, shadow, variant=None):
+    """
+    生成海报单元贴图的缓存键
+
+    参数:
+        item_id: 媒体项 ID
+        image_tag: 图片标签
+        cell_size: 海报尺寸 (宽, 高)
+        corner_radius: 圆角半径
+        shadow: 阴影参数 (偏移, 模糊半径, 颜色)
+        variant: 生成方式（如 numpy），为None时为默认的 Pillow 生成
+
+    返回:
+        缓存键，缺少 ID 或图片标签时返回 None
+    """
+    if not item_id or not image_tag:
+        return None
+    parts = ["cell", item_id, image_tag, list(cell_size), corner_radius, list(shadow)]
+    if variant:
+        parts.append(variant)
+    return make_cache_key(*parts)
+
+
+def load_cell(key, size):
+    """
+    读取缓存的海报单元贴图（原始 RGBA 数据）
+
+    参数:
+        key: 缓存键
+        size: 贴图尺寸 (宽, 高)
+
+    返回:
+        PIL.Image对象，未命中时返回 None
+    """
+    if not key or not config.CELL_CACHE_CONFIG["ENABLED"]:
+        return None
+
+    path = os.path.join(_cache_dir(), f"{key}.rgba")
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    if len(data) != size[0] * size[1] * 4:
+        return None
+
+    # 更新修改时间，作为 LRU 淘汰的依据
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return Image.frombytes("RGBA", size, data)
+
+
+def store_cell(key, sprite):
+    """保存海报单元贴图，超出容量时按最近使用时间淘汰"""
+    if not key or not config.CELL_CACHE_CONFIG["ENABLED"]:
+        return
+
+    path = os.path.join(_cache_dir(), f"{key}.rgba")
+    try:
+        atomic_write_bytes(path, sprite.tobytes())
+    except OSError as e:
+        print(f"警告: 保存海报缓存失败: {e}")
+        return
+
+    max_bytes = config.CELL_CACHE_CONFIG["MAX_SIZE_MB"] * 1024 * 1024
+    cache_dir = _cache_dir()
+    with _CACHE_SIZE_LOCK:
+        total = _CACHE_SIZE.get(cache_dir)
+        if total is not None:
+            total += sprite.width * sprite.height * 4
+            _CACHE_SIZE[cache_dir] = total
+    if total is None or total > max_bytes:
+        evict_cells(max_bytes)
+
+
+def evict_cells(max_bytes):
+    """
+    缓存总大小超过 max_bytes 时淘汰最久未使用的贴图，直到不超过 max_bytes * EVICT_TARGET
+
+    同时记录淘汰后的总大小，供 store_cell 累加
+    """
+    cache_dir = _cache_dir()
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(".rgba"):
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    if total > max_bytes:
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_bytes * EVICT_TARGET:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+
+    with _CACHE_SIZE_LOCK:
+        _CACHE_SIZE[cache_dir] = total
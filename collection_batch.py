@@ -0,0 +1,763 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlencode
+
+from PIL import Image
+
+import config
+import http_client
+from cache import atomic_write_bytes, get_cache_dir, make_cache_key
+from gen_poster import (
+    cell_spec,
+    find_poster_files,
+    gen_poster_workflow,
+    get_cell_sprite,
+    get_format_output_path,
+    load_poster_manifest,
+    plan_format,
+)
+from get_poster import (
+    fetch_images_concurrently,
+    make_manifest_entry,
+    write_poster_manifest,
+)
+from shared_images import (
+    SharedImageStore,
+    attach_image,
+    detach_all,
+    image_nbytes,
+    write_image,
+)
+from seed import get_seed_period
+from update_poster import get_upload_stats, upload_output_images
+
+# 每隔多少个合集打印一次进度
+PROGRESS_INTERVAL = 10
+
+
+def query_items(params):
+    """
+    按查询参数获取当前用户可见的媒体项
+
+    返回:
+        服务器返回的 JSON（包含 Items 和 TotalRecordCount），失败时返回 None
+    """
+    auth_info = config.get_auth_info()
+    params = dict(params)
+    headers = {}
+    if config.get_server_type() == "emby" and auth_info.get("is_api_key", False):
+        params["api_key"] = auth_info["access_token"]
+    else:
+        headers = {
+            "Authorization": f'MediaBrowser Token="{auth_info["access_token"]}"'
+        }
+    url = (
+        f"{auth_info['base_url']}/Users/{auth_info['user_id']}/Items?"
+        f"{urlencode(params)}"
+    )
+    try:
+        response = http_client.get(url, headers=headers, timeout=30)
+        if response.status_code == 200:
+            return response.json()
+        print(f"获取媒体项失败，状态码: {response.status_code}")
+    except Exception as e:
+        print(f"获取媒体项时出错: {e}")
+    return None
+
+
+def list_collections(item_types=None):
+    """
+    分页获取所有合集和播放列表
+
+    参数:
+        item_types: 项目类型列表，为None时使用 COLLECTION_BATCH_CONFIG["ITEM_TYPES"]
+
+    返回:
+        合集列表
+    """
+    if item_types is None:
+        item_types = config.COLLECTION_BATCH_CONFIG["ITEM_TYPES"]
+    page_size = max(1, config.COLLECTION_BATCH_CONFIG["PAGE_SIZE"])
+    collections = []
+    while True:
+        data = query_items(
+            {
+                "IncludeItemTypes": ",".join(item_types),
+                "Recursive": "true",
+                "SortBy": "SortName",
+                "StartIndex": len(collections),
+                "Limit": page_size,
+            }
+        )
+        if data is None:
+            break
+        page = data.get("Items", [])
+        collections.extend(page)
+        total = data.get("TotalRecordCount", len(collections))
+        print(f"已获取 {len(collections)}/{total} 个合集")
+        if not page or len(collections) >= total:
+            break
+    return collections
+
+
+def get_members(collection_id, count):
+    """
+    获取合集中最新的 count 个有封面的成员
+
+    由服务器排序、过滤并限制数量，每个合集只需一次小请求
+    """
+    fields = "DateCreated,DateLastMediaAdded"
+    if config.IMAGE_SOURCE_CONFIG["TYPE"] == "local":
+        fields += ",Path"
+    data = query_items(
+        {
+            "ParentId": collection_id,
+            "Fields": fields,
+            "ImageTypes": "Primary",
+            "SortBy": "DateCreated,SortName",
+            "SortOrder": "Descending",
+            "Limit": count,
+        }
+    )
+    if data is None:
+        return None
+    return [
+        item
+        for item in data.get("Items", [])
+        if "Id" in item and "Primary" in item.get("ImageTags", {})
+    ][:count]
+
+
+def fetch_all_members(collections, count):
+    """
+    并行获取所有合集的成员，实际并发数由 http_client 的自适应限流器控制
+
+    返回:
+        {合集 ID: 成员列表}，获取失败的合集为 None
+    """
+    server = config.get_server_config()
+
+    def fetch(collection):
+        with config.use_server(server):
+            return get_members(collection["Id"], count)
+
+    max_workers = max(1, config.HTTP_LIMIT_CONFIG["MAX_CONCURRENCY"])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        members = list(executor.map(fetch, collections))
+    return {
+        collection["Id"]: items for collection, items in zip(collections, members)
+    }
+
+
+def get_image_store_path(item, max_width=None):
+    """
+    共享海报库中的路径，按 (服务器, ID, 图片标签) 命名，
+    由服务器缩放的海报还按最大宽度区分
+
+    同一部电影出现在多个合集中时只下载一次，图片更新后标签变化，自动重新下载
+    """
+    tag = item.get("ImageTags", {}).get(config.get_server_config()["IMAGE_TYPE"], "")
+    parts = [config.get_server_key(), item["Id"], tag]
+    if max_width:
+        parts.append(max_width)
+    key = make_cache_key(*parts)
+    return os.path.join(get_cache_dir("images"), f"{key}.jpg")
+
+
+def download_shared_images(members_by_collection, max_width=None):
+    """
+    下载所有合集用到的海报，每张不同的海报只下载一次
+
+    参数:
+        members_by_collection: {合集 ID: 成员列表}
+        max_width: 请求服务器缩放后的最大宽度，为None时下载原图
+
+    返回:
+        (新下载的数量, 复用的数量, 下载失败的数量)，复用指共享海报库中已有的海报的引用次数
+    """
+    unique = {}
+    references = {}
+    for members in members_by_collection.values():
+        for item in members or []:
+            path = get_image_store_path(item, max_width)
+            unique.setdefault(path, item)
+            references[path] = references.get(path, 0) + 1
+
+    tasks = []
+    reused = 0
+    for path, item in unique.items():
+        if os.path.exists(path):
+            reused += references[path]
+        else:
+            tasks.append((item, path, len(tasks) + 1, max_width))
+    if tasks:
+        print(f"需要下载 {len(tasks)} 张海报（共 {len(unique)} 张不同的海报）")
+    results = fetch_images_concurrently(tasks)
+    downloaded = sum(1 for success in results if success)
+    return downloaded, reused, len(tasks) - downloaded
+
+
+def get_collection_poster_folder(collection_id):
+    """合集的海报文件夹"""
+    return os.path.join(config.get_poster_folder(), "collections", collection_id)
+
+
+def get_collection_output_path(collection_id):
+    """合集封面的保存路径（第一个输出格式）"""
+    return os.path.join(
+        config.get_output_folder(), "collections", f"{collection_id}.png"
+    )
+
+
+def link_or_copy(source, target):
+    """优先创建硬链接，文件系统不支持时复制"""
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def link_poster_folder(folder, members, count, max_width=None):
+    """
+    把共享海报库中的海报链接到海报文件夹并写入海报清单，
+    成员不足时循环重复已有的海报
+
+    返回:
+        海报数量，没有可用的海报时返回 0
+    """
+    available = [
+        item
+        for item in members
+        if os.path.exists(get_image_store_path(item, max_width))
+    ]
+    if not available:
+        return 0
+
+    os.makedirs(folder, exist_ok=True)
+    for file_name in os.listdir(folder):
+        if file_name.endswith((".jpg", ".jpeg", ".png")):
+            os.remove(os.path.join(folder, file_name))
+
+    manifest = []
+    for index in range(count):
+        item = available[index % len(available)]
+        file_name = f"{index + 1}.jpg"
+        link_or_copy(
+            get_image_store_path(item, max_width), os.path.join(folder, file_name)
+        )
+        manifest.append(make_manifest_entry(item, file_name))
+    write_poster_manifest(folder, manifest)
+    return count
+
+
+def prepare_poster_folder(collection_id, members, count):
+    """准备合集的海报文件夹，返回海报数量"""
+    return link_poster_folder(
+        get_collection_poster_folder(collection_id), members, count
+    )
+
+
+def make_members_key(name, members):
+    """
+    合集的指纹，名称、标题模板、配色周期、成员和海报都未变化时无需重新生成
+
+    参数:
+        name: 合集名称（封面标题）
+        members: 合集成员列表
+    """
+    tag_type = config.get_server_config()["IMAGE_TYPE"]
+    titles = [
+        template
+        for template in config.TEMPLATE_MAPPING
+        if template.get("library_name") == name
+    ]
+    return make_cache_key(
+        name,
+        titles,
+        get_seed_period(),
+        [(item["Id"], item.get("ImageTags", {}).get(tag_type)) for item in members],
+        config.OUTPUT_FORMATS,
+        config.POSTER_GEN_CONFIG,
+    )
+
+
+def _state_path():
+    server_key = config.get_server_key()
+    file_name = f"collections_{server_key}.json" if server_key else "collections.json"
+    return os.path.join(config.CACHE_FOLDER, file_name)
+
+
+def load_state():
+    """读取上次批量生成时记录的合集指纹"""
+    try:
+        with open(_state_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    """保存合集指纹"""
+    data = json.dumps(state, ensure_ascii=False, indent=2).encode("utf-8")
+    try:
+        atomic_write_bytes(_state_path(), data)
+    except OSError as e:
+        print(f"警告: 保存合集记录失败: {e}")
+
+
+def outputs_exist(collection_id):
+    """合集所有输出格式的封面是否都已生成"""
+    base_path = get_collection_output_path(collection_id)
+    return all(
+        os.path.exists(get_format_output_path(base_path, index, output_format))
+        for index, output_format in enumerate(config.OUTPUT_FORMATS)
+    )
+
+
+def init_worker():
+    """生成进程的初始化：批量生成时不保存中间文件"""
+    config.POSTER_GEN_CONFIG["SAVE_COLUMNS"] = False
+
+
+def list_shared_sprites(collection_id, plans):
+    """
+    合集生成时需要的海报单元贴图
+
+    返回:
+        {(媒体项 ID, 图片标签, 贴图参数): (海报路径, 输出格式序号)}，
+        清单中没有 ID 的海报不共享，由生成进程自行处理
+    """
+    folder = get_collection_poster_folder(collection_id)
+    manifest = load_poster_manifest(folder)
+    poster_files = find_poster_files(folder)
+    needed = {}
+    for format_index, plan in enumerate(plans):
+        spec = cell_spec(plan)
+        for column in plan["columns"]:
+            for poster_index, _ in column["visible_cells"]:
+                if poster_index >= len(poster_files):
+                    continue
+                poster_path = poster_files[poster_index]
+                entry = manifest.get(os.path.basename(poster_path), {})
+                if entry.get("Id"):
+                    key = (entry["Id"], entry.get("ImageTag"), spec)
+                    needed.setdefault(key, (poster_path, format_index))
+    return needed
+
+
+def plan_waves(jobs, plans):
+    """
+    按共享内存预算把合集分成若干批，同一批合集用到的贴图同时放在共享内存中
+
+    返回:
+        [([(合集名称, 合集 ID, 贴图键列表), ...], {贴图键: (海报路径, 输出格式序号)}), ...]
+    """
+    budget = config.COLLECTION_BATCH_CONFIG["SHARED_MEMORY_MB"] * 1024 * 1024
+    waves = []
+    wave_jobs, wave_sprites, used = [], {}, 0
+    for name, collection_id in jobs:
+        needed = list_shared_sprites(collection_id, plans)
+        extra = [key for key in needed if key not in wave_sprites]
+        extra_bytes = sum(
+            image_nbytes("RGBA", plans[needed[key][1]]["sprite_size"]) for key in extra
+        )
+        if wave_jobs and used + extra_bytes > budget:
+            waves.append((wave_jobs, wave_sprites))
+            wave_jobs, wave_sprites, used = [], {}, 0
+            extra = list(needed)
+            extra_bytes = sum(
+                image_nbytes("RGBA", plans[needed[key][1]]["sprite_size"])
+                for key in extra
+            )
+        wave_jobs.append((name, collection_id, list(needed)))
+        for key in extra:
+            wave_sprites[key] = needed[key]
+        used += extra_bytes
+    if wave_jobs:
+        waves.append((wave_jobs, wave_sprites))
+    return waves
+
+
+def render_shared_sprite(task):
+    """
+    在生成进程中生成一张海报单元贴图并写入共享内存
+
+    返回:
+        bool: 是否成功（失败时由合集的生成进程自行处理这张海报）
+    """
+    handle, entry, format_index, poster_path = task
+
+    def open_image():
+        image = Image.open(poster_path)
+        image.load()
+        return image
+
+    try:
+        plan = plan_format(config.OUTPUT_FORMATS[format_index])
+        write_image(handle, get_cell_sprite(entry, plan, open_image))
+        return True
+    except Exception as e:
+        print(f"生成共享贴图 {os.path.basename(poster_path)} 时出错: {e}")
+        return False
+
+
+def render_collection(server, name, collection_id, handles=None):
+    """
+    在生成进程中为一个合集生成封面
+
+    handles 中的贴图直接映射共享内存，不复制像素；
+    输出被收集起来，只在失败时返回，避免多个进程的日志交错
+
+    参数:
+        handles: {(媒体项 ID, 图片标签, 贴图参数): 共享内存句柄}
+
+    返回:
+        (合集 ID, 是否成功, 耗时（秒）, 失败时的输出)
+    """
+    handles = handles or {}
+    attached = {}
+
+    def sprite_source(entry, plan):
+        key = (entry.get("Id"), entry.get("ImageTag"), cell_spec(plan))
+        if key not in handles:
+            return None
+        # 下载不足时重复的海报共用同一次映射
+        if key not in attached:
+            attached[key] = attach_image(handles[key])
+        return attached[key]
+
+    started = time.time()
+    log = io.StringIO()
+    try:
+        with config.use_server(server), contextlib.redirect_stdout(log):
+            success = gen_poster_workflow(
+                name,
+                collection_id,
+                output_path=get_collection_output_path(collection_id),
+                poster_folder=get_collection_poster_folder(collection_id),
+                sprite_source=sprite_source,
+            )
+    finally:
+        attached.clear()
+        detach_all()
+    output = "" if success else log.getvalue()
+    return collection_id, success, time.time() - started, output
+
+
+def upload_collection(collection_id):
+    """上传合集所有输出格式的封面（未变化的图片跳过）"""
+    return upload_output_images(
+        collection_id, get_collection_output_path(collection_id)
+    )
+
+
+def process_collection(collection, upload=None):
+    """
+    在当前进程中处理一个合集：获取成员、下载海报、生成并上传封面
+    （供分布式工作队列使用，每个合集是一个独立的任务）
+
+    参数:
+        collection: 合集（包含 Id 和 Name）
+        upload: 是否上传，为None时使用 COLLECTION_BATCH_CONFIG["UPLOAD"]
+
+    返回:
+        dict: 统计增量（rendered/uploaded/failed）
+    """
+    result = {"rendered": 0, "uploaded": 0, "failed": 0}
+    if upload is None:
+        upload = config.COLLECTION_BATCH_CONFIG["UPLOAD"]
+    count = config.POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
+    collection_id = collection["Id"]
+    name = collection.get("Name", collection_id)
+
+    members = get_members(collection_id, count)
+    if members is None:
+        result["failed"] += 1
+        return result
+    if not members:
+        print(f"[{name}]没有可用的海报")
+        return result
+
+    download_shared_images({collection_id: members})
+    if not prepare_poster_folder(collection_id, members, count):
+        result["failed"] += 1
+        return result
+    if not gen_poster_workflow(
+        name,
+        collection_id,
+        output_path=get_collection_output_path(collection_id),
+        poster_folder=get_collection_poster_folder(collection_id),
+    ):
+        result["failed"] += 1
+        return result
+    result["rendered"] += 1
+
+    if upload:
+        if upload_collection(collection_id):
+            result["uploaded"] += 1
+        else:
+            result["failed"] += 1
+    return result
+
+
+def get_worker_count():
+    """生成海报的进程数"""
+    workers = config.COLLECTION_BATCH_CONFIG["WORKERS"]
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+def render_collections(jobs, report):
+    """
+    用进程池为多个合集生成封面，并打印进度和吞吐量
+
+    每批合集用到的海报单元贴图先由进程池生成到共享内存中（每张海报只处理一次），
+    生成各合集封面时直接映射这些贴图，不需要在进程之间序列化和复制像素
+
+    参数:
+        jobs: [(合集名称, 合集 ID), ...]
+        report: 统计信息，更新 rendered/failed/render_seconds
+
+    返回:
+        生成成功的合集 ID 列表
+    """
+    if not jobs:
+        return []
+
+    server = config.get_server_config()
+    workers = min(len(jobs), get_worker_count())
+    print(f"使用 {workers} 个进程生成 {len(jobs)} 个合集的封面")
+
+    plans = [plan_format(output_format) for output_format in config.OUTPUT_FORMATS]
+    waves = plan_waves(jobs, plans)
+    if len(waves) > 1:
+        print(f"按共享内存预算分为 {len(waves)} 批生成")
+
+    started = time.time()
+    rendered = []
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        for wave_jobs, wave_sprites in waves:
+            # 主进程分配并负责删除所有共享内存块，生成进程崩溃时也不会泄漏
+            with SharedImageStore() as store:
+                keys = list(wave_sprites)
+                tasks = []
+                for key in keys:
+                    poster_path, format_index = wave_sprites[key]
+                    handle = store.allocate(
+                        key, "RGBA", plans[format_index]["sprite_size"]
+                    )
+                    entry = {"Id": key[0], "ImageTag": key[1]}
+                    tasks.append((handle, entry, format_index, poster_path))
+
+                try:
+                    results = list(
+                        executor.map(render_shared_sprite, tasks, chunksize=8)
+                    )
+                    handles = {
+                        key: task[0]
+                        for key, task, success in zip(keys, tasks, results)
+                        if success
+                    }
+                    futures = {
+                        executor.submit(
+                            render_collection,
+                            server,
+                            name,
+                            collection_id,
+                            {key: handles[key] for key in job_keys if key in handles},
+                        ): name
+                        for name, collection_id, job_keys in wave_jobs
+                    }
+                except BrokenProcessPool as e:
+                    print(f"生成进程异常退出，停止生成: {e}")
+                    report["failed"] += len(jobs) - done
+                    break
+
+                for future in as_completed(futures):
+                    done += 1
+                    name = futures[future]
+                    try:
+                        collection_id, success, seconds, log = future.result()
+                    except Exception as e:
+                        success, log = False, f"生成进程出错: {e}\n"
+                    if success:
+                        rendered.append(collection_id)
+                        report["render_seconds"] += seconds
+                    else:
+                        report["failed"] += 1
+                        print(f"[{name}]封面生成失败:\n{log}")
+
+                    if done % PROGRESS_INTERVAL == 0 or done == len(jobs):
+                        elapsed = time.time() - started
+                        rate = done / elapsed if elapsed else 0
+                        remaining = (len(jobs) - done) / rate if rate else 0
+                        print(
+                            f"进度 {done}/{len(jobs)}，{rate:.1f} 个/秒，"
+                            f"预计剩余 {remaining:.0f} 秒"
+                        )
+    report["rendered"] = len(rendered)
+    return rendered
+
+
+def run_batch(force=False, upload=None, limit=None):
+    """
+    为当前服务器的所有合集和播放列表批量生成封面
+
+    合集成员通常大量重叠：每张不同的海报只下载一次，海报单元贴图和主色缓存
+    按 (ID, 图片标签) 在所有合集和生成进程之间共用；成员和布局都未变化的合集直接跳过
+
+    参数:
+        force: 为 True 时忽略上次的记录，全部重新生成
+        upload: 是否上传，为None时使用 COLLECTION_BATCH_CONFIG["UPLOAD"]
+        limit: 只处理前 limit 个合集（用于试运行）
+
+    返回:
+        dict: 统计信息
+    """
+    if upload is None:
+        upload = config.COLLECTION_BATCH_CONFIG["UPLOAD"]
+    count = config.POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
+    report = {
+        "collections": 0,
+        "empty": 0,
+        "unchanged": 0,
+        "downloaded": 0,
+        "reused": 0,
+        "download_failed": 0,
+        "rendered": 0,
+        "uploaded": 0,
+        "failed": 0,
+        "render_seconds": 0.0,
+        "seconds": 0.0,
+    }
+    started = time.time()
+
+    collections = list_collections()
+    if limit:
+        collections = collections[:limit]
+    report["collections"] = len(collections)
+    if not collections:
+        print("没有找到合集")
+        report["seconds"] = time.time() - started
+        return report
+
+    print(f"正在获取 {len(collections)} 个合集的成员...")
+    members_by_collection = fetch_all_members(collections, count)
+
+    state = {} if force else load_state()
+    jobs = []
+    keys = {}
+    for collection in collections:
+        collection_id = collection["Id"]
+        members = members_by_collection.get(collection_id)
+        if not members:
+            report["empty"] += 1
+            continue
+        name = collection.get("Name", collection_id)
+        key = make_members_key(name, members)
+        previous = state.get(collection_id, {}).get("key")
+        if previous == key and outputs_exist(collection_id):
+            report["unchanged"] += 1
+            members_by_collection[collection_id] = None
+            continue
+        keys[collection_id] = key
+        jobs.append((name, collection_id))
+
+    (
+        report["downloaded"],
+        report["reused"],
+        report["download_failed"],
+    ) = download_shared_images(members_by_collection)
+
+    ready = []
+    for name, collection_id in jobs:
+        members = members_by_collection[collection_id]
+        if prepare_poster_folder(collection_id, members, count):
+            ready.append((name, collection_id))
+        else:
+            print(f"[{name}]没有可用的海报")
+            report["failed"] += 1
+
+    rendered = render_collections(ready, report)
+
+    names = dict((collection_id, name) for name, collection_id in jobs)
+    for collection_id in rendered:
+        if upload:
+            if upload_collection(collection_id):
+                report["uploaded"] += 1
+            else:
+                print(f"[{names[collection_id]}]封面上传失败")
+                report["failed"] += 1
+                continue
+        state[collection_id] = {
+            "name": names[collection_id],
+            "key": keys[collection_id],
+        }
+    save_state(state)
+
+    report["images"] = get_upload_stats()
+    report["seconds"] = time.time() - started
+    return report
+
+
+def print_report(report):
+    """打印批量生成的统计信息"""
+    print("\n合集批量生成结果:")
+    print(
+        f"  合集 {report['collections']} 个，生成 {report['rendered']} 个，"
+        f"上传 {report['uploaded']} 个，未变化 {report['unchanged']} 个，"
+        f"无海报 {report['empty']} 个，失败 {report['failed']} 个"
+    )
+    print(
+        f"  海报下载 {report['downloaded']} 张，复用 {report['reused']} 张，"
+        f"下载失败 {report['download_failed']} 张"
+    )
+    image_stats = report.get("images")
+    if image_stats and (image_stats["uploaded"] or image_stats["skipped"]):
+        print(
+            f"  图片上传 {image_stats['uploaded']} 张，"
+            f"未变化跳过 {image_stats['skipped']} 张"
+        )
+    if report["rendered"]:
+        print(
+            f"  平均每个合集生成耗时 {report['render_seconds'] / report['rendered']:.2f} 秒，"
+            f"总耗时 {report['seconds']:.1f} 秒，"
+            f"吞吐量 {report['rendered'] / report['seconds']:.1f} 个/秒"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为合集和播放列表批量生成封面")
+    parser.add_argument("--server", default="", help="多服务器时的服务器名称")
+    parser.add_argument(
+        "--force", action="store_true", help="忽略上次的记录，全部重新生成"
+    )
+    parser.add_argument(
+        "--upload", action="store_true", default=None, help="生成后上传为合集封面"
+    )
+    parser.add_argument("--limit", type=int, default=0, help="只处理前 N 个合集")
+    args = parser.parse_args()
+
+    server = config.find_server(args.server)
+    if server is None:
+        raise SystemExit(f"找不到服务器: {args.server}")
+
+    with config.use_server(server):
+        report = run_batch(args.force, args.upload, args.limit)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    # 打包为可执行文件后，子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    main()
@@ -1,5 +1,7 @@
 import os
 import json
+import threading
+from contextlib import contextmanager
 
 # 获取当前脚本所在目录
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -24,30 +26,128 @@ except (FileNotFoundError, json.JSONDecodeError) as e:
 POSTER_FOLDER = os.path.join(CURRENT_DIR, "poster")  # 海报图片文件夹
 TEMPLATE_FOLDER = os.path.join(CURRENT_DIR, "template")  # 模板图片
 OUTPUT_FOLDER = os.path.join(CURRENT_DIR, "output")  # 输出文件夹
+CACHE_FOLDER = os.path.join(CURRENT_DIR, "cache")  # 缓存文件夹（字体标题等）
 
 # 服务器类型配置（jellyfin 或 emby）
 SERVER_TYPE = JSON_CONFIG.get("server_type", "jellyfin")
 
-# 服务器配置
-SERVER_CONFIG = {
-    "BASE_URL": JSON_CONFIG[SERVER_TYPE]["base_url"],  # 从JSON配置获取服务地址
-    "USER_NAME": JSON_CONFIG[SERVER_TYPE]["user_name"],  # 用户名
-    "PASSWORD": JSON_CONFIG[SERVER_TYPE]["password"],  # 密码
-    "AUTHORIZATION": 'MediaBrowser Client="other", Device="client", DeviceId="123", Version="0.0.0"',  # 认证头
-    "ACCESS_TOKEN": "",  # API令牌
-    "USER_ID": "",  # 用户ID
-    "IMAGE_TYPE": "Primary",  # 图片类型
-    "IMAGE_PATH": "poster.png",  # 图片文件名
-    "UPDATE_POSTER": JSON_CONFIG[SERVER_TYPE].get(
-        "update_poster", False
-    ),  # 是否更新海报
-    "API_KEY": JSON_CONFIG[SERVER_TYPE].get("api_key", "") if SERVER_TYPE == "emby" else "",  # Emby API密钥（仅Emby使用）
-}
+
+def make_server_config(server_type, server_json, name=""):
+    """
+    根据JSON中的服务器配置生成服务器配置字典
+
+    参数:
+        server_type: 服务器类型（jellyfin 或 emby）
+        server_json: JSON中的服务器配置
+        name: 服务器名称（多服务器时用于区分输出目录和缓存）
+    """
+    return {
+        "NAME": name,  # 服务器名称
+        "SERVER_TYPE": server_type,  # 服务器类型
+        "BASE_URL": server_json["base_url"],  # 从JSON配置获取服务地址
+        "USER_NAME": server_json["user_name"],  # 用户名
+        "PASSWORD": server_json["password"],  # 密码
+        "AUTHORIZATION": 'MediaBrowser Client="other", Device="client", DeviceId="123", Version="0.0.0"',  # 认证头
+        "ACCESS_TOKEN": "",  # API令牌
+        "USER_ID": "",  # 用户ID
+        "IS_API_KEY": False,  # 是否使用API密钥认证
+        "IMAGE_TYPE": "Primary",  # 图片类型
+        "IMAGE_PATH": "poster.png",  # 图片文件名
+        "UPDATE_POSTER": server_json.get("update_poster", False),  # 是否更新海报
+        "API_KEY": server_json.get("api_key", "") if server_type == "emby" else "",  # Emby API密钥（仅Emby使用）
+    }
+
+
+# 服务器列表：配置了 servers 时同时处理多个服务器，否则使用 server_type 对应的单个服务器
+if JSON_CONFIG.get("servers"):
+    SERVERS = [
+        make_server_config(
+            server.get("server_type", "jellyfin"),
+            server,
+            server.get("name") or f"server{index}",
+        )
+        for index, server in enumerate(JSON_CONFIG["servers"], 1)
+    ]
+else:
+    SERVERS = [make_server_config(SERVER_TYPE, JSON_CONFIG[SERVER_TYPE])]
+
+# 服务器配置（默认服务器）
+SERVER_CONFIG = SERVERS[0]
+SERVER_TYPE = SERVER_CONFIG["SERVER_TYPE"]
 
 # 兼容旧代码，保留JELLYFIN_CONFIG变量名
 JELLYFIN_CONFIG = SERVER_CONFIG
 
+# 当前线程正在处理的服务器
+_ACTIVE_SERVER = threading.local()
+
+
+def find_server(server_name):
+    """
+    按名称查找服务器配置，未指定名称时使用第一个服务器
+
+    返回:
+        服务器配置，找不到时返回 None
+    """
+    if not server_name:
+        return SERVERS[0]
+    for server in SERVERS:
+        if server["NAME"] == server_name:
+            return server
+    return None
+
+
+@contextmanager
+def use_server(server):
+    """在当前线程中切换到指定服务器，期间所有请求、输出目录都使用该服务器"""
+    previous = getattr(_ACTIVE_SERVER, "server", None)
+    _ACTIVE_SERVER.server = server
+    try:
+        yield server
+    finally:
+        _ACTIVE_SERVER.server = previous
+
+
+def get_server_config():
+    """获取当前线程正在处理的服务器配置"""
+    return getattr(_ACTIVE_SERVER, "server", None) or SERVER_CONFIG
+
+
+def get_server_type():
+    """获取当前服务器类型"""
+    return get_server_config()["SERVER_TYPE"]
+
+
+def get_server_key():
+    """当前服务器名称（可用于文件名），单服务器时为空字符串"""
+    name = get_server_config()["NAME"]
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+def _server_subfolder(folder):
+    """多服务器时按服务器名称区分子目录"""
+    server_key = get_server_key()
+    if not server_key:
+        return folder
+    return os.path.join(folder, server_key)
+
+
+def get_poster_folder():
+    """当前服务器的海报文件夹"""
+    return _server_subfolder(POSTER_FOLDER)
+
+
+def get_output_folder():
+    """当前服务器的输出文件夹"""
+    return _server_subfolder(OUTPUT_FOLDER)
+
+
+# 媒体库过滤规则：支持名称通配符（如 "Hot*"）和 "type:类型"（如 "type:playlists"）
+INCLUDE_LIBRARY = JSON_CONFIG.get("include_library", ["*"])  # 需要处理的媒体库列表
 EXCLUDE_LIBRARY = JSON_CONFIG["exclude_Update_library"]  # 排除更新的媒体库列表
+RENDER_EXCLUDED_LIBRARY = JSON_CONFIG.get(
+    "render_excluded_library", False
+)  # 被排除的媒体库是否仍在本地生成海报（不上传）
 
 TEMPLATE_MAPPING = JSON_CONFIG["template_mapping"]
 
@@ -62,8 +162,229 @@ POSTER_GEN_CONFIG = {
     "START_Y": -362,  # 第一列的 y 坐标
     "COLUMN_SPACING": 100,  # 列间距
     "SAVE_COLUMNS": True,  # 是否保存每列图片
+    "COMPOSITOR": "pillow",  # 合成方式: pillow 或 numpy（需要安装 numpy，未安装时使用 pillow）
     "CELL_WIDTH": 410,  # 海报宽度
     "CELL_HEIGHT": 610,  # 海报高度
+    "PALETTE_GRADIENT": False,  # 是否根据海报主色生成渐变背景
+    "SEED_ROTATION": "none",  # 随机配色的轮换周期: none/daily/weekly/monthly
+    "COLUMN_OFFSETS": [[0, 0], [-50, 0], [-40, -155]],  # 每列的额外偏移 [dx, dy]
+    "SHADOW_OFFSET": 20,  # 海报阴影偏移量
+    "SHADOW_BLUR": 20,  # 海报阴影模糊半径
+    "SHADOW_COLOR": [0, 0, 0, 255],  # 海报阴影颜色
+    "BACKGROUND": "gradient",  # 背景样式: gradient（随机渐变）或 blur（模糊的第一张海报）
+    "BACKGROUND_BLUR": 60,  # 模糊背景的模糊半径
+    "BACKGROUND_DIM": 0.55,  # 模糊背景的亮度系数（越小越暗）
+    "BACKGROUND_ZOOM": 1.2,  # 模糊背景的放大倍数
+    # 文字：role 为 title（中文名）或 subtitle（英文名），
+    # 文字长度超过 fit_length 时按比例缩小字号，但不小于 min_size
+    "TEXTS": [
+        {
+            "role": "title",
+            "font": os.path.join("font", "方正风雅宋简体.ttf"),
+            "position": [73.32, 427.34],
+            "size": 163,
+        },
+        {
+            "role": "subtitle",
+            "font": os.path.join("font", "Melete-UltraLight.otf"),
+            "position": [124.68, 624.55],
+            "size": 50,
+            "fit_length": 10,
+            "min_size": 30,
+        },
+    ],
+    # 装饰形状：使用主色绘制，指定 role 时只在对应文字不为空时绘制
+    "ACCENTS": [
+        {
+            "shape": "rect",
+            "role": "subtitle",
+            "position": [84.38, 629.06],
+            "size": [21.51, 55],
+        }
+    ],
+}
+
+# 代码中的默认值，重新加载配置时以此为基础
+DEFAULT_POSTER_GEN_CONFIG = dict(POSTER_GEN_CONFIG)
+
+
+def apply_poster_gen_overrides(json_config):
+    """用 config.json 中的 poster_gen 覆盖海报生成参数（键名不区分大小写）"""
+    POSTER_GEN_CONFIG.clear()
+    POSTER_GEN_CONFIG.update(DEFAULT_POSTER_GEN_CONFIG)
+    for key, value in json_config.get("poster_gen", {}).items():
+        if key.upper() in POSTER_GEN_CONFIG:
+            POSTER_GEN_CONFIG[key.upper()] = value
+        else:
+            print(f"忽略未知的海报生成参数: {key}")
+
+
+apply_poster_gen_overrides(JSON_CONFIG)
+
+
+def reload_layout_config():
+    """
+    重新读取 config.json 中的海报生成参数和模板映射（预览模式修改配置后使用）
+
+    返回:
+        bool: 是否读取成功，失败时保留当前配置
+    """
+    try:
+        with open(CONFIG_JSON_PATH, "r", encoding="utf-8") as f:
+            json_config = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"无法加载配置文件 config.json: {e}")
+        return False
+
+    apply_poster_gen_overrides(json_config)
+    TEMPLATE_MAPPING[:] = json_config.get("template_mapping", TEMPLATE_MAPPING)
+    return True
+
+
+# 输出格式：每个格式生成一张图片并上传为对应的图片类型，layout 可覆盖 POSTER_GEN_CONFIG 中的布局参数
+# 第一个格式保存为 output/<媒体库>.png，其余保存为 output/<媒体库>_<图片类型>.png
+OUTPUT_FORMATS = [
+    {
+        "IMAGE_TYPE": output_format.get("image_type", "Primary"),  # 上传的图片类型
+        "WIDTH": output_format.get("width", 1920),  # 画布宽度
+        "HEIGHT": output_format.get("height", 1080),  # 画布高度
+        "LAYOUT": {
+            key.upper(): value
+            for key, value in output_format.get("layout", {}).items()
+        },  # 该格式的布局参数
+    }
+    for output_format in JSON_CONFIG.get("output_formats", [{"image_type": "Primary"}])
+]
+
+# 海报墙配置：匹配的媒体库改为生成由大量小海报铺满画面的海报墙
+POSTER_WALL_CONFIG = {
+    "LIBRARIES": JSON_CONFIG.get("poster_wall", {}).get(
+        "libraries", []
+    ),  # 使用海报墙的媒体库规则（名称通配符或 "type:类型"）
+    "ROWS": JSON_CONFIG.get("poster_wall", {}).get("rows", 10),  # 行数
+    "COLS": JSON_CONFIG.get("poster_wall", {}).get("cols", 20),  # 列数
+    "CELL_WIDTH": JSON_CONFIG.get("poster_wall", {}).get(
+        "cell_width", 150
+    ),  # 海报宽度（按 1920x1080 设计）
+    "CELL_HEIGHT": JSON_CONFIG.get("poster_wall", {}).get(
+        "cell_height", 225
+    ),  # 海报高度
+    "GAP": JSON_CONFIG.get("poster_wall", {}).get("gap", 16),  # 海报间距
+    "CORNER_RADIUS": JSON_CONFIG.get("poster_wall", {}).get(
+        "corner_radius", 12
+    ),  # 圆角半径
+    "ROTATION_ANGLE": JSON_CONFIG.get("poster_wall", {}).get(
+        "rotation_angle", -15.8
+    ),  # 整面海报墙的旋转角度
+    "SHADOW_OFFSET": JSON_CONFIG.get("poster_wall", {}).get(
+        "shadow_offset", 6
+    ),  # 阴影偏移量
+    "SHADOW_BLUR": JSON_CONFIG.get("poster_wall", {}).get(
+        "shadow_blur", 6
+    ),  # 阴影模糊半径
+    "FADE_WIDTH": JSON_CONFIG.get("poster_wall", {}).get(
+        "fade_width", 0.45
+    ),  # 左侧露出背景的宽度（占画布宽度的比例），保证标题清晰
+    "THUMBNAIL_WIDTH": JSON_CONFIG.get("poster_wall", {}).get(
+        "thumbnail_width", 300
+    ),  # 请求服务器缩放后的海报宽度
+    "THUMBNAIL_QUALITY": JSON_CONFIG.get("poster_wall", {}).get(
+        "thumbnail_quality", 85
+    ),  # 请求服务器缩放后的 JPEG 质量
+}
+
+# 动态海报配置：匹配的媒体库额外生成各列缓慢滚动的动态海报（仅本地保存）
+ANIMATION_CONFIG = {
+    "LIBRARIES": JSON_CONFIG.get("animation", {}).get(
+        "libraries", []
+    ),  # 生成动态海报的媒体库规则（名称通配符或 "type:类型"）
+    "FORMAT": JSON_CONFIG.get("animation", {}).get("format", "webp"),  # webp 或 apng
+    "FRAMES": JSON_CONFIG.get("animation", {}).get(
+        "frames", 48
+    ),  # 一次循环的帧数（每列滚动一整轮）
+    "DURATION_MS": JSON_CONFIG.get("animation", {}).get(
+        "duration_ms", 80
+    ),  # 每帧显示时间（毫秒）
+    "SCALE": JSON_CONFIG.get("animation", {}).get(
+        "scale", 0.5
+    ),  # 相对第一个输出格式的缩放比例
+    "QUALITY": JSON_CONFIG.get("animation", {}).get("quality", 80),  # WebP 质量
+    "MAX_FRAMES": JSON_CONFIG.get("animation", {}).get(
+        "max_frames", 120
+    ),  # 帧数上限
+    "MAX_SIZE_KB": JSON_CONFIG.get("animation", {}).get(
+        "max_size_kb", 4096
+    ),  # 文件大小上限（KB），超出时依次降低质量和帧数
+}
+
+# 合集批量生成配置（collection_batch.py）：为合集和播放列表批量生成封面
+COLLECTION_BATCH_CONFIG = {
+    "ITEM_TYPES": JSON_CONFIG.get("collections", {}).get(
+        "item_types", ["BoxSet", "Playlist"]
+    ),  # 要处理的项目类型
+    "PAGE_SIZE": JSON_CONFIG.get("collections", {}).get(
+        "page_size", 200
+    ),  # 分页获取合集列表时每页的数量
+    "WORKERS": JSON_CONFIG.get("collections", {}).get(
+        "workers", 0
+    ),  # 生成海报的进程数，0 表示按 CPU 核心数
+    "UPLOAD": JSON_CONFIG.get("collections", {}).get(
+        "upload", False
+    ),  # 生成后是否上传为合集封面
+    "SHARED_MEMORY_MB": JSON_CONFIG.get("collections", {}).get(
+        "shared_memory_mb", 512
+    ),  # 每批合集共用的贴图在共享内存中的最大占用（MB）
+}
+
+# 分布式工作队列配置（work_queue.py）：多个工作进程（可在不同主机上）共同完成一次运行
+WORK_QUEUE_CONFIG = {
+    "PATH": JSON_CONFIG.get("work_queue", {}).get(
+        "path", os.path.join(CACHE_FOLDER, "queue.db")
+    ),  # 队列数据库路径，多台主机时放在共享卷上
+    "LEASE_SECONDS": JSON_CONFIG.get("work_queue", {}).get(
+        "lease_seconds", 300
+    ),  # 任务租约时长（秒），工作进程停止续约后任务重新分配
+    "HEARTBEAT_SECONDS": JSON_CONFIG.get("work_queue", {}).get(
+        "heartbeat_seconds", 60
+    ),  # 续约间隔（秒）
+    "MAX_ATTEMPTS": JSON_CONFIG.get("work_queue", {}).get(
+        "max_attempts", 3
+    ),  # 每个任务最多尝试的次数
+    "POLL_SECONDS": JSON_CONFIG.get("work_queue", {}).get(
+        "poll_seconds", 5
+    ),  # 没有可领取的任务时等待的间隔（秒）
+    "RETRY_DELAY_SECONDS": JSON_CONFIG.get("work_queue", {}).get(
+        "retry_delay_seconds", 30
+    ),  # 任务失败后第一次重试前的等待时间（秒），之后每次翻倍
+    "MAX_RETRY_DELAY_SECONDS": JSON_CONFIG.get("work_queue", {}).get(
+        "max_retry_delay_seconds", 600
+    ),  # 重试等待时间的上限（秒）
+}
+
+# 海报生成服务配置（render_service.py）：其他工具通过 HTTP 请求媒体库或合集的封面
+RENDER_SERVICE_CONFIG = {
+    "HOST": JSON_CONFIG.get("render_service", {}).get(
+        "host", "127.0.0.1"
+    ),  # 监听地址
+    "PORT": JSON_CONFIG.get("render_service", {}).get("port", 8765),  # 监听端口
+    "WORKERS": JSON_CONFIG.get("render_service", {}).get(
+        "workers", 2
+    ),  # 同时生成的数量
+    "MAX_PENDING": JSON_CONFIG.get("render_service", {}).get(
+        "max_pending", 16
+    ),  # 正在生成和排队的请求上限，超出时返回 503
+    "MAX_WIDTH": JSON_CONFIG.get("render_service", {}).get(
+        "max_width", 3840
+    ),  # 允许请求的最大宽度
+    "MAX_HEIGHT": JSON_CONFIG.get("render_service", {}).get(
+        "max_height", 2160
+    ),  # 允许请求的最大高度
+    "CACHE_MB": JSON_CONFIG.get("render_service", {}).get(
+        "cache_mb", 256
+    ),  # 生成结果缓存的最大占用空间（MB）
+    "LIBRARY_TTL": JSON_CONFIG.get("render_service", {}).get(
+        "library_ttl", 300
+    ),  # 媒体库列表的缓存时间（秒）
 }
 
 # 海报下载配置
@@ -72,23 +393,86 @@ POSTER_DOWNLOAD_CONFIG = {
     "POSTER_DIR": POSTER_FOLDER,  # 海报保存目录
 }
 
+# 海报单元贴图缓存配置（缩放+圆角+阴影后的结果）
+CELL_CACHE_CONFIG = {
+    "ENABLED": True,  # 是否启用缓存
+    "MAX_SIZE_MB": 512,  # 缓存最大占用空间，超出后淘汰最久未使用的贴图
+}
+
+# 本地媒体索引配置（SQLite），首次全量同步后按 DateLastSaved 增量同步
+LIBRARY_INDEX_CONFIG = {
+    "ENABLED": JSON_CONFIG.get("library_index", {}).get("enabled", True),  # 是否启用
+    "PATH": os.path.join(CACHE_FOLDER, "library.db"),  # 数据库文件路径（多服务器时按服务器名称区分）
+    "FULL_SYNC_HOURS": JSON_CONFIG.get("library_index", {}).get(
+        "full_sync_hours", 24
+    ),  # 全量同步间隔（小时），用于清除已删除的媒体项
+}
+
+# 请求限流配置：根据延迟和错误率自动调整并发数（AIMD），避免影响服务器上正在进行的播放
+HTTP_LIMIT_CONFIG = {
+    "MIN_CONCURRENCY": JSON_CONFIG.get("http_limit", {}).get(
+        "min_concurrency", 1
+    ),  # 最小并发请求数
+    "MAX_CONCURRENCY": JSON_CONFIG.get("http_limit", {}).get(
+        "max_concurrency", 8
+    ),  # 最大并发请求数
+    "INITIAL_CONCURRENCY": JSON_CONFIG.get("http_limit", {}).get(
+        "initial_concurrency", 4
+    ),  # 初始并发请求数
+    "TARGET_LATENCY_MS": JSON_CONFIG.get("http_limit", {}).get(
+        "target_latency_ms", 1500
+    ),  # 目标延迟（毫秒），超过两倍视为服务器繁忙
+    "MAX_BYTES_PER_SECOND": JSON_CONFIG.get("http_limit", {}).get(
+        "max_bytes_per_second", 0
+    ),  # 传输速率上限（字节/秒），0 表示不限制
+}
+
+# 海报生成的内存预算：按估算的内存峰值决定同时生成几个媒体库的海报
+RENDER_MEMORY_CONFIG = {
+    "BUDGET_MB": JSON_CONFIG.get("render_memory", {}).get(
+        "budget_mb", 768
+    ),  # 所有同时进行的生成任务可占用的内存（MB）
+    "MAX_JOBS": JSON_CONFIG.get("render_memory", {}).get(
+        "max_jobs", 2
+    ),  # 每个服务器同时处理的媒体库数量上限
+}
+
+# 海报图片来源配置：http 通过服务器 API 下载；local 直接读取本地媒体文件夹中的海报
+IMAGE_SOURCE_CONFIG = {
+    "TYPE": JSON_CONFIG.get("image_source", {}).get("type", "http"),  # http 或 local
+    "PATH_REWRITES": JSON_CONFIG.get("image_source", {}).get(
+        "path_rewrites", []
+    ),  # 路径前缀替换规则 [{"from": 服务器路径前缀, "to": 本机路径前缀}]
+    "METADATA_DIR": JSON_CONFIG.get("image_source", {}).get(
+        "metadata_dir", ""
+    ),  # 服务器元数据目录（如 /var/lib/jellyfin/metadata）
+}
+
+POSTER_MANIFEST = "items.json"  # 海报清单文件名（记录海报对应的媒体项ID和图片标签）
+
 
 # 初始化认证信息
-def init_auth():
-    """初始化认证信息并更新JELLYFIN_CONFIG"""
+def init_auth(server=None):
+    """初始化认证信息并更新服务器配置（默认为当前服务器）"""
     from auth import authenticate
 
+    if server is None:
+        server = get_server_config()
+
     # 进行认证
     auth_info = authenticate(
-        JELLYFIN_CONFIG["BASE_URL"],
-        JELLYFIN_CONFIG["USER_NAME"],
-        JELLYFIN_CONFIG["PASSWORD"],
+        server["BASE_URL"],
+        server["USER_NAME"],
+        server["PASSWORD"],
+        server["API_KEY"],
+        server["SERVER_TYPE"],
     )
 
     if auth_info:
-        # 更新JELLYFIN_CONFIG
-        JELLYFIN_CONFIG["ACCESS_TOKEN"] = auth_info.get("access_token", "")
-        JELLYFIN_CONFIG["USER_ID"] = auth_info.get("user_id", "")
+        # 更新服务器配置
+        server["ACCESS_TOKEN"] = auth_info.get("access_token", "")
+        server["USER_ID"] = auth_info.get("user_id", "")
+        server["IS_API_KEY"] = auth_info.get("is_api_key", False)
         return True
     else:
         print("认证失败，无法获取认证信息")
@@ -97,16 +481,19 @@ def init_auth():
 
 # 获取认证信息
 def get_auth_info():
-    """获取认证信息，如果尚未认证则进行认证"""
+    """获取当前服务器的认证信息，如果尚未认证则进行认证"""
+    server = get_server_config()
+
     # 如果尚未进行认证，先初始化认证
-    if not JELLYFIN_CONFIG["ACCESS_TOKEN"] or not JELLYFIN_CONFIG["USER_ID"]:
-        init_auth()
+    if not server["ACCESS_TOKEN"] or not server["USER_ID"]:
+        init_auth(server)
 
     # 返回认证相关信息
     return {
-        "user_id": JELLYFIN_CONFIG["USER_ID"],
-        "access_token": JELLYFIN_CONFIG["ACCESS_TOKEN"],
-        "base_url": JELLYFIN_CONFIG["BASE_URL"],
+        "user_id": server["USER_ID"],
+        "access_token": server["ACCESS_TOKEN"],
+        "base_url": server["BASE_URL"],
+        "is_api_key": server["IS_API_KEY"],
     }
 
 
@@ -116,8 +503,10 @@ def refresh_auth():
     return init_auth()
 
 
-# 模块加载时尝试进行认证
-try:
-    init_auth()
-except Exception as e:
-    print(f"初始化认证时出错: {e}")
+# 模块加载时尝试进行认证（多服务器时在处理各服务器时再认证），
+# 设置环境变量 POSTER_SKIP_AUTH 时跳过（离线运行的回归检查等），需要时再由 get_auth_info 认证
+if len(SERVERS) == 1 and not os.environ.get("POSTER_SKIP_AUTH"):
+    try:
+        init_auth()
+    except Exception as e:
+        print(f"初始化认证时出错: {e}")
@@ -0,0 +1,174 @@
+import io
+import math
+import os
+import threading
+
+from PIL import Image, ImageDraw, ImageFont, PngImagePlugin
+
+from cache import atomic_save_image, get_cache_dir, make_cache_key
+
+# 字体文件内容缓存：每个字体文件在进程内只读取一次
+_FONT_DATA = {}
+
+# 字体对象缓存：每个 (字体, 字号) 只解析一次
+_FONT_REGISTRY = {}
+
+# 标题贴图的内存缓存，避免同一进程内重复读取磁盘
+_SPRITE_MEMORY = {}
+
+# 多线程共用字体对象，加载和光栅化时加锁
+_FONT_LOCK = threading.RLock()
+
+
+def get_font(font_path, font_size):
+    """
+    从字体注册表获取字体对象，同一字体文件只从磁盘读取一次
+
+    参数:
+        font_path: 字体文件路径
+        font_size: 字体大小
+
+    返回:
+        ImageFont.FreeTypeFont 对象
+    """
+    font_size = int(font_size)
+    abs_path = os.path.abspath(font_path)
+    # 字体文件被替换后重新读取
+    file_key = (abs_path, str(get_font_signature(abs_path)))
+    key = (file_key, font_size)
+
+    with _FONT_LOCK:
+        font = _FONT_REGISTRY.get(key)
+        if font is None:
+            data = _FONT_DATA.get(file_key)
+            if data is None:
+                with open(abs_path, "rb") as f:
+                    data = f.read()
+                _FONT_DATA[file_key] = data
+            font = ImageFont.truetype(io.BytesIO(data), font_size)
+            _FONT_REGISTRY[key] = font
+
+    return font
+
+
+def render_title_sprite(text, font_path, font_size, fill_color, fraction=(0, 0)):
+    """
+    把一行文字光栅化为透明背景的 RGBA 贴图
+
+    参数:
+        text: 文字内容
+        font_path: 字体文件路径
+        font_size: 字体大小
+        fill_color: 文字颜色，RGBA格式
+        fraction: 绘制位置的小数部分（math.modf 的结果），保证与直接绘制时的亚像素位置一致
+
+    返回:
+        (贴图, 贴图左上角相对绘制位置整数部分的偏移)
+    """
+    font = get_font(font_path, font_size)
+    with _FONT_LOCK:
+        left, top, right, bottom = font.getbbox(text)
+
+        # 绘制位置的整数部分为 pad，小数部分与直接绘制时相同（ImageDraw 按 int/modf 拆分），
+        # pad 保证字形的每一行、每一列都落在遮罩内
+        pad_x = max(0, -left) + 1
+        pad_y = max(0, -top) + 1
+        width = max(pad_x + right + 2, 1)
+        height = max(pad_y + bottom + 2, 1)
+
+        # 先画灰度遮罩，再用遮罩作为纯色层的透明度
+        mask = Image.new("L", (width, height), 0)
+        draw = ImageDraw.Draw(mask)
+        draw.text(
+            (pad_x + fraction[0], pad_y + fraction[1]), text, font=font, fill=255
+        )
+
+    # 只保留有笔画的区域
+    box = mask.getbbox() or (0, 0, 1, 1)
+    mask = mask.crop(box)
+
+    alpha = fill_color[3] if len(fill_color) > 3 else 255
+    if alpha < 255:
+        mask = mask.point(lambda v: v * alpha // 255)
+
+    sprite = Image.new("RGBA", mask.size, tuple(fill_color[:3]) + (0,))
+    sprite.putalpha(mask)
+
+    return sprite, (box[0] - pad_x, box[1] - pad_y)
+
+
+def get_font_signature(font_path):
+    """字体文件的大小和修改时间，同名字体文件被替换后缓存键随之变化"""
+    try:
+        stat = os.stat(font_path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def split_position(position):
+    """
+    按 ImageDraw.text 的方式把绘制位置拆分为整数部分和小数部分
+
+    位置为负数时小数部分也为负，无法在遮罩内以相同的方式绘制，
+    此时改为向下取整（亚像素位置仍然相同）
+    """
+    base = []
+    fraction = []
+    for value in position:
+        if value < 0:
+            base.append(math.floor(value))
+            fraction.append(value - math.floor(value))
+        else:
+            part, whole = math.modf(value)
+            base.append(int(whole))
+            fraction.append(part)
+    return tuple(base), tuple(fraction)
+
+
+def get_title_sprite(text, position, font_path, font_size, fill_color):
+    """
+    获取标题贴图，优先使用磁盘缓存
+    缓存键为 (文字, 字体及其大小和修改时间, 字号, 颜色, 亚像素位置)，媒体库名称很少变化，
+    因此通常只需直接贴图，无需加载字体和光栅化
+
+    返回:
+        (贴图, 贴图在目标图像上的左上角坐标)
+    """
+    (base_x, base_y), fraction = split_position(position)
+
+    key = make_cache_key(
+        "title",
+        text,
+        os.path.basename(font_path),
+        get_font_signature(font_path),
+        int(font_size),
+        list(fill_color),
+        list(fraction),
+    )
+
+    cached = _SPRITE_MEMORY.get(key)
+    if cached is None:
+        sprite_path = os.path.join(get_cache_dir("titles"), f"{key}.png")
+        try:
+            with Image.open(sprite_path) as img:
+                img.load()
+                offset = (int(img.info["offset_x"]), int(img.info["offset_y"]))
+                cached = (img.convert("RGBA"), offset)
+        except (FileNotFoundError, KeyError, OSError, ValueError):
+            sprite, offset = render_title_sprite(
+                text, font_path, font_size, fill_color, fraction
+            )
+            # 偏移量写入 PNG 文本块，命中缓存时无需再加载字体
+            png_info = PngImagePlugin.PngInfo()
+            png_info.add_text("offset_x", str(offset[0]))
+            png_info.add_text("offset_y", str(offset[1]))
+            try:
+                atomic_save_image(sprite, sprite_path, pnginfo=png_info)
+            except OSError as e:
+                print(f"警告: 保存标题缓存失败: {e}")
+            cached = (sprite, offset)
+        _SPRITE_MEMORY[key] = cached
+
+    sprite, offset = cached
+    return sprite, (base_x + offset[0], base_y + offset[1])
@@ -1,8 +1,36 @@
-from PIL import Image, ImageFilter, ImageDraw, ImageFont
+from PIL import Image, ImageFilter, ImageDraw
 import os
-import math
+import json
 import config
 import random  # 添加随机模块
+from seed import make_render_seed
+from font_cache import get_title_sprite
+from layout import SHADOW_BLUR, SHADOW_OFFSET, compile_layout
+from cell_cache import load_cell, make_cell_key, store_cell
+from palette import get_cached_palette, get_palette, gradient_colors_from_palette
+from palette import extract_palette, pick_accent_color
+from cache import atomic_save_image
+from background import expand_background, get_blur_style, get_blurred_artwork
+import array_compositor
+
+# 海报单元阴影参数: (偏移量, 模糊半径, 颜色)
+CELL_SHADOW = (SHADOW_OFFSET, SHADOW_BLUR, (0, 0, 0, 255))
+
+# 是否已提示过 numpy 未安装
+_NUMPY_WARNED = False
+
+
+def use_array_compositor():
+    """是否使用 numpy 数组合成海报单元和列（COMPOSITOR 为 numpy 且已安装 numpy）"""
+    global _NUMPY_WARNED
+    if config.POSTER_GEN_CONFIG.get("COMPOSITOR", "pillow") != "numpy":
+        return False
+    if not array_compositor.is_available():
+        if not _NUMPY_WARNED:
+            print("警告: 未安装 numpy，使用 Pillow 合成海报")
+            _NUMPY_WARNED = True
+        return False
+    return True
 
 
 def add_shadow(img, offset=(5, 5), shadow_color=(0, 0, 0, 100), blur_radius=3):
@@ -62,61 +90,22 @@ def draw_text_on_image(
     返回:
         添加了文字的图像
     """
-    # 创建一个可绘制的图像副本
+    # 创建图像副本
     img_copy = image.copy()
-    draw = ImageDraw.Draw(img_copy)
 
-    # 加载字体
-    font = ImageFont.truetype(font_path, int(font_size))
+    # 从缓存获取标题贴图（字体只加载一次，渲染结果缓存在磁盘）
+    sprite, dest = get_title_sprite(
+        text, position, font_path, font_size, fill_color
+    )
 
-    # 绘制文字
-    draw.text(position, text, font=font, fill=fill_color)
+    # 将贴图合成到图像上
+    if img_copy.mode != "RGBA":
+        img_copy = img_copy.convert("RGBA")
+    img_copy.alpha_composite(sprite, dest)
 
     return img_copy
 
 
-def get_random_color(image_path):
-    """
-    获取图片随机位置的颜色
-
-    参数:
-        image_path: 图片文件路径
-
-    返回:
-        随机点颜色，RGBA格式
-    """
-    try:
-        img = Image.open(image_path)
-        # 获取图片尺寸
-        width, height = img.size
-
-        # 在图片范围内随机选择一个点
-        # 避免边缘区域，缩小范围到图片的20%-80%区域
-        random_x = random.randint(int(width * 0.5), int(width * 0.8))
-        random_y = random.randint(int(height * 0.5), int(height * 0.8))
-
-        # 获取随机点的颜色
-        if img.mode == "RGBA":
-            r, g, b, a = img.getpixel((random_x, random_y))
-            return (r, g, b, a)
-        elif img.mode == "RGB":
-            r, g, b = img.getpixel((random_x, random_y))
-            return (r + 100, g + 50, b, 255)
-        else:
-            img = img.convert("RGBA")
-            r, g, b, a = img.getpixel((random_x, random_y))
-            return (r, g, b, a)
-    except Exception as e:
-        print(f"获取图片颜色时出错: {e}")
-        # 返回随机颜色作为备选
-        return (
-            random.randint(50, 200),
-            random.randint(50, 200),
-            random.randint(50, 200),
-            255,
-        )
-
-
 def draw_color_block(image, position, size, color):
     """
     在图像上绘制色块
@@ -142,338 +131,359 @@ def draw_color_block(image, position, size, color):
     return img_copy
 
 
-def create_gradient_background(width, height, color1=None, color2=None):
+def pick_gradient_colors(color1=None, color2=None, rng=None):
     """
-    创建一个从左到右、由深到浅的渐变背景
+    为渐变背景随机选择一组深浅颜色
     增加多种色系选择，大幅提高颜色组合数量
 
     参数:
-        width: 背景宽度
-        height: 背景高度
         color1: 左侧颜色(深色)，如果为None则随机生成
         color2: 右侧颜色(浅色)，如果为None则随机生成
+        rng: 随机数生成器（random.Random），为None时使用全局random模块
 
     返回:
-        渐变背景图像
+        (color1, color2)
     """
+    if rng is None:
+        rng = random
+
     # 如果没有指定颜色，随机生成一组深浅颜色
     if color1 is None:
         # 选择色系类型 (0-25 共26种不同颜色)
-        color_type = random.randint(0, 25)
+        color_type = rng.randint(0, 25)
 
         # 基础颜色组 (6种原有颜色)
         if color_type == 0:  # 偏红色
             color1 = (
-                random.randint(80, 150),  # R - 较高
-                random.randint(20, 70),  # G - 较低
-                random.randint(20, 70),  # B - 较低
+                rng.randint(80, 150),  # R - 较高
+                rng.randint(20, 70),  # G - 较低
+                rng.randint(20, 70),  # B - 较低
             )
         elif color_type == 1:  # 偏橙色
             color1 = (
-                random.randint(80, 150),  # R - 较高
-                random.randint(50, 100),  # G - 中等
-                random.randint(20, 50),  # B - 较低
+                rng.randint(80, 150),  # R - 较高
+                rng.randint(50, 100),  # G - 中等
+                rng.randint(20, 50),  # B - 较低
             )
         elif color_type == 2:  # 偏黄色
             color1 = (
-                random.randint(80, 150),  # R - 较高
-                random.randint(70, 140),  # G - 较高
-                random.randint(20, 50),  # B - 较低
+                rng.randint(80, 150),  # R - 较高
+                rng.randint(70, 140),  # G - 较高
+                rng.randint(20, 50),  # B - 较低
             )
         elif color_type == 3:  # 偏绿色
             color1 = (
-                random.randint(20, 70),  # R - 较低
-                random.randint(80, 150),  # G - 较高
-                random.randint(40, 90),  # B - 中等
+                rng.randint(20, 70),  # R - 较低
+                rng.randint(80, 150),  # G - 较高
+                rng.randint(40, 90),  # B - 中等
             )
         elif color_type == 4:  # 偏蓝色
             color1 = (
-                random.randint(20, 70),  # R - 较低
-                random.randint(50, 100),  # G - 中等
-                random.randint(80, 150),  # B - 较高
+                rng.randint(20, 70),  # R - 较低
+                rng.randint(50, 100),  # G - 中等
+                rng.randint(80, 150),  # B - 较高
             )
         elif color_type == 5:  # 偏紫色
             color1 = (
-                random.randint(60, 120),  # R - 中等
-                random.randint(20, 80),  # G - 较低
-                random.randint(80, 150),  # B - 较高
+                rng.randint(60, 120),  # R - 中等
+                rng.randint(20, 80),  # G - 较低
+                rng.randint(80, 150),  # B - 较高
             )
 
         # 新增颜色组 (20种新颜色)
         elif color_type == 6:  # 深红色
             color1 = (
-                random.randint(60, 100),  # R - 中等偏暗
-                random.randint(10, 30),  # G - 很低
-                random.randint(10, 30),  # B - 很低
+                rng.randint(60, 100),  # R - 中等偏暗
+                rng.randint(10, 30),  # G - 很低
+                rng.randint(10, 30),  # B - 很低
             )
         elif color_type == 7:  # 酒红色
             color1 = (
-                random.randint(70, 120),  # R - 中等
-                random.randint(10, 40),  # G - 很低
-                random.randint(30, 70),  # B - 较低
+                rng.randint(70, 120),  # R - 中等
+                rng.randint(10, 40),  # G - 很低
+                rng.randint(30, 70),  # B - 较低
             )
         elif color_type == 8:  # 棕红色
             color1 = (
-                random.randint(70, 120),  # R - 中等
-                random.randint(30, 70),  # G - 较低
-                random.randint(10, 40),  # B - 很低
+                rng.randint(70, 120),  # R - 中等
+                rng.randint(30, 70),  # G - 较低
+                rng.randint(10, 40),  # B - 很低
             )
         elif color_type == 9:  # 深橙色
             color1 = (
-                random.randint(70, 130),  # R - 中等
-                random.randint(40, 80),  # G - 较低
-                random.randint(0, 30),  # B - 很低
+                rng.randint(70, 130),  # R - 中等
+                rng.randint(40, 80),  # G - 较低
+                rng.randint(0, 30),  # B - 很低
             )
         elif color_type == 10:  # 深黄色
             color1 = (
-                random.randint(70, 130),  # R - 中等
-                random.randint(60, 110),  # G - 中等
-                random.randint(0, 30),  # B - 很低
+                rng.randint(70, 130),  # R - 中等
+                rng.randint(60, 110),  # G - 中等
+                rng.randint(0, 30),  # B - 很低
             )
         elif color_type == 11:  # 橄榄绿
             color1 = (
-                random.randint(50, 100),  # R - 较低
-                random.randint(60, 110),  # G - 中等
-                random.randint(0, 40),  # B - 很低
+                rng.randint(50, 100),  # R - 较低
+                rng.randint(60, 110),  # G - 中等
+                rng.randint(0, 40),  # B - 很低
             )
         elif color_type == 12:  # 深绿色
             color1 = (
-                random.randint(0, 50),  # R - 很低
-                random.randint(60, 110),  # G - 中等
-                random.randint(0, 50),  # B - 很低
+                rng.randint(0, 50),  # R - 很低
+                rng.randint(60, 110),  # G - 中等
+                rng.randint(0, 50),  # B - 很低
             )
         elif color_type == 13:  # 森林绿
             color1 = (
-                random.randint(20, 60),  # R - 很低
-                random.randint(50, 100),  # G - 中等
-                random.randint(30, 80),  # B - 较低
+                rng.randint(20, 60),  # R - 很低
+                rng.randint(50, 100),  # G - 中等
+                rng.randint(30, 80),  # B - 较低
             )
         elif color_type == 14:  # 青绿色
             color1 = (
-                random.randint(0, 50),  # R - 很低
-                random.randint(60, 110),  # G - 中等
-                random.randint(60, 110),  # B - 中等
+                rng.randint(0, 50),  # R - 很低
+                rng.randint(60, 110),  # G - 中等
+                rng.randint(60, 110),  # B - 中等
             )
         elif color_type == 15:  # 湖蓝色
             color1 = (
-                random.randint(0, 50),  # R - 很低
-                random.randint(50, 100),  # G - 中等
-                random.randint(70, 120),  # B - 中等
+                rng.randint(0, 50),  # R - 很低
+                rng.randint(50, 100),  # G - 中等
+                rng.randint(70, 120),  # B - 中等
             )
         elif color_type == 16:  # 深蓝色
             color1 = (
-                random.randint(0, 40),  # R - 很低
-                random.randint(0, 50),  # G - 很低
-                random.randint(70, 120),  # B - 中等
+                rng.randint(0, 40),  # R - 很低
+                rng.randint(0, 50),  # G - 很低
+                rng.randint(70, 120),  # B - 中等
             )
         elif color_type == 17:  # 靛蓝色
             color1 = (
-                random.randint(20, 60),  # R - 很低
-                random.randint(0, 40),  # G - 很低
-                random.randint(70, 130),  # B - 中等
+                rng.randint(20, 60),  # R - 很低
+                rng.randint(0, 40),  # G - 很低
+                rng.randint(70, 130),  # B - 中等
             )
         elif color_type == 18:  # 深紫色
             color1 = (
-                random.randint(40, 90),  # R - 较低
-                random.randint(0, 40),  # G - 很低
-                random.randint(70, 130),  # B - 中等
+                rng.randint(40, 90),  # R - 较低
+                rng.randint(0, 40),  # G - 很低
+                rng.randint(70, 130),  # B - 中等
             )
         elif color_type == 19:  # 紫红色
             color1 = (
-                random.randint(70, 120),  # R - 中等
-                random.randint(0, 40),  # G - 很低
-                random.randint(70, 120),  # B - 中等
+                rng.randint(70, 120),  # R - 中等
+                rng.randint(0, 40),  # G - 很低
+                rng.randint(70, 120),  # B - 中等
             )
         elif color_type == 20:  # 灰色
-            gray = random.randint(40, 80)
+            gray = rng.randint(40, 80)
             color1 = (gray, gray, gray)  # 均匀灰色
         elif color_type == 21:  # 暖灰色
-            gray = random.randint(40, 80)
-            color1 = (gray + random.randint(10, 30), gray, gray - random.randint(5, 15))
+            gray = rng.randint(40, 80)
+            color1 = (gray + rng.randint(10, 30), gray, gray - rng.randint(5, 15))
         elif color_type == 22:  # 冷灰色
-            gray = random.randint(40, 80)
-            color1 = (gray - random.randint(5, 15), gray, gray + random.randint(10, 30))
+            gray = rng.randint(40, 80)
+            color1 = (gray - rng.randint(5, 15), gray, gray + rng.randint(10, 30))
         elif color_type == 23:  # 棕色
             color1 = (
-                random.randint(60, 100),  # R - 中等
-                random.randint(40, 80),  # G - 较低
-                random.randint(20, 50),  # B - 很低
+                rng.randint(60, 100),  # R - 中等
+                rng.randint(40, 80),  # G - 较低
+                rng.randint(20, 50),  # B - 很低
             )
         elif color_type == 24:  # 古铜色
             color1 = (
-                random.randint(80, 120),  # R - 中等
-                random.randint(60, 100),  # G - 中等
-                random.randint(10, 40),  # B - 很低
+                rng.randint(80, 120),  # R - 中等
+                rng.randint(60, 100),  # G - 中等
+                rng.randint(10, 40),  # B - 很低
             )
         else:  # 褐绿色
             color1 = (
-                random.randint(50, 90),  # R - 较低
-                random.randint(60, 100),  # G - 中等
-                random.randint(30, 70),  # B - 较低
+                rng.randint(50, 90),  # R - 较低
+                rng.randint(60, 100),  # G - 中等
+                rng.randint(30, 70),  # B - 较低
             )
 
     if color2 is None:
         # 选择色系类型 (0-25 共26种不同颜色)
         # 注意：这里独立选择，允许左右颜色属于不同色系，增加随机性
-        color_type = random.randint(0, 25)
+        color_type = rng.randint(0, 25)
 
         # 基础颜色组 (6种原有颜色)
         if color_type == 0:  # 偏红色
             color2 = (
-                random.randint(180, 255),  # R - 很高
-                random.randint(100, 180),  # G - 中等
-                random.randint(100, 180),  # B - 中等
+                rng.randint(180, 255),  # R - 很高
+                rng.randint(100, 180),  # G - 中等
+                rng.randint(100, 180),  # B - 中等
             )
         elif color_type == 1:  # 偏橙色
             color2 = (
-                random.randint(200, 255),  # R - 很高
-                random.randint(150, 220),  # G - 较高
-                random.randint(70, 150),  # B - 中等
+                rng.randint(200, 255),  # R - 很高
+                rng.randint(150, 220),  # G - 较高
+                rng.randint(70, 150),  # B - 中等
             )
         elif color_type == 2:  # 偏黄色
             color2 = (
-                random.randint(200, 255),  # R - 很高
-                random.randint(180, 255),  # G - 很高
-                random.randint(70, 150),  # B - 中等
+                rng.randint(200, 255),  # R - 很高
+                rng.randint(180, 255),  # G - 很高
+                rng.randint(70, 150),  # B - 中等
             )
         elif color_type == 3:  # 偏绿色
             color2 = (
-                random.randint(100, 180),  # R - 中等
-                random.randint(180, 255),  # G - 很高
-                random.randint(120, 200),  # B - 较高
+                rng.randint(100, 180),  # R - 中等
+                rng.randint(180, 255),  # G - 很高
+                rng.randint(120, 200),  # B - 较高
             )
         elif color_type == 4:  # 偏蓝色
             color2 = (
-                random.randint(100, 180),  # R - 中等
-                random.randint(150, 220),  # G - 较高
-                random.randint(180, 255),  # B - 很高
+                rng.randint(100, 180),  # R - 中等
+                rng.randint(150, 220),  # G - 较高
+                rng.randint(180, 255),  # B - 很高
             )
         elif color_type == 5:  # 偏紫色
             color2 = (
-                random.randint(150, 220),  # R - 较高
-                random.randint(100, 170),  # G - 中等
-                random.randint(180, 255),  # B - 很高
+                rng.randint(150, 220),  # R - 较高
+                rng.randint(100, 170),  # G - 中等
+                rng.randint(180, 255),  # B - 很高
             )
 
         # 新增颜色组 (20种新颜色)
         elif color_type == 6:  # 鲜红色
             color2 = (
-                random.randint(220, 255),  # R - 很高
-                random.randint(50, 100),  # G - 中等偏低
-                random.randint(50, 100),  # B - 中等偏低
+                rng.randint(220, 255),  # R - 很高
+                rng.randint(50, 100),  # G - 中等偏低
+                rng.randint(50, 100),  # B - 中等偏低
             )
         elif color_type == 7:  # 玫瑰色
             color2 = (
-                random.randint(220, 255),  # R - 很高
-                random.randint(100, 160),  # G - 中等
-                random.randint(130, 190),  # B - 较高
+                rng.randint(220, 255),  # R - 很高
+                rng.randint(100, 160),  # G - 中等
+                rng.randint(130, 190),  # B - 较高
             )
         elif color_type == 8:  # 亮橙色
             color2 = (
-                random.randint(230, 255),  # R - 很高
-                random.randint(130, 200),  # G - 较高
-                random.randint(30, 90),  # B - 较低
+                rng.randint(230, 255),  # R - 很高
+                rng.randint(130, 200),  # G - 较高
+                rng.randint(30, 90),  # B - 较低
             )
         elif color_type == 9:  # 珊瑚色
             color2 = (
-                random.randint(230, 255),  # R - 很高
-                random.randint(110, 170),  # G - 中等
-                random.randint(100, 160),  # B - 中等
+                rng.randint(230, 255),  # R - 很高
+                rng.randint(110, 170),  # G - 中等
+                rng.randint(100, 160),  # B - 中等
             )
         elif color_type == 10:  # 亮黄色
             color2 = (
-                random.randint(230, 255),  # R - 很高
-                random.randint(200, 255),  # G - 很高
-                random.randint(100, 160),  # B - 中等
+                rng.randint(230, 255),  # R - 很高
+                rng.randint(200, 255),  # G - 很高
+                rng.randint(100, 160),  # B - 中等
             )
         elif color_type == 11:  # 柠檬色
             color2 = (
-                random.randint(200, 255),  # R - 很高
-                random.randint(230, 255),  # G - 很高
-                random.randint(50, 130),  # B - 中等偏低
+                rng.randint(200, 255),  # R - 很高
+                rng.randint(230, 255),  # G - 很高
+                rng.randint(50, 130),  # B - 中等偏低
             )
         elif color_type == 12:  # 嫩绿色
             color2 = (
-                random.randint(130, 190),  # R - 中等
-                random.randint(230, 255),  # G - 很高
-                random.randint(100, 160),  # B - 中等
+                rng.randint(130, 190),  # R - 中等
+                rng.randint(230, 255),  # G - 很高
+                rng.randint(100, 160),  # B - 中等
             )
         elif color_type == 13:  # 明绿色
             color2 = (
-                random.randint(50, 110),  # R - 中等偏低
-                random.randint(220, 255),  # G - 很高
-                random.randint(50, 130),  # B - 中等偏低
+                rng.randint(50, 110),  # R - 中等偏低
+                rng.randint(220, 255),  # G - 很高
+                rng.randint(50, 130),  # B - 中等偏低
             )
         elif color_type == 14:  # 青色
             color2 = (
-                random.randint(50, 110),  # R - 中等偏低
-                random.randint(200, 255),  # G - 很高
-                random.randint(200, 255),  # B - 很高
+                rng.randint(50, 110),  # R - 中等偏低
+                rng.randint(200, 255),  # G - 很高
+                rng.randint(200, 255),  # B - 很高
             )
         elif color_type == 15:  # 天蓝色
             color2 = (
-                random.randint(100, 160),  # R - 中等
-                random.randint(180, 230),  # G - 很高
-                random.randint(230, 255),  # B - 很高
+                rng.randint(100, 160),  # R - 中等
+                rng.randint(180, 230),  # G - 很高
+                rng.randint(230, 255),  # B - 很高
             )
         elif color_type == 16:  # 亮蓝色
             color2 = (
-                random.randint(50, 130),  # R - 中等偏低
-                random.randint(130, 190),  # G - 中等
-                random.randint(230, 255),  # B - 很高
+                rng.randint(50, 130),  # R - 中等偏低
+                rng.randint(130, 190),  # G - 中等
+                rng.randint(230, 255),  # B - 很高
             )
         elif color_type == 17:  # 浅紫色
             color2 = (
-                random.randint(150, 210),  # R - 较高
-                random.randint(100, 160),  # G - 中等
-                random.randint(230, 255),  # B - 很高
+                rng.randint(150, 210),  # R - 较高
+                rng.randint(100, 160),  # G - 中等
+                rng.randint(230, 255),  # B - 很高
             )
         elif color_type == 18:  # 淡紫色
             color2 = (
-                random.randint(180, 230),  # R - 很高
-                random.randint(130, 190),  # G - 中等
-                random.randint(220, 255),  # B - 很高
+                rng.randint(180, 230),  # R - 很高
+                rng.randint(130, 190),  # G - 中等
+                rng.randint(220, 255),  # B - 很高
             )
         elif color_type == 19:  # 亮粉色
             color2 = (
-                random.randint(230, 255),  # R - 很高
-                random.randint(130, 190),  # G - 中等
-                random.randint(200, 255),  # B - 很高
+                rng.randint(230, 255),  # R - 很高
+                rng.randint(130, 190),  # G - 中等
+                rng.randint(200, 255),  # B - 很高
             )
         elif color_type == 20:  # 银色
-            gray = random.randint(200, 240)
+            gray = rng.randint(200, 240)
             color2 = (gray, gray, gray)  # 均匀浅灰色
         elif color_type == 21:  # 金色
             color2 = (
-                random.randint(220, 255),  # R - 很高
-                random.randint(180, 230),  # G - 很高
-                random.randint(80, 140),  # B - 中等
+                rng.randint(220, 255),  # R - 很高
+                rng.randint(180, 230),  # G - 很高
+                rng.randint(80, 140),  # B - 中等
             )
         elif color_type == 22:  # 米色
             color2 = (
-                random.randint(220, 255),  # R - 很高
-                random.randint(210, 245),  # G - 很高
-                random.randint(170, 220),  # B - 较高
+                rng.randint(220, 255),  # R - 很高
+                rng.randint(210, 245),  # G - 很高
+                rng.randint(170, 220),  # B - 较高
             )
         elif color_type == 23:  # 浅咖啡色
             color2 = (
-                random.randint(180, 230),  # R - 很高
-                random.randint(140, 190),  # G - 较高
-                random.randint(100, 160),  # B - 中等
+                rng.randint(180, 230),  # R - 很高
+                rng.randint(140, 190),  # G - 较高
+                rng.randint(100, 160),  # B - 中等
             )
         elif color_type == 24:  # 薄荷色
             color2 = (
-                random.randint(150, 200),  # R - 较高
-                random.randint(220, 255),  # G - 很高
-                random.randint(180, 230),  # B - 很高
+                rng.randint(150, 200),  # R - 较高
+                rng.randint(220, 255),  # G - 很高
+                rng.randint(180, 230),  # B - 很高
             )
         else:  # 苍白色
             color2 = (
-                random.randint(220, 255),  # R - 很高
-                random.randint(220, 255),  # G - 很高
-                random.randint(220, 255),  # B - 很高
+                rng.randint(220, 255),  # R - 很高
+                rng.randint(220, 255),  # G - 很高
+                rng.randint(220, 255),  # B - 很高
             )
 
+    return color1, color2
+
+
+def create_gradient_background(width, height, color1=None, color2=None, rng=None):
+    """
+    创建一个从左到右、由深到浅的渐变背景
+
+    参数:
+        width: 背景宽度
+        height: 背景高度
+        color1: 左侧颜色(深色)，如果为None则随机生成
+        color2: 右侧颜色(浅色)，如果为None则随机生成
+        rng: 随机数生成器（random.Random），为None时使用全局random模块
+
+    返回:
+        渐变背景图像
+    """
+    color1, color2 = pick_gradient_colors(color1, color2, rng)
+
     # 创建渐变图像
     gradient = Image.new("RGBA", (width, height), color1)
     draw = ImageDraw.Draw(gradient)
@@ -491,36 +501,427 @@ def create_gradient_background(width, height, color1=None, color2=None):
     return gradient
 
 
-def gen_poster_workflow(name):
+def render_cell(poster, cell_width, cell_height, corner_radius, shadow=CELL_SHADOW):
+    """
+    把海报处理成带圆角和阴影的单元贴图
+
+    参数:
+        poster: 已解码的海报（PIL.Image对象）
+        cell_width: 海报宽度
+        cell_height: 海报高度
+        corner_radius: 圆角半径
+        shadow: 阴影参数 (偏移量, 模糊半径, 颜色)
+
+    返回:
+        带阴影的 RGBA 贴图
+    """
+    # 调整海报大小为固定尺寸
+    resized_poster = poster.resize((cell_width, cell_height), Image.LANCZOS)
+
+    # 创建圆角遮罩（如果需要）
+    if corner_radius > 0:
+        # 创建一个透明的遮罩
+        mask = Image.new("L", (cell_width, cell_height), 0)
+
+        # 绘制圆角
+        draw = ImageDraw.Draw(mask)
+        draw.rounded_rectangle(
+            [(0, 0), (cell_width, cell_height)],
+            radius=corner_radius,
+            fill=255,
+        )
+
+        # 应用遮罩
+        poster_with_corners = Image.new("RGBA", resized_poster.size, (0, 0, 0, 0))
+        poster_with_corners.paste(resized_poster, (0, 0), mask)
+        resized_poster = poster_with_corners
+
+    # 添加阴影效果到每张海报
+    offset, blur_radius, shadow_color = shadow
+    return add_shadow(
+        resized_poster,
+        offset=(offset, offset),  # 较大的偏移量
+        shadow_color=shadow_color,  # 更深的黑色，但不要超过255的透明度
+        blur_radius=blur_radius,  # 保持模糊半径
+    )
+
+
+def get_cell_sprite(entry, plan, open_image):
+    """
+    获取一张海报在渲染计划中的单元贴图，优先使用缓存，命中时无需解码原图
+
+    参数:
+        entry: 海报清单中的一项（包含 Id 和 ImageTag）
+        plan: plan_format 的结果
+        open_image: 返回已解码海报的函数，只在缓存未命中时调用
+    """
+    # 两种合成方式的结果有细微差别，分别缓存，保证默认输出逐字节不变
+    use_arrays = use_array_compositor()
+    cell_key = make_cell_key(
+        entry.get("Id"),
+        entry.get("ImageTag"),
+        plan["cell_size"],
+        plan["corner_radius"],
+        plan["shadow"],
+        "numpy" if use_arrays else None,
+    )
+    sprite = load_cell(cell_key, plan["sprite_size"])
+
+    if sprite is None:
+        sprite = (array_compositor.render_cell if use_arrays else render_cell)(
+            open_image(),
+            plan["cell_size"][0],
+            plan["cell_size"][1],
+            plan["corner_radius"],
+            plan["shadow"],
+        )
+        store_cell(cell_key, sprite)
+    return sprite
+
+
+def load_poster_palette(item_id, image_tag, open_image, store=True):
+    """
+    获取海报的调色板，优先使用按 ID 和图片标签缓存的结果
+
+    参数:
+        item_id: 媒体项 ID
+        image_tag: 图片标签
+        open_image: 返回已解码海报的函数，只在缓存未命中时调用
+        store: 是否写入缓存（海报是缩小解码时不写入）
+    """
+    palette = get_cached_palette(item_id, image_tag)
+    if palette is None and not store:
+        palette = extract_palette(open_image())
+    elif palette is None:
+        palette = get_palette(open_image(), item_id, image_tag)
+    return palette
+
+
+def load_poster_manifest(poster_folder):
+    """
+    读取下载海报时保存的清单
+
+    返回:
+        {文件名: {"Id": 媒体项ID, "ImageTag": 图片标签, ...}}，没有清单时返回空字典
+    """
+    manifest_path = os.path.join(poster_folder, config.POSTER_MANIFEST)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return {entry["file"]: entry for entry in json.load(f)}
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+        return {}
+
+
+def poster_sort_key(path):
+    """按文件名中的序号排序（1.jpg, 2.jpg, ..., 10.jpg）"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return (0, int(stem), "") if stem.isdigit() else (1, 0, stem)
+
+
+def find_poster_files(poster_folder):
+    """海报文件夹中所有支持格式的图片，按序号排序"""
+    supported_formats = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp")
+    return sorted(
+        (
+            os.path.join(poster_folder, f)
+            for f in os.listdir(poster_folder)
+            if os.path.isfile(os.path.join(poster_folder, f))
+            and f.lower().endswith(supported_formats)
+        ),
+        key=poster_sort_key,
+    )
+
+
+def make_poster_seed(library_key, poster_files, manifest):
+    """
+    按媒体库和所选海报生成渲染种子
+
+    参数:
+        library_key: 媒体库 ID（没有时使用名称）
+        poster_files: 参与渲染的海报文件路径列表
+        manifest: load_poster_manifest 的结果
+    """
+    seed_items = []
+    for poster_path in poster_files:
+        entry = manifest.get(os.path.basename(poster_path), {})
+        if entry.get("Id"):
+            seed_items.append([entry["Id"], entry.get("ImageTag", "")])
+        else:
+            seed_items.append(
+                [os.path.basename(poster_path), os.path.getsize(poster_path)]
+            )
+    return make_render_seed(library_key, seed_items)
+
+
+def pick_render_colors(palette, rng):
+    """
+    选择渐变背景和色块的颜色
+
+    参数:
+        palette: 第一张海报的调色板，没有时为 None
+        rng: 本次渲染的随机数生成器
+
+    返回:
+        (渐变左侧颜色, 渐变右侧颜色, 色块颜色)
+    """
+    if palette and config.POSTER_GEN_CONFIG.get("PALETTE_GRADIENT", False):
+        color1, color2 = gradient_colors_from_palette(palette)
+    else:
+        color1, color2 = pick_gradient_colors(rng=rng)
+
+    # 使用第一张海报的主色作为色块颜色
+    if palette:
+        accent_color = pick_accent_color(palette)
+    else:
+        # 如果没有图片，生成一个随机颜色
+        accent_color = (
+            rng.randint(50, 200),
+            rng.randint(50, 200),
+            rng.randint(50, 200),
+            255,
+        )
+    return color1, color2, accent_color
+
+
+def get_format_config(output_format):
+    """输出格式的布局参数：在 POSTER_GEN_CONFIG 的基础上应用该格式的覆盖项"""
+    gen_config = dict(config.POSTER_GEN_CONFIG)
+    gen_config.update(output_format.get("LAYOUT", {}))
+    return gen_config
+
+
+def get_format_output_path(base_path, index, output_format):
+    """
+    输出格式的保存路径：第一个格式使用 base_path，
+    其余格式在文件名后加上图片类型，如 Movie_Backdrop.png
+    """
+    if index == 0:
+        return base_path
+    root, ext = os.path.splitext(base_path)
+    return f"{root}_{output_format['IMAGE_TYPE']}{ext}"
+
+
+def get_library_titles(name):
+    """根据 template_mapping 获取媒体库的中文名和英文名"""
+    library_ch_name = name  # 默认使用输入的name作为中文名
+    library_eng_name = ""  # 默认英文名为空
+
+    # 查找匹配的模板配置
+    matched_template = None
+    for template in config.TEMPLATE_MAPPING:
+        if template.get("library_name") == name:
+            matched_template = template
+            break
+
+    # 如果找到匹配的模板配置，使用模板中的中英文名
+    if matched_template:
+        if "library_ch_name" in matched_template:
+            library_ch_name = matched_template["library_ch_name"]
+        if "library_eng_name" in matched_template:
+            library_eng_name = matched_template["library_eng_name"]
+
+    return library_ch_name, library_eng_name
+
+
+def draw_titles(result, name, accent_color, plan):
+    """按渲染计划绘制媒体库中英文名和装饰色块"""
+    library_ch_name, library_eng_name = get_library_titles(name)
+    contents = {"title": library_ch_name, "subtitle": library_eng_name}
+
+    for text in plan["texts"]:
+        content = contents.get(text["role"], "")
+        # 没有英文名时不绘制英文名
+        if not content:
+            continue
+
+        font_size = text["size"]
+        # 根据文字长度动态调整字体大小，字体大小与文本长度成反比，但不小于最小字号
+        if text["fit_length"] and len(content) > text["fit_length"]:
+            font_size = font_size * (text["fit_length"] / len(content)) ** 0.8
+            font_size = max(font_size, text["min_size"])
+            print(
+                f"文字 '{content}' 长度为 {len(content)}，使用字体大小: {font_size:.2f}"
+            )
+
+        result = draw_text_on_image(
+            result, content, text["position"], text["font"], font_size * plan["scale"]
+        )
+
+    # 添加色块（只在对应文字不为空时添加）
+    for accent in plan["accents"]:
+        if accent["role"] and not contents.get(accent["role"]):
+            continue
+        if accent["shape"] == "rect":
+            result = draw_color_block(
+                result, accent["position"], accent["size"], accent_color
+            )
+
+    return result
+
+
+def plan_format(output_format, scale=1.0):
+    """
+    获取一个输出格式的渲染计划（布局参数相同时直接使用已编译的计划）
+
+    返回:
+        layout.compile_layout 的结果
+    """
+    return compile_layout(
+        get_format_config(output_format),
+        (output_format["WIDTH"], output_format["HEIGHT"]),
+        scale,
+    )
+
+
+def cell_spec(plan):
+    """海报单元贴图的参数，参数相同的输出格式共用同一张贴图"""
+    return (plan["cell_size"], plan["corner_radius"], plan["shadow"])
+
+
+def compose_format(plan, gradient_bg, sprites, poster_count, columns_dir=None, name=""):
+    """
+    按布局把海报单元贴图合成到背景上
+
+    参数:
+        plan: plan_format 的结果
+        gradient_bg: 渐变背景
+        sprites: {(海报序号, 贴图参数): 贴图}，使用数组合成时为贴图数组
+        poster_count: 实际可用的海报数量
+        columns_dir: 保存每列中间图片的目录，为None时不保存
+        name: 媒体库名称（用于中间文件名）
+
+    返回:
+        (合成结果, 跳过的海报数量)
+    """
+    # 以渐变背景作为起点
+    result = gradient_bg.copy()
+    spec = cell_spec(plan)
+    sprite_width = plan["sprite_size"][0]
+    skipped_count = 0
+    use_arrays = use_array_compositor()
+
+    # 处理每一列图片
+    for column in plan["columns"]:
+        col_index = column["index"]
+        cell_count = sum(
+            1 for cell in column["cells"] if cell["poster_index"] < poster_count
+        )
+        if not cell_count:
+            break
+
+        # 整列都不可见时直接跳过
+        if column["crop"] is None:
+            skipped_count += cell_count
+            continue
+
+        crop_top, crop_bottom = column["crop"]
+        column_size = (sprite_width, crop_bottom - crop_top)
+        column_path = None
+        if columns_dir:
+            column_path = os.path.join(
+                columns_dir, f"{name}_column_{col_index+1}_original.png"
+            )
+
+        # 可见的海报及其在列画布上的位置（垂直排列），粘贴时不减去偏移量，确保阴影有空间
+        placements = []
+        placed = 0
+        for poster_index, y_position in column["visible_cells"]:
+            if poster_index >= poster_count:
+                continue
+            placed += 1
+            sprite = sprites.get((poster_index, spec))
+            if sprite is not None:
+                placements.append((sprite, y_position - crop_top))
+        skipped_count += cell_count - placed
+
+        if use_arrays:
+            # 在一个数组中合成整列，直接得到预乘透明度的列图层
+            column_layer = array_compositor.compose_column(
+                placements, column_size, column_path
+            )
+        else:
+            # 只为可见的海报创建列画布，宽度包含右侧阴影
+            column_image = Image.new("RGBA", column_size, (0, 0, 0, 0))
+
+            # 在列画布上放置每张可见的图片
+            for sprite, y_position in placements:
+                column_image.paste(sprite, (0, y_position), sprite)
+
+            # 保存原始列图像（旋转前）
+            if column_path:
+                column_image.save(column_path)
+
+            # 与旋转画布上的粘贴保持一致（带遮罩粘贴到透明画布）
+            column_layer = Image.new("RGBA", column_image.size, (0, 0, 0, 0))
+            column_layer.paste(column_image, (0, 0), column_image)
+
+        # 只对列在画布上的可见区域做旋转变换，不再创建巨大的旋转画布
+        box = column["box"]
+        rotated_column = column_layer.transform(
+            (box[2] - box[0], box[3] - box[1]),
+            Image.AFFINE,
+            column["matrix"],
+            Image.BICUBIC,
+        )
+        if rotated_column.mode != "RGBA":
+            rotated_column = rotated_column.convert("RGBA")
+
+        # 保存旋转后的列图像
+        if columns_dir:
+            rotated_column.save(
+                os.path.join(columns_dir, f"column_{col_index+1}_rotated.png")
+            )
+
+        # 粘贴旋转后的列到结果图像
+        result.paste(rotated_column, (box[0], box[1]), rotated_column)
+
+    return result, skipped_count
+
+
+def gen_poster_workflow(
+    name,
+    library_id=None,
+    seed=None,
+    scale=1.0,
+    output_path=None,
+    poster_folder=None,
+    output_formats=None,
+    sprite_source=None,
+):
     """
     将多张电影海报排列成三列，每列三张，然后将每列作为整体旋转并放在渐变背景上
     不再依赖外部模板文件，直接生成渐变背景
+
+    config.OUTPUT_FORMATS 中的每个输出格式（如 Primary、Thumb、Backdrop）都在一次调用中生成，
+    海报只解码一次，参数相同的海报单元贴图在各格式之间共用
+
+    所有随机选择都来自一个按媒体库和所选海报确定的随机数生成器，
+    输入不变时生成的图片逐字节相同
+
+    参数:
+        name: 媒体库名称
+        library_id: 媒体库 ID，用于生成随机种子
+        seed: 指定随机种子，为None时自动生成
+        scale: 缩放比例，小于 1 时为预览模式，所有尺寸、字号、阴影和圆角按比例缩小
+        output_path: 第一个输出格式的保存路径，为None时保存到输出文件夹，
+            其余格式保存在同目录下并在文件名后加上图片类型
+        poster_folder: 海报文件夹，为None时使用海报文件夹下以媒体库名称命名的目录
+        output_formats: 要生成的输出格式，为None时使用 config.OUTPUT_FORMATS
+        sprite_source: 提供已生成贴图的函数 (海报清单项, 渲染计划) -> 贴图或None，
+            返回None时从缓存读取或重新生成（进程池生成时用于读取共享内存中的贴图）
     """
 
     try:
         print("\n[3/4] 正在生成海报...")
         print("-" * 40)
-        poster_folder = os.path.join(config.POSTER_FOLDER, name)
-        output_path = os.path.join(config.OUTPUT_FOLDER, f"{name}.png")
-        rows = config.POSTER_GEN_CONFIG["ROWS"]
-        cols = config.POSTER_GEN_CONFIG["COLS"]
-        margin = config.POSTER_GEN_CONFIG["MARGIN"]
-        corner_radius = config.POSTER_GEN_CONFIG["CORNER_RADIUS"]
-        rotation_angle = config.POSTER_GEN_CONFIG["ROTATION_ANGLE"]
-        start_x = config.POSTER_GEN_CONFIG["START_X"]
-        start_y = config.POSTER_GEN_CONFIG["START_Y"]
-        column_spacing = config.POSTER_GEN_CONFIG["COLUMN_SPACING"]
-        save_columns = config.POSTER_GEN_CONFIG["SAVE_COLUMNS"]
-
-        # 定义模板尺寸（可以根据需要调整）
-        template_width = 1920  # 或者从配置中获取
-        template_height = 1080  # 或者从配置中获取
-
-        # 创建渐变背景作为模板
-        gradient_bg = create_gradient_background(template_width, template_height)
-
-        # 以渐变背景作为起点
-        result = gradient_bg.copy()
+        if poster_folder is None:
+            poster_folder = os.path.join(config.get_poster_folder(), name)
+        if output_path is None:
+            output_path = os.path.join(config.get_output_folder(), f"{name}.png")
+        if output_formats is None:
+            output_formats = config.OUTPUT_FORMATS
+        # 预览时不保存中间文件
+        save_columns = config.POSTER_GEN_CONFIG["SAVE_COLUMNS"] and scale == 1
 
         # 创建保存中间文件的文件夹
         output_dir = os.path.dirname(output_path)
@@ -531,16 +932,11 @@ def gen_poster_workflow(name):
         if save_columns and not os.path.exists(columns_dir):
             os.makedirs(columns_dir)
 
-        # 支持的图片格式
-        supported_formats = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp")
+        # 每个输出格式的画布尺寸和布局
+        plans = [plan_format(output_format, scale) for output_format in output_formats]
 
-        # 获取文件夹中的所有图片
-        poster_files = [
-            os.path.join(poster_folder, f)
-            for f in os.listdir(poster_folder)
-            if os.path.isfile(os.path.join(poster_folder, f))
-            and f.lower().endswith(supported_formats)
-        ]
+        # 获取文件夹中的所有图片（按序号排序，保证顺序稳定）
+        poster_files = find_poster_files(poster_folder)
 
         # 确保至少有一张图片
         if not poster_files:
@@ -548,232 +944,128 @@ def gen_poster_workflow(name):
             return False
 
         # 限制最多处理 rows*cols 张图片
-        max_posters = rows * cols
+        max_posters = max(plan["poster_count"] for plan in plans)
         poster_files = poster_files[:max_posters]
 
-        # 固定海报尺寸
-        cell_width = config.POSTER_GEN_CONFIG["CELL_WIDTH"]
-        cell_height = config.POSTER_GEN_CONFIG["CELL_HEIGHT"]
-
-        # 将图片分成3组，每组3张
-        grouped_posters = [
-            poster_files[i : i + rows] for i in range(0, len(poster_files), rows)
-        ]
-
-        # 处理每一组（每一列）图片
-        for col_index, column_posters in enumerate(grouped_posters):
-            if col_index >= cols:
-                break
-
-            # 计算当前列的 x 坐标
-            column_x = start_x + col_index * column_spacing
-
-            # 计算当前列所有图片组合后的高度（包括间距）
-            column_height = rows * cell_height + (rows - 1) * margin
-
-            # 创建一个透明的画布用于当前列的所有图片，增加宽度以容纳右侧阴影
-            shadow_extra_width = 20 + 20 * 2  # 右侧阴影需要的额外宽度
-            shadow_extra_height = 20 + 20 * 2  # 底部阴影需要的额外高度
-
-            # 修改列画布的尺寸，确保有足够空间容纳阴影
-            column_image = Image.new(
-                "RGBA",
-                (cell_width + shadow_extra_width, column_height + shadow_extra_height),
-                (0, 0, 0, 0),
-            )
-
-            # 在列画布上放置每张图片
-            for row_index, poster_path in enumerate(column_posters):
-                try:
-                    # 打开海报
-                    poster = Image.open(poster_path)
-
-                    # 调整海报大小为固定尺寸
-                    resized_poster = poster.resize(
-                        (cell_width, cell_height), Image.LANCZOS
-                    )
-
-                    # 创建圆角遮罩（如果需要）
-                    if corner_radius > 0:
-                        # 创建一个透明的遮罩
-                        mask = Image.new("L", (cell_width, cell_height), 0)
-
-                        # 绘制圆角
-                        from PIL import ImageDraw
-
-                        draw = ImageDraw.Draw(mask)
-                        draw.rounded_rectangle(
-                            [(0, 0), (cell_width, cell_height)],
-                            radius=corner_radius,
-                            fill=255,
-                        )
+        # 读取海报清单，获取每张海报对应的媒体项 ID 和图片标签
+        manifest = load_poster_manifest(poster_folder)
 
-                        # 应用遮罩
-                        poster_with_corners = Image.new(
-                            "RGBA", resized_poster.size, (0, 0, 0, 0)
-                        )
-                        poster_with_corners.paste(resized_poster, (0, 0), mask)
-                        resized_poster = poster_with_corners
-
-                    # 添加阴影效果到每张海报
-                    resized_poster_with_shadow = add_shadow(
-                        resized_poster,
-                        offset=(20, 20),  # 较大的偏移量
-                        shadow_color=(
-                            0,
-                            0,
-                            0,
-                            255,
-                        ),  # 更深的黑色，但不要超过255的透明度
-                        blur_radius=20,  # 保持模糊半径
-                    )
-
-                    # 在添加阴影后保存一张测试图片来检查阴影效果
-                    # debug_path = os.path.join(output_dir, "shadow_test.png")
-                    # resized_poster_with_shadow.save(debug_path)
-                    # print(f"已保存阴影测试图片到: {debug_path}")
-
-                    # 计算在列画布上的位置（垂直排列）
-                    y_position = row_index * (cell_height + margin)
-                    x_position = 0  # 一般为0，但在有阴影时可能需要调整
-
-                    # 粘贴到列画布上时，不要减去偏移量，确保阴影有空间
-                    column_image.paste(
-                        resized_poster_with_shadow,
-                        (0, y_position),  # 不减去偏移量，确保阴影有空间
-                        resized_poster_with_shadow,
-                    )
-
-                except Exception as e:
-                    print(f"错误: 处理图片 {os.path.basename(poster_path)} 时出错: {e}")
-                    continue
+        def get_manifest_entry(poster_path):
+            return manifest.get(os.path.basename(poster_path), {})
 
-            # 保存原始列图像（旋转前）
-            if save_columns:
-                column_orig_path = os.path.join(
-                    columns_dir, f"{name}_column_{col_index+1}_original.png"
-                )
-                column_image.save(column_orig_path)
-
-            # 现在我们有了完整的一列图片，准备旋转它
-            # 创建一个足够大的画布来容纳旋转后的列
-            rotation_canvas_size = int(
-                math.sqrt(
-                    (cell_width + shadow_extra_width) ** 2
-                    + (column_height + shadow_extra_height) ** 2
-                )
-                * 1.5
-            )
-            rotation_canvas = Image.new(
-                "RGBA", (rotation_canvas_size, rotation_canvas_size), (0, 0, 0, 0)
-            )
+        # 本次渲染专用的随机数生成器
+        if seed is None:
+            seed = make_poster_seed(library_id or name, poster_files, manifest)
+        rng = random.Random(seed)
 
-            # 将列图片放在旋转画布的中央
-            paste_x = (rotation_canvas_size - cell_width) // 2
-            paste_y = (rotation_canvas_size - column_height) // 2
-            rotation_canvas.paste(column_image, (paste_x, paste_y), column_image)
+        # 预览时按最大的海报单元尺寸缩小解码
+        draft_size = (
+            max(plan["cell_size"][0] for plan in plans),
+            max(plan["cell_size"][1] for plan in plans),
+        )
 
-            # 旋转整个列
-            rotated_column = rotation_canvas.rotate(
-                rotation_angle, Image.BICUBIC, expand=True
+        # 已解码的海报，供提取主色和绘制海报共用，避免重复解码
+        decoded_posters = {}
+
+        def open_poster(poster_index):
+            if poster_index not in decoded_posters:
+                poster = Image.open(poster_files[poster_index])
+                if scale < 1:
+                    # 预览时让 JPEG 解码器直接按 1/2、1/4、1/8 缩小解码
+                    poster.draft("RGB", draft_size)
+                poster.load()
+                decoded_posters[poster_index] = poster
+            return decoded_posters[poster_index]
+
+        # 获取第一张海报的调色板（优先使用按 ID 和图片标签缓存的结果）
+        palette = None
+        first_entry = get_manifest_entry(poster_files[0])
+        try:
+            # 预览时海报是缩小解码的，结果不写入缓存
+            palette = load_poster_palette(
+                first_entry.get("Id"),
+                first_entry.get("ImageTag"),
+                lambda: open_poster(0),
+                store=scale == 1,
             )
-
-            # 保存旋转后的列图像
-            if save_columns:
-                column_rotated_path = os.path.join(
-                    columns_dir, f"column_{col_index+1}_rotated.png"
+        except Exception as e:
+            print(f"获取海报主色时出错: {e}")
+
+        # 渐变背景和色块的颜色，所有输出格式使用同一组颜色
+        color1, color2, accent_color = pick_render_colors(palette, rng)
+
+        # 模糊海报背景：在第一张海报被释放之前生成缩小后的结果，合成时再放大
+        artwork_backgrounds = {}
+        for index, (output_format, plan) in enumerate(zip(output_formats, plans)):
+            style = get_blur_style(get_format_config(output_format), plan["scale"])
+            if style:
+                artwork_backgrounds[index] = get_blurred_artwork(
+                    first_entry.get("Id"),
+                    first_entry.get("ImageTag"),
+                    lambda: open_poster(0),
+                    plan["size"],
+                    style,
+                    store=scale == 1,
                 )
-                rotated_column.save(column_rotated_path)
-
-            # 计算列在模板上的位置（不同的列有不同的y起点）
-            column_center_y = start_y + column_height // 2
-            column_center_x = column_x
-
-            # 根据列索引调整位置
-            if col_index == 1:  # 中间列
-                column_center_x += cell_width - 50
-            elif col_index == 2:  # 右侧列
-                column_center_y += -155
-                column_center_x += (cell_width) * 2 - 40
-
-            # 计算最终放置位置
-            final_x = column_center_x - rotated_column.width // 2 + cell_width // 2
-            final_y = column_center_y - rotated_column.height // 2
-
-            # 粘贴旋转后的列到结果图像
-            result.paste(rotated_column, (final_x, final_y), rotated_column)
-
-        # 获取第一张图片的随机点颜色
-        if poster_files:
-            first_image_path = poster_files[0]
-            random_color = get_random_color(first_image_path)
-        else:
-            # 如果没有图片，生成一个随机颜色
-            random_color = (
-                random.randint(50, 200),
-                random.randint(50, 200),
-                random.randint(50, 200),
-                255,
-            )
-
-        # 根据name匹配template_mapping中的配置
-        library_ch_name = name  # 默认使用输入的name作为中文名
-        library_eng_name = ""  # 默认英文名为空
-
-        # 查找匹配的模板配置
-        matched_template = None
-        for template in config.TEMPLATE_MAPPING:
-            if template.get("library_name") == name:
-                matched_template = template
-                break
-
-        # 如果找到匹配的模板配置，使用模板中的中英文名
-        if matched_template:
-            if "library_ch_name" in matched_template:
-                library_ch_name = matched_template["library_ch_name"]
-            if "library_eng_name" in matched_template:
-                library_eng_name = matched_template["library_eng_name"]
-
-        # 添加中文名文字
-        fangzheng_font_path = os.path.join("font", "方正风雅宋简体.ttf")
-        result = draw_text_on_image(
-            result, library_ch_name, (73.32, 427.34), fangzheng_font_path, 163
-        )
 
-        # 如果有英文名，才添加英文名文字
-        if library_eng_name:
-            # 动态调整字体大小，根据英文名长度
-            base_font_size = 50  # 默认字体大小
-
-            # 根据英文名长度调整字体大小
-            if len(library_eng_name) > 10:
-                # 字体大小与文本长度成反比
-                font_size = base_font_size * (10 / len(library_eng_name)) ** 0.8
-                # 设置最小字体大小限制，确保文字不会太小
-                font_size = max(font_size, 30)
+        # 找出至少在一个输出格式中可见的海报单元，每张海报只解码一次
+        needed_cells = {}
+        for plan in plans:
+            spec = cell_spec(plan)
+            for column in plan["columns"]:
+                for poster_index, _ in column["visible_cells"]:
+                    if poster_index < len(poster_files):
+                        needed_cells.setdefault(poster_index, {})[spec] = plan
+
+        sprites = {}
+        for poster_index in sorted(needed_cells):
+            poster_path = poster_files[poster_index]
+            entry = get_manifest_entry(poster_path)
+            try:
+                for spec, plan in needed_cells[poster_index].items():
+                    sprite = sprite_source(entry, plan) if sprite_source else None
+                    if sprite is None:
+                        sprite = get_cell_sprite(
+                            entry, plan, lambda: open_poster(poster_index)
+                        )
+                    sprites[(poster_index, spec)] = sprite
+            except Exception as e:
+                print(f"错误: 处理图片 {os.path.basename(poster_path)} 时出错: {e}")
+            decoded_posters.pop(poster_index, None)
+
+        decoded_posters.clear()
+
+        # 使用数组合成时每张贴图只转换一次，供所有输出格式共用
+        if use_array_compositor():
+            sprites = {
+                key: array_compositor.get_pixels(sprite)
+                for key, sprite in sprites.items()
+            }
+
+        for index, (output_format, plan) in enumerate(zip(output_formats, plans)):
+            if artwork_backgrounds.get(index) is not None:
+                gradient_bg = expand_background(artwork_backgrounds[index], plan["size"])
             else:
-                font_size = base_font_size
-
-            # 打印调试信息
-            print(
-                f"英文名 '{library_eng_name}' 长度为 {len(library_eng_name)}，使用字体大小: {font_size:.2f}"
-            )
-
-            melete_font_path = os.path.join("font", "Melete-UltraLight.otf")
-            result = draw_text_on_image(
-                result, library_eng_name, (124.68, 624.55), melete_font_path, font_size
+                gradient_bg = create_gradient_background(
+                    plan["size"][0], plan["size"][1], color1, color2
+                )
+            result, skipped_count = compose_format(
+                plan,
+                gradient_bg,
+                sprites,
+                len(poster_files),
+                columns_dir if save_columns and index == 0 else None,
+                name,
             )
+            if skipped_count:
+                print(f"跳过 {skipped_count} 张完全位于画布外的海报")
 
-            # 添加色块（只在有英文名时添加）
-            color_block_position = (84.38, 629.06)
-            color_block_size = (21.51, 55)
-            result = draw_color_block(
-                result, color_block_position, color_block_size, random_color
-            )
+            result = draw_titles(result, name, accent_color, plan)
 
-        # 保存结果
-        result.save(output_path)
-        print(f"成功: 图片已保存到 {output_path}")
+            # 保存结果（先写临时文件再替换，进程中断时不会留下半张图片）
+            format_path = get_format_output_path(output_path, index, output_format)
+            atomic_save_image(result, format_path)
+            print(f"成功: {output_format['IMAGE_TYPE']} 图片已保存到 {format_path}")
         return True
 
     except Exception as e:
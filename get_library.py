@@ -2,6 +2,7 @@ import requests
 import json
 
 import config
+import http_client
 
 
 def get_jellyfin_libraries():
@@ -9,7 +10,7 @@ def get_jellyfin_libraries():
     获取Jellyfin的媒体库列表
 
     Returns:
-        list: 包含媒体库信息的字典列表，每个字典包含'Id'和'Name'
+        list: 包含媒体库信息的字典列表，每个字典包含'Id'、'Name'和'CollectionType'
     """
     auth_info = config.get_auth_info()
     url = f"{auth_info['base_url']}/Library/MediaFolders"
@@ -19,7 +20,7 @@ def get_jellyfin_libraries():
     }
 
     try:
-        response = requests.request("GET", url, headers=headers)
+        response = http_client.get(url, headers=headers, timeout=30)
         response.raise_for_status()  # 检查HTTP错误
 
         data = response.json()
@@ -29,7 +30,13 @@ def get_jellyfin_libraries():
         if "Items" in data:
             for item in data["Items"]:
                 if "Id" in item and "Name" in item:
-                    libraries.append({"Id": item["Id"], "Name": item["Name"]})
+                    libraries.append(
+                        {
+                            "Id": item["Id"],
+                            "Name": item["Name"],
+                            "CollectionType": item.get("CollectionType", ""),
+                        }
+                    )
 
         return libraries
     except requests.exceptions.RequestException as e:
@@ -45,7 +52,7 @@ def get_emby_libraries():
     获取Emby的媒体库列表
 
     Returns:
-        list: 包含媒体库信息的字典列表，每个字典包含'Id'和'Name'
+        list: 包含媒体库信息的字典列表，每个字典包含'Id'、'Name'和'CollectionType'
     """
     auth_info = config.get_auth_info()
     
@@ -60,7 +67,7 @@ def get_emby_libraries():
         }
 
     try:
-        response = requests.request("GET", url, headers=headers)
+        response = http_client.get(url, headers=headers, timeout=30)
         response.raise_for_status()  # 检查HTTP错误
 
         data = response.json()
@@ -70,7 +77,13 @@ def get_emby_libraries():
         if "Items" in data:
             for item in data["Items"]:
                 if "Id" in item and "Name" in item:
-                    libraries.append({"Id": item["Id"], "Name": item["Name"]})
+                    libraries.append(
+                        {
+                            "Id": item["Id"],
+                            "Name": item["Name"],
+                            "CollectionType": item.get("CollectionType", ""),
+                        }
+                    )
 
         return libraries
     except requests.exceptions.RequestException as e:
@@ -86,14 +99,14 @@ def get_libraries():
     根据服务器类型获取媒体库列表
 
     Returns:
-        list: 包含媒体库信息的字典列表，每个字典包含'Id'和'Name'
+        list: 包含媒体库信息的字典列表，每个字典包含'Id'、'Name'和'CollectionType'
     """
     # 确保已经完成认证
     config.get_auth_info()
     print("\n[1/4] 获取媒体库列表...")
     print("-" * 40)
     
-    server_type = config.SERVER_TYPE
+    server_type = config.get_server_type()
     
     if server_type == "jellyfin":
         print("使用Jellyfin API获取媒体库")
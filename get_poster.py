@@ -1,10 +1,18 @@
 import os
-import requests
 import json
 import random
+import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlencode
 import config
+import http_client
+from seed import make_render_seed
+import library_index
+import image_source
+import journal
+from cache import atomic_write_bytes, make_cache_key
 
 
 def ensure_poster_directory(poster_dir, name):
@@ -22,17 +30,19 @@ def ensure_poster_directory(poster_dir, name):
     return full_path
 
 
-def get_jellyfin_items(parent_id):
-    """从Jellyfin获取媒体项列表"""
+def get_jellyfin_items(parent_id, extra_params=None):
+    """从Jellyfin获取媒体项列表，extra_params为附加的查询参数，请求失败时返回None"""
     auth_info = config.get_auth_info()
     url = f"{auth_info['base_url']}/Users/{auth_info['user_id']}/Items/?ParentId={parent_id}"
+    if extra_params:
+        url += f"&{urlencode(extra_params)}"
 
     headers = {
         "Authorization": f'MediaBrowser Token="{auth_info["access_token"]}"'
     }
     try:
         print(f"正在从 Jellyfin 获取媒体列表...")
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http_client.get(url, headers=headers, timeout=30)
 
         if response.status_code == 200:
             data = response.json()
@@ -44,13 +54,13 @@ def get_jellyfin_items(parent_id):
                 return []
         else:
             print(f"获取Jellyfin媒体列表失败，状态码: {response.status_code}")
-            return []
+            return None
     except Exception as e:
         print(f"获取Jellyfin媒体列表时出错: {e}")
-        return []
+        return None
 
-def get_emby_items(parent_id):
-    """从Emby获取媒体项列表"""
+def get_emby_items(parent_id, extra_params=None):
+    """从Emby获取媒体项列表，extra_params为附加的查询参数，请求失败时返回None"""
     auth_info = config.get_auth_info()
     
     # Emby API可以使用API密钥或访问令牌
@@ -62,10 +72,12 @@ def get_emby_items(parent_id):
         headers = {
             "Authorization": f'MediaBrowser Token="{auth_info["access_token"]}"'
         }
+    if extra_params:
+        url += f"&{urlencode(extra_params)}"
         
     try:
         print(f"正在从 Emby 获取媒体列表...")
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http_client.get(url, headers=headers, timeout=30)
 
         if response.status_code == 200:
             data = response.json()
@@ -77,26 +89,35 @@ def get_emby_items(parent_id):
                 return []
         else:
             print(f"获取Emby媒体列表失败，状态码: {response.status_code}")
-            return []
+            return None
     except Exception as e:
         print(f"获取Emby媒体列表时出错: {e}")
-        return []
+        return None
 
-def get_items(parent_id):
-    """根据服务器类型获取媒体项列表"""
-    server_type = config.SERVER_TYPE
+def get_items(parent_id, extra_params=None):
+    """
+    根据服务器类型获取媒体项列表
+
+    返回:
+        媒体项列表，没有媒体项时为空列表，请求失败时为None
+    """
+    server_type = config.get_server_type()
     
     if server_type == "jellyfin":
-        return get_jellyfin_items(parent_id)
+        return get_jellyfin_items(parent_id, extra_params)
     elif server_type == "emby":
-        return get_emby_items(parent_id)
+        return get_emby_items(parent_id, extra_params)
     else:
         print(f"不支持的服务器类型: {server_type}")
-        return []
+        return None
 
 
-def sort_and_select_items(items, count=9):
-    """根据日期排序并选择特定数量的媒体项，剔除没有封面图片的项目"""
+def sort_and_select_items(items, count=9, rng=None):
+    """
+    根据日期排序并选择特定数量的媒体项，剔除没有封面图片的项目
+
+    rng: 没有日期字段时用于随机选择的随机数生成器，为None时使用全局random模块
+    """
     if not items:
         return []
 
@@ -142,7 +163,7 @@ def sort_and_select_items(items, count=9):
         # 如果没有日期字段，随机选择
         sorted_items = list(filtered_items)  # 转换为列表以确保可变
         try:
-            random.shuffle(sorted_items)
+            (rng or random).shuffle(sorted_items)
             print("未找到日期字段，将随机选择媒体项")
         except Exception as e:
             print(f"随机排序媒体项时出错: {e}")
@@ -156,17 +177,38 @@ def sort_and_select_items(items, count=9):
     return selected_items
 
 
-def download_jellyfin_image(item_id, output_path, index):
-    """从Jellyfin下载指定 ID 的媒体项的封面图片"""
+def get_resize_params(max_width=None):
+    """
+    让服务器缩放图片的查询参数（海报墙只需要小图，减少传输和解码）
+
+    参数:
+        max_width: 最大宽度，为None时下载原图
+    """
+    if not max_width:
+        return None
+    return {
+        "maxWidth": max_width,
+        "quality": config.POSTER_WALL_CONFIG["THUMBNAIL_QUALITY"],
+    }
+
+
+def download_jellyfin_image(item_id, output_path, index, max_width=None):
+    """从Jellyfin下载指定 ID 的媒体项的封面图片，指定 max_width 时由服务器缩放"""
     auth_info = config.get_auth_info()
-    url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.SERVER_CONFIG['IMAGE_TYPE']}"
+    url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.get_server_config()['IMAGE_TYPE']}"
 
     headers = {
         "Authorization": f'MediaBrowser Token="{auth_info["access_token"]}"'
     }
     try:
         # print(f"正在从Jellyfin下载第 {index} 张图片: {url}")
-        response = requests.get(url, headers=headers, stream=True, timeout=30)
+        response = http_client.get(
+            url,
+            headers=headers,
+            params=get_resize_params(max_width),
+            stream=True,
+            timeout=30,
+        )
 
         if response.status_code == 200:
             # 保存图片
@@ -183,23 +225,29 @@ def download_jellyfin_image(item_id, output_path, index):
         print(f"从Jellyfin下载图片 {index} 时出错: {e}")
         return False
 
-def download_emby_image(item_id, output_path, index):
-    """从Emby下载指定 ID 的媒体项的封面图片"""
+def download_emby_image(item_id, output_path, index, max_width=None):
+    """从Emby下载指定 ID 的媒体项的封面图片，指定 max_width 时由服务器缩放"""
     auth_info = config.get_auth_info()
     
     # Emby API可以使用API密钥或访问令牌
     if auth_info.get("is_api_key", False):
-        url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.SERVER_CONFIG['IMAGE_TYPE']}?api_key={auth_info['access_token']}"
+        url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.get_server_config()['IMAGE_TYPE']}?api_key={auth_info['access_token']}"
         headers = {}
     else:
-        url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.SERVER_CONFIG['IMAGE_TYPE']}"
+        url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.get_server_config()['IMAGE_TYPE']}"
         headers = {
             "Authorization": f'MediaBrowser Token="{auth_info["access_token"]}"'
         }
     
     try:
         # print(f"正在从Emby下载第 {index} 张图片: {url}")
-        response = requests.get(url, headers=headers, stream=True, timeout=30)
+        response = http_client.get(
+            url,
+            headers=headers,
+            params=get_resize_params(max_width),
+            stream=True,
+            timeout=30,
+        )
 
         if response.status_code == 200:
             # 保存图片
@@ -216,70 +264,189 @@ def download_emby_image(item_id, output_path, index):
         print(f"从Emby下载图片 {index} 时出错: {e}")
         return False
 
-def download_image(item_id, output_path, index):
+def download_image(item_id, output_path, index, max_width=None):
     """根据服务器类型下载指定 ID 的媒体项的封面图片"""
-    server_type = config.SERVER_TYPE
+    server_type = config.get_server_type()
     
     if server_type == "jellyfin":
-        return download_jellyfin_image(item_id, output_path, index)
+        return download_jellyfin_image(item_id, output_path, index, max_width)
     elif server_type == "emby":
-        return download_emby_image(item_id, output_path, index)
+        return download_emby_image(item_id, output_path, index, max_width)
     else:
         print(f"不支持的服务器类型: {server_type}")
         return False
 
 
-def download_all_posters(selected_items, full_path):
-    """下载所有选定的海报，如果不足9张则重复下载"""
+def write_poster_manifest(full_path, manifest):
+    """
+    保存海报清单，记录每个海报文件对应的媒体项 ID 和图片标签，
+    供生成海报时按 (ID, 图片标签) 使用缓存
+    """
+    manifest_path = os.path.join(full_path, config.POSTER_MANIFEST)
+    try:
+        data = json.dumps(manifest, ensure_ascii=False, indent=2)
+        atomic_write_bytes(manifest_path, data.encode("utf-8"))
+    except OSError as e:
+        print(f"保存海报清单时出错: {e}")
+
+
+def make_manifest_entry(item, file_name):
+    """生成海报清单中的一项"""
+    return {
+        "file": file_name,
+        "Id": item.get("Id"),
+        "Name": item.get("Name", ""),
+        "ImageTag": item.get("ImageTags", {}).get(
+            config.get_server_config()["IMAGE_TYPE"], ""
+        ),
+    }
+
+
+def fetch_images_concurrently(tasks):
+    """
+    并行获取多张海报，实际并发数由 http_client 的自适应限流器控制
+
+    参数:
+        tasks: [(媒体项, 保存路径, 序号, 最大宽度), ...]
+
+    返回:
+        与 tasks 顺序一致的成功标志列表
+    """
+    if not tasks:
+        return []
+
+    # 工作线程需要沿用当前线程正在处理的服务器
+    server = config.get_server_config()
+
+    def fetch(task):
+        with config.use_server(server):
+            return image_source.fetch_image(*task)
+
+    max_workers = min(len(tasks), config.HTTP_LIMIT_CONFIG["MAX_CONCURRENCY"])
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(executor.map(fetch, tasks))
+
+
+def download_all_posters(selected_items, full_path, target_count=None, max_width=None):
+    """
+    下载所有选定的海报，如果不足目标数量则重复使用已下载的海报
+
+    参数:
+        selected_items: 选定的媒体项
+        full_path: 海报保存目录
+        target_count: 目标数量，为None时使用 POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
+        max_width: 请求服务器缩放后的最大宽度，为None时下载原图
+    """
     success_count = 0
-    target_count = config.POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
+    if target_count is None:
+        target_count = config.POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
     downloaded_items = []
+    manifest = []
 
-    # 首先尝试下载所有可用的海报
+    # 检查 ID 是否存在
+    candidates = []
     for index, item in enumerate(selected_items, 1):
-        # 检查 ID 是否存在
         if "Id" not in item:
             print(f"跳过第 {index} 个项目: 缺少 ID")
             continue
+        candidates.append(item)
 
-        # 由于已经在sort_and_select_items中过滤，这里不再需要检查是否有Primary图片
-        item_id = item["Id"]
-        output_path = os.path.join(full_path, f"{success_count + 1}.jpg")
+    # 首先并行下载所有可用的海报，先保存为临时文件，再按选择顺序编号
+    tasks = [
+        (item, os.path.join(full_path, f".download_{index}.jpg"), index, max_width)
+        for index, item in enumerate(candidates, 1)
+    ]
+    results = fetch_images_concurrently(tasks)
 
-        if download_image(item_id, output_path, success_count + 1):
+    for (item, temp_path, _, _), success in zip(tasks, results):
+        if success and success_count < target_count:
             success_count += 1
+            output_path = os.path.join(full_path, f"{success_count}.jpg")
+            os.replace(temp_path, output_path)
             downloaded_items.append(item)
+            manifest.append(make_manifest_entry(item, os.path.basename(output_path)))
+        elif os.path.exists(temp_path):
+            os.remove(temp_path)
 
-        # 如果已经达到目标数量，退出循环
-        if success_count >= target_count:
-            break
-
-    # 如果下载的图片数量不足目标数量，则重复下载已有的图片
+    # 如果下载的图片数量不足目标数量，则重复使用已下载的图片（本地复制，无需重新下载）
     if success_count > 0 and success_count < target_count:
         print(
-            f"下载的图片数量({success_count})不足{target_count}张，将重复下载已有图片"
+            f"下载的图片数量({success_count})不足{target_count}张，将重复使用已有图片"
         )
 
-        # 循环重复下载已有图片，直到达到目标数量
+        downloaded_count = success_count
         repeat_index = 0
         while success_count < target_count:
             # 获取一个已下载项目（循环使用）
-            repeat_item = downloaded_items[repeat_index % len(downloaded_items)]
+            source_number = repeat_index % downloaded_count + 1
+            repeat_item = downloaded_items[source_number - 1]
             repeat_index += 1
 
-            item_id = repeat_item["Id"]
             output_path = os.path.join(full_path, f"{success_count + 1}.jpg")
+            shutil.copyfile(
+                os.path.join(full_path, f"{source_number}.jpg"), output_path
+            )
+            success_count += 1
+            manifest.append(
+                make_manifest_entry(repeat_item, os.path.basename(output_path))
+            )
 
-            if download_image(item_id, output_path, success_count + 1):
-                success_count += 1
+    write_poster_manifest(full_path, manifest)
 
     return success_count
 
 
-def download_posters_workflow(parent_id, name):
+def select_library_items(parent_id, count):
+    """
+    选择媒体库中用于生成海报的媒体项
+
+    优先从本地索引选择，索引不可用时从服务器获取完整列表；
+    随机选择时使用按媒体库确定的种子，相同输入总是选出相同的媒体项
+
+    返回:
+        选定的媒体项列表，没有可用的媒体项时返回空列表
+    """
+    # 优先从本地索引选择媒体项，索引不可用时从服务器获取完整列表
+    selected_items = None
+    if config.LIBRARY_INDEX_CONFIG["ENABLED"]:
+        try:
+            library_index.sync_library(parent_id)
+            rng = random.Random(make_render_seed(parent_id, []))
+            selected_items = library_index.select_items(parent_id, count, rng)
+        except Exception as e:
+            print(f"使用本地媒体索引时出错，改为从服务器获取: {e}")
+            selected_items = None
+
+    if selected_items is None:
+        # 获取媒体项列表（本地图片来源需要媒体项的 Path 字段）
+        extra_params = None
+        if config.IMAGE_SOURCE_CONFIG["TYPE"] == "local":
+            extra_params = {"Fields": "Path"}
+        items = get_items(parent_id, extra_params)
+        if not items:
+            return []
+
+        # 排序并选择媒体项
+        # 随机选择时使用按媒体库确定的种子，保证相同输入选出相同的海报
+        rng = random.Random(
+            make_render_seed(
+                parent_id, sorted(item.get("Id", "") for item in items)
+            )
+        )
+        selected_items = sort_and_select_items(items, count, rng)
+    return selected_items
+
+
+def download_posters_workflow(parent_id, name, count=None, max_width=None):
     """
     封装整个下载海报的工作流程，供main.py调用
 
+    参数:
+        parent_id: 媒体库 ID
+        name: 媒体库名称
+        count: 要下载的海报数量，为None时使用 POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
+        max_width: 请求服务器缩放后的最大宽度（海报墙使用），为None时下载原图
+
     返回:
         tuple: (成功标志, 下载的海报数量, 配置信息)
     """
@@ -287,31 +454,37 @@ def download_posters_workflow(parent_id, name):
         print(f"[2/4] 下载[{name}]海报...")
         print("-" * 40)
 
+        if count is None:
+            count = config.POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
+
         # 确保海报文件夹存在
-        full_path = ensure_poster_directory(config.POSTER_FOLDER, name)
+        full_path = ensure_poster_directory(config.get_poster_folder(), name)
 
-        # 获取媒体项列表
-        items = get_items(parent_id)
-        if not items:
+        selected_items = select_library_items(parent_id, count)
+        if not selected_items:
             print(f"[{name}]没有可用的媒体封面")
             return False, 0
 
-        # 排序并选择媒体项
-        selected_items = sort_and_select_items(
-            items, config.POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
+        journal.mark_stage(
+            parent_id,
+            name,
+            "selected",
+            make_cache_key(
+                [
+                    (item.get("Id"), (item.get("ImageTags") or {}).get("Primary"))
+                    for item in selected_items
+                ]
+            ),
         )
-        if not selected_items:
-            print(f"[{name}]没有可用的媒体封面")
-            return False, 0
 
         # 下载所有海报
-        success_count = download_all_posters(selected_items, full_path)
+        success_count = download_all_posters(
+            selected_items, full_path, count, max_width
+        )
 
         # 输出结果
         if success_count > 0:
-            print(
-                f"\n成功下载 {success_count}/{config.POSTER_DOWNLOAD_CONFIG['POSTER_COUNT']} 张海报"
-            )
+            print(f"\n成功下载 {success_count}/{count} 张海报")
             print(f"海报已保存到: {full_path}")
             return True, success_count
         else:
@@ -0,0 +1,214 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+# 每个服务器的连接池大小
+POOL_SIZE = 8
+
+# 视为服务器过载的状态码
+OVERLOAD_STATUS_CODES = (429, 503)
+
+# 每个服务器一个 Session，复用连接
+_SESSIONS = {}
+
+# 每个服务器一个自适应限流器
+_LIMITERS = {}
+
+_SESSIONS_LOCK = threading.Lock()
+
+
+class AdaptiveLimiter:
+    """
+    自适应并发限制（AIMD）
+
+    请求成功且延迟低于目标值时逐步增加并发上限（每完成"当前上限"个请求加 1），
+    遇到 429/503、超时或延迟远超目标值时把上限减半，
+    保证尽量快地完成任务，同时在服务器繁忙（如正在转码播放）时主动让路
+    """
+
+    def __init__(
+        self,
+        min_limit=1,
+        max_limit=8,
+        initial_limit=4,
+        target_latency=1.5,
+        max_bytes_per_second=0,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.target_latency = target_latency
+        self.max_bytes_per_second = max_bytes_per_second
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.decreases = 0
+        self.bytes = 0
+
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._next_send_time = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """等待可用的并发名额"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def release(self, latency, error=False):
+        """
+        归还并发名额并根据结果调整上限
+
+        参数:
+            latency: 请求耗时（秒）
+            error: 是否为过载类错误（429/503/超时）
+        """
+        with self._condition:
+            self.in_flight -= 1
+            self.requests += 1
+
+            now = time.monotonic()
+            overloaded = error or latency > self.target_latency * 2
+            if error:
+                self.errors += 1
+
+            if overloaded:
+                # 同一个延迟窗口内只减半一次，避免并发请求同时失败导致上限骤降
+                if now - self._last_decrease > self.target_latency:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.decreases += 1
+                    self._last_decrease = now
+                self._successes = 0
+            elif latency <= self.target_latency:
+                self._successes += 1
+                if self._successes >= int(self.limit):
+                    self.limit = min(self.max_limit, self.limit + 1)
+                    self._successes = 0
+
+            self._condition.notify_all()
+
+    def throttle(self, size):
+        """按字节速率上限限速（令牌桶），size 为本次传输的字节数"""
+        with self._condition:
+            self.bytes += size
+            if not self.max_bytes_per_second:
+                return
+            now = time.monotonic()
+            start = max(now, self._next_send_time)
+            self._next_send_time = start + size / self.max_bytes_per_second
+            wait = self._next_send_time - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def stats(self):
+        """当前限流状态，用于运行统计"""
+        with self._condition:
+            return {
+                "limit": int(self.limit),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "requests": self.requests,
+                "errors": self.errors,
+                "decreases": self.decreases,
+                "bytes": self.bytes,
+            }
+
+
+def _server_key():
+    """当前服务器在连接池和限流器中的键"""
+    server = config.get_server_config()
+    return (server["NAME"], server["BASE_URL"])
+
+
+def get_session():
+    """获取当前服务器的 Session（按服务器地址和名称区分，线程安全）"""
+    key = _server_key()
+
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=max(POOL_SIZE, config.HTTP_LIMIT_CONFIG["MAX_CONCURRENCY"]),
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSIONS[key] = session
+    return session
+
+
+def get_limiter():
+    """获取当前服务器的自适应限流器"""
+    key = _server_key()
+
+    with _SESSIONS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if limiter is None:
+            limit_config = config.HTTP_LIMIT_CONFIG
+            limiter = AdaptiveLimiter(
+                min_limit=limit_config["MIN_CONCURRENCY"],
+                max_limit=limit_config["MAX_CONCURRENCY"],
+                initial_limit=limit_config["INITIAL_CONCURRENCY"],
+                target_latency=limit_config["TARGET_LATENCY_MS"] / 1000.0,
+                max_bytes_per_second=limit_config["MAX_BYTES_PER_SECOND"],
+            )
+            _LIMITERS[key] = limiter
+    return limiter
+
+
+def get_stats():
+    """当前服务器的限流统计"""
+    return get_limiter().stats()
+
+
+def request(method, url, **kwargs):
+    """
+    使用当前服务器的连接池发送请求，参数与 requests.request 相同
+
+    请求经过自适应限流器；响应内容在占用并发名额期间读取完毕，
+    因此 stream=True 时仍可照常使用 iter_content
+    """
+    limiter = get_limiter()
+    session = get_session()
+
+    data = kwargs.get("data")
+    if isinstance(data, (bytes, str)):
+        limiter.throttle(len(data))
+
+    limiter.acquire()
+    started = time.monotonic()
+    error = False
+    try:
+        response = session.request(method, url, **kwargs)
+        content = response.content
+        error = response.status_code in OVERLOAD_STATUS_CODES
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+        error = True
+        raise
+    finally:
+        limiter.release(time.monotonic() - started, error)
+
+    limiter.throttle(len(content or b""))
+    return response
+
+
+def get(url, **kwargs):
+    """发送 GET 请求"""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """发送 POST 请求"""
+    return request("POST", url, **kwargs)
@@ -0,0 +1,119 @@
+import os
+import shutil
+
+import config
+import get_poster
+
+# 媒体文件夹中常见的海报文件名
+LOCAL_POSTER_NAMES = ["poster", "folder", "cover"]
+LOCAL_POSTER_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
+
+
+def rewrite_path(path):
+    """
+    按配置的前缀替换规则，把服务器上的路径转换为本机路径
+
+    例如服务器路径 /media/Movie/xxx 在本机挂载为 /mnt/media/Movie/xxx 时，
+    配置 {"from": "/media", "to": "/mnt/media"}
+    """
+    for rule in config.IMAGE_SOURCE_CONFIG["PATH_REWRITES"]:
+        prefix = rule.get("from", "")
+        if prefix and path.startswith(prefix):
+            return rule.get("to", "") + path[len(prefix) :]
+    return path
+
+
+def get_local_candidates(item):
+    """
+    根据媒体项的 Path 和 ID 列出可能的本地海报文件
+
+    返回:
+        候选文件路径列表（按优先级排列）
+    """
+    candidates = []
+
+    item_path = item.get("Path")
+    if item_path:
+        local_path = rewrite_path(item_path)
+        if os.path.isdir(local_path):
+            folder = local_path
+            stems = LOCAL_POSTER_NAMES
+        else:
+            # 电影文件：同目录下的 <文件名>-poster.jpg，以及 poster.jpg/folder.jpg
+            folder = os.path.dirname(local_path)
+            file_stem = os.path.splitext(os.path.basename(local_path))[0]
+            stems = [f"{file_stem}-poster"] + LOCAL_POSTER_NAMES
+
+        for stem in stems:
+            for ext in LOCAL_POSTER_EXTENSIONS:
+                candidates.append(os.path.join(folder, stem + ext))
+
+    # 服务器元数据目录：<metadata>/library/<ID前两位>/<ID>/poster.jpg
+    metadata_dir = config.IMAGE_SOURCE_CONFIG["METADATA_DIR"]
+    item_id = item.get("Id")
+    if metadata_dir and item_id:
+        item_dir = os.path.join(metadata_dir, "library", item_id[:2], item_id)
+        for stem in LOCAL_POSTER_NAMES:
+            for ext in LOCAL_POSTER_EXTENSIONS:
+                candidates.append(os.path.join(item_dir, stem + ext))
+
+    return candidates
+
+
+def fetch_local_image(item, output_path, index, max_width=None):
+    """
+    从本地媒体文件夹或元数据目录读取海报
+
+    使用 shutil.copyfile 复制，在 Linux 上通过 sendfile 在内核中完成，不经过用户态缓冲；
+    本地图片总是原图，max_width 只对 HTTP 下载有效
+
+    返回:
+        bool: 是否找到并复制成功
+    """
+    for candidate in get_local_candidates(item):
+        if not os.path.isfile(candidate):
+            continue
+        try:
+            shutil.copyfile(candidate, output_path)
+            return True
+        except OSError as e:
+            print(f"读取本地图片 {index} 失败: {candidate}: {e}")
+    return False
+
+
+def fetch_http_image(item, output_path, index, max_width=None):
+    """通过服务器 API 下载海报，指定 max_width 时由服务器缩放"""
+    return get_poster.download_image(item["Id"], output_path, index, max_width)
+
+
+# 可用的图片来源
+IMAGE_SOURCES = {
+    "local": fetch_local_image,
+    "http": fetch_http_image,
+}
+
+
+def fetch_image(item, output_path, index, max_width=None):
+    """
+    按配置的图片来源获取海报，本地找不到时回退到 HTTP 下载
+
+    参数:
+        item: 媒体项字典（需包含 Id，本地来源还需要 Path）
+        output_path: 保存路径
+        index: 海报序号（用于日志）
+        max_width: 请求服务器缩放后的最大宽度，为None时获取原图
+
+    返回:
+        bool: 是否成功
+    """
+    source_type = config.IMAGE_SOURCE_CONFIG["TYPE"]
+    source = IMAGE_SOURCES.get(source_type)
+    if source is None:
+        print(f"不支持的图片来源: {source_type}，使用 HTTP 下载")
+        source = fetch_http_image
+
+    if source(item, output_path, index, max_width):
+        return True
+    if source is not fetch_http_image:
+        return fetch_http_image(item, output_path, index, max_width)
+    return False
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import config
+from cache import atomic_write_bytes
+from gen_poster import get_format_output_path
+
+# 每个媒体库依次经历的阶段
+STAGES = ["listed", "selected", "downloaded", "rendered", "uploaded"]
+
+# 多服务器并行时共用一把锁，保证日志的读改写不交错
+_JOURNAL_LOCK = threading.RLock()
+
+
+def get_journal_path():
+    """当前服务器的运行日志路径（多服务器时按服务器名称区分）"""
+    server_key = config.get_server_key()
+    file_name = f"journal_{server_key}.json" if server_key else "journal.json"
+    return os.path.join(config.CACHE_FOLDER, file_name)
+
+
+def file_hash(path):
+    """计算文件的 sha1，文件不存在时返回 None"""
+    digest = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _load():
+    """读取运行日志，不存在或损坏时返回 None"""
+    try:
+        with open(get_journal_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(journal):
+    """以原子方式写入运行日志，进程中断时不会留下半个文件"""
+    data = json.dumps(journal, ensure_ascii=False, indent=2).encode("utf-8")
+    atomic_write_bytes(get_journal_path(), data)
+
+
+def start_run(resume=False):
+    """
+    开始一次运行
+
+    参数:
+        resume: 为 True 时沿用上次未完成的运行日志，否则重新开始
+
+    返回:
+        bool: 是否从上次中断的位置继续
+    """
+    with _JOURNAL_LOCK:
+        journal = _load()
+        if resume and journal is not None and not journal.get("finished"):
+            print(f"从上次中断的运行继续（开始于 {journal.get('started', '')}）")
+            return True
+
+        if resume:
+            print("没有未完成的运行记录，从头开始")
+        _save(
+            {
+                "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "finished": False,
+                "libraries": {},
+            }
+        )
+        return False
+
+
+def finish_run():
+    """标记本次运行已全部完成，下次 --resume 将从头开始"""
+    with _JOURNAL_LOCK:
+        journal = _load()
+        if journal is None:
+            return
+        journal["finished"] = True
+        _save(journal)
+
+
+def mark_stage(library_id, name, stage, artefact_hash=None):
+    """
+    记录媒体库完成了某个阶段
+
+    参数:
+        library_id: 媒体库 ID
+        name: 媒体库名称
+        stage: 阶段名称（STAGES 之一）
+        artefact_hash: 该阶段产物的哈希，继续运行时用于确认产物未被修改
+    """
+    with _JOURNAL_LOCK:
+        journal = _load() or {"started": "", "finished": False, "libraries": {}}
+        entry = journal["libraries"].setdefault(
+            library_id, {"name": name, "stages": {}}
+        )
+        entry["name"] = name
+        # 重新执行某个阶段时，之后阶段的记录都已失效
+        for later in STAGES[STAGES.index(stage) + 1 :]:
+            entry["stages"].pop(later, None)
+        entry["stages"][stage] = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "hash": artefact_hash,
+        }
+        _save(journal)
+
+
+def get_poster_manifest_path(name):
+    """媒体库海报清单路径，作为下载阶段的产物"""
+    return os.path.join(config.get_poster_folder(), name, config.POSTER_MANIFEST)
+
+
+def get_output_path(name):
+    """媒体库生成的海报路径（第一个输出格式）"""
+    return os.path.join(config.get_output_folder(), f"{name}.png")
+
+
+def outputs_hash(name):
+    """
+    媒体库所有输出格式图片的组合哈希，作为生成和上传阶段的产物
+
+    返回:
+        sha1 十六进制字符串，任意一个输出文件不存在时返回 None
+    """
+    base_path = get_output_path(name)
+    hashes = []
+    for index, output_format in enumerate(config.OUTPUT_FORMATS):
+        file_hash_value = file_hash(
+            get_format_output_path(base_path, index, output_format)
+        )
+        if file_hash_value is None:
+            return None
+        hashes.append(file_hash_value)
+    return hashlib.sha1("".join(hashes).encode("utf-8")).hexdigest()
+
+
+def get_completed_stage(library_id, name):
+    """
+    获取媒体库最后完成且产物仍然有效的阶段
+
+    下载阶段检查海报清单的哈希，生成和上传阶段检查所有输出格式图片的哈希，
+    产物缺失或被修改时退回到更早的阶段
+
+    返回:
+        阶段名称，没有记录时返回 None
+    """
+    with _JOURNAL_LOCK:
+        journal = _load()
+    if journal is None:
+        return None
+
+    entry = journal["libraries"].get(library_id)
+    if entry is None:
+        return None
+
+    artefact_hashes = {
+        "downloaded": lambda: file_hash(get_poster_manifest_path(name)),
+        "rendered": lambda: outputs_hash(name),
+        "uploaded": lambda: outputs_hash(name),
+    }
+
+    for stage in reversed(STAGES):
+        record = entry["stages"].get(stage)
+        if record is None:
+            continue
+        current_hash = artefact_hashes.get(stage)
+        if current_hash is not None and current_hash() != record.get("hash"):
+            continue
+        return stage
+    return None
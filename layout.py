@@ -0,0 +1,388 @@
+import math
+import threading
+from collections import OrderedDict
+
+from cache import make_cache_key
+
+# 每张海报阴影的偏移量与模糊半径（与 gen_poster_workflow 中 add_shadow 的参数一致）
+SHADOW_OFFSET = 20
+SHADOW_BLUR = 20
+SHADOW_PADDING = SHADOW_OFFSET + SHADOW_BLUR * 2
+
+# 默认布局中每列的额外偏移 (dx, dy)：中间列左移 50，右侧列左移 40 并上移 155
+DEFAULT_COLUMN_OFFSETS = ((0, 0), (-50, 0), (-40, -155))
+
+# 布局参数和标题位置按该画布尺寸设计，其他尺寸的画布按比例缩放
+DESIGN_SIZE = (1920, 1080)
+
+# 已编译的布局，键为 (布局参数, 画布尺寸, 缩放比例) 的哈希；
+# 生成服务的画布尺寸来自请求参数，只保留最近使用的 MAX_COMPILED_LAYOUTS 个
+_COMPILED_LAYOUTS = OrderedDict()
+_COMPILED_LOCK = threading.Lock()
+MAX_COMPILED_LAYOUTS = 32
+
+# 双三次插值会影响到周围约 2 像素，判断可见性时额外留出余量
+VISIBLE_MARGIN = 3
+
+
+def scale_shadow(scale=1.0, offset=SHADOW_OFFSET, blur=SHADOW_BLUR):
+    """
+    按缩放比例计算海报阴影参数
+
+    返回:
+        (偏移量, 模糊半径, 贴图四周留白)，使用默认参数且 scale 为 1 时与 SHADOW_* 常量一致
+    """
+    offset = max(1, round(offset * scale))
+    blur = max(1, round(blur * scale))
+    return offset, blur, offset + blur * 2
+
+
+def get_column_offset(col_index, cell_width, column_offsets, scale=1.0):
+    """
+    获取每一列相对默认位置的偏移 (dx, dy)
+
+    每列向右错开一个海报宽度，再加上布局中该列的额外偏移（按设计尺寸填写，随缩放比例缩放），
+    未配置额外偏移的列不偏移
+
+    参数:
+        col_index: 列索引
+        cell_width: 海报宽度（已缩放）
+        column_offsets: 每列的额外偏移 [(dx, dy), ...]
+        scale: 缩放比例
+
+    返回:
+        (dx, dy)
+    """
+    extra_x, extra_y = (0, 0)
+    if col_index < len(column_offsets):
+        extra_x, extra_y = column_offsets[col_index]
+    return cell_width * col_index + round(extra_x * scale), round(extra_y * scale)
+
+
+def _rotation_matrix(width, height, angle):
+    """
+    按 PIL Image.rotate(expand=True) 的方式计算旋转矩阵
+
+    返回:
+        (逆变换矩阵 (a, b, c, d, e, f), 旋转后的尺寸 (w, h))
+        逆变换把旋转后图像的坐标映射回原图坐标
+    """
+    center_x, center_y = width / 2.0, height / 2.0
+    rad = -math.radians(angle % 360.0)
+    matrix = [
+        round(math.cos(rad), 15),
+        round(math.sin(rad), 15),
+        0.0,
+        round(-math.sin(rad), 15),
+        round(math.cos(rad), 15),
+        0.0,
+    ]
+
+    def transform(x, y):
+        a, b, c, d, e, f = matrix
+        return a * x + b * y + c, d * x + e * y + f
+
+    matrix[2], matrix[5] = transform(-center_x, -center_y)
+    matrix[2] += center_x
+    matrix[5] += center_y
+
+    xx = []
+    yy = []
+    for x, y in ((0, 0), (width, 0), (width, height), (0, height)):
+        x, y = transform(x, y)
+        xx.append(x)
+        yy.append(y)
+    new_width = math.ceil(max(xx)) - math.floor(min(xx))
+    new_height = math.ceil(max(yy)) - math.floor(min(yy))
+
+    matrix[2], matrix[5] = transform(
+        -(new_width - width) / 2.0, -(new_height - height) / 2.0
+    )
+    return tuple(matrix), (new_width, new_height)
+
+
+def _apply(matrix, x, y):
+    """对点应用仿射矩阵"""
+    a, b, c, d, e, f = matrix
+    return a * x + b * y + c, d * x + e * y + f
+
+
+def _invert(matrix):
+    """求仿射矩阵的逆矩阵"""
+    a, b, c, d, e, f = matrix
+    det = a * e - b * d
+    ia, ib, id_, ie = e / det, -b / det, -d / det, a / det
+    return (ia, ib, -(ia * c + ib * f), id_, ie, -(id_ * c + ie * f))
+
+
+def _bounding_box(matrix, rect):
+    """计算矩形经过仿射变换后的外接框"""
+    left, top, right, bottom = rect
+    points = [
+        _apply(matrix, x, y)
+        for x, y in ((left, top), (right, top), (right, bottom), (left, bottom))
+    ]
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return (
+        math.floor(min(xs)) - VISIBLE_MARGIN,
+        math.floor(min(ys)) - VISIBLE_MARGIN,
+        math.ceil(max(xs)) + VISIBLE_MARGIN,
+        math.ceil(max(ys)) + VISIBLE_MARGIN,
+    )
+
+
+def _intersect(box, canvas_size):
+    """求外接框与画布的交集，没有交集时返回 None"""
+    left = max(box[0], 0)
+    top = max(box[1], 0)
+    right = min(box[2], canvas_size[0])
+    bottom = min(box[3], canvas_size[1])
+    if left >= right or top >= bottom:
+        return None
+    return left, top, right, bottom
+
+
+def compute_layout(
+    canvas_size,
+    rows,
+    cols,
+    cell_width,
+    cell_height,
+    margin,
+    rotation_angle,
+    start_x,
+    start_y,
+    column_spacing,
+    scale=1.0,
+    column_offsets=DEFAULT_COLUMN_OFFSETS,
+    shadow_padding=None,
+):
+    """
+    预先计算海报墙的几何布局，找出旋转后完全落在画布外的海报
+
+    几何关系与原先"列画布 -> 1.5 倍对角线旋转画布 -> 旋转 -> 粘贴"的流程完全一致，
+    但只返回可见部分，渲染时可以跳过不可见的海报，并且只对可见区域做变换
+
+    scale 为缩放比例：尺寸参数需由调用方缩放，列的额外偏移在这里按比例缩放；
+    shadow_padding 为海报贴图四周的阴影留白（已缩放），为None时使用默认阴影参数
+
+    返回:
+        每一列的布局字典列表，字典包含:
+            index: 列索引
+            cells: 每张海报的 {row, poster_index, y, visible}
+            visible_cells: 可见海报的 (poster_index, y) 列表，渲染时直接使用
+            crop: 需要绘制的列画布纵向区域 (top, bottom)，没有可见海报时为 None
+            box: 该列在画布上的可见区域 (left, top, right, bottom)
+            matrix: 从可见区域坐标映射到裁剪后列画布坐标的仿射矩阵
+            inverse: 从画布坐标映射到（未裁剪的）列画布坐标的仿射矩阵
+            forward: inverse 的逆矩阵（列画布坐标到画布坐标）
+            pitch: 相邻两张海报在列画布上的纵向间隔
+    """
+    column_height = rows * cell_height + (rows - 1) * margin
+    if shadow_padding is None:
+        shadow_padding = scale_shadow(scale)[2]
+    sprite_width = cell_width + shadow_padding
+    sprite_height = cell_height + shadow_padding
+
+    # 旋转画布的尺寸和列在其中的位置
+    rotation_canvas_size = int(
+        math.sqrt(
+            (cell_width + shadow_padding) ** 2 + (column_height + shadow_padding) ** 2
+        )
+        * 1.5
+    )
+    paste_x = (rotation_canvas_size - cell_width) // 2
+    paste_y = (rotation_canvas_size - column_height) // 2
+
+    rotate_matrix, (rotated_width, rotated_height) = _rotation_matrix(
+        rotation_canvas_size, rotation_canvas_size, rotation_angle
+    )
+
+    columns = []
+    for col_index in range(cols):
+        column_x = start_x + col_index * column_spacing
+        offset_x, offset_y = get_column_offset(
+            col_index, cell_width, column_offsets, scale
+        )
+        column_center_x = column_x + offset_x
+        column_center_y = start_y + column_height // 2 + offset_y
+
+        final_x = column_center_x - rotated_width // 2 + cell_width // 2
+        final_y = column_center_y - rotated_height // 2
+
+        # 画布坐标 -> 列画布坐标 的逆变换
+        a, b, c, d, e, f = rotate_matrix
+        inverse = (
+            a,
+            b,
+            c - a * final_x - b * final_y - paste_x,
+            d,
+            e,
+            f - d * final_x - e * final_y - paste_y,
+        )
+        forward = _invert(inverse)
+
+        cells = []
+        visible_boxes = []
+        for row_index in range(rows):
+            y_position = row_index * (cell_height + margin)
+            box = _bounding_box(
+                forward,
+                (0, y_position, sprite_width, y_position + sprite_height),
+            )
+            clipped = _intersect(box, canvas_size)
+            cells.append(
+                {
+                    "row": row_index,
+                    "poster_index": col_index * rows + row_index,
+                    "y": y_position,
+                    "visible": clipped is not None,
+                }
+            )
+            if clipped is not None:
+                visible_boxes.append(clipped)
+
+        column = {
+            "index": col_index,
+            "cells": cells,
+            "visible_cells": [
+                (cell["poster_index"], cell["y"]) for cell in cells if cell["visible"]
+            ],
+            "crop": None,
+            "box": None,
+            "inverse": inverse,
+            "forward": forward,
+            "pitch": cell_height + margin,
+        }
+
+        if visible_boxes:
+            visible_rows = [cell for cell in cells if cell["visible"]]
+            crop_top = visible_rows[0]["y"]
+            crop_bottom = visible_rows[-1]["y"] + sprite_height
+            box = (
+                min(b[0] for b in visible_boxes),
+                min(b[1] for b in visible_boxes),
+                max(b[2] for b in visible_boxes),
+                max(b[3] for b in visible_boxes),
+            )
+            a, b, c, d, e, f = inverse
+            column["crop"] = (crop_top, crop_bottom)
+            column["box"] = box
+            # 平移到可见区域原点，并减去裁剪掉的列画布顶部
+            column["matrix"] = (
+                a,
+                b,
+                c + a * box[0] + b * box[1],
+                d,
+                e,
+                f + d * box[0] + e * box[1] - crop_top,
+            )
+
+        columns.append(column)
+
+    return columns
+
+
+def compile_layout(spec, canvas_size, scale=1.0):
+    """
+    把声明式的布局参数编译为渲染计划，相同参数只编译一次
+
+    布局参数（即 POSTER_GEN_CONFIG 的格式）包括网格（ROWS/COLS/CELL_*/MARGIN/
+    START_*/COLUMN_SPACING/ROTATION_ANGLE）、每列偏移 COLUMN_OFFSETS、
+    阴影 SHADOW_*、文字 TEXTS 和装饰形状 ACCENTS，坐标都按 DESIGN_SIZE 填写
+
+    参数:
+        spec: 布局参数字典
+        canvas_size: 输出画布尺寸（未缩放）
+        scale: 额外的缩放比例（预览时小于 1）
+
+    返回:
+        dict: 渲染计划，包括
+            size: 画布尺寸
+            scale: 设计坐标到画布坐标的缩放比例
+            cell_size, corner_radius, shadow, sprite_size: 海报单元贴图参数
+            poster_count: 最多使用的海报数量
+            columns: compute_layout 的结果
+            texts, accents: 已换算为画布坐标的文字和装饰形状
+    """
+    key = make_cache_key("layout", spec, list(canvas_size), scale)
+    with _COMPILED_LOCK:
+        plan = _COMPILED_LAYOUTS.get(key)
+        if plan is not None:
+            _COMPILED_LAYOUTS.move_to_end(key)
+            return plan
+
+    width, height = canvas_size
+    size = (round(width * scale), round(height * scale))
+    scale = scale * min(width / DESIGN_SIZE[0], height / DESIGN_SIZE[1])
+
+    shadow_offset, shadow_blur, shadow_padding = scale_shadow(
+        scale,
+        spec.get("SHADOW_OFFSET", SHADOW_OFFSET),
+        spec.get("SHADOW_BLUR", SHADOW_BLUR),
+    )
+    shadow_color = tuple(spec.get("SHADOW_COLOR", (0, 0, 0, 255)))
+    cell_width = round(spec["CELL_WIDTH"] * scale)
+    cell_height = round(spec["CELL_HEIGHT"] * scale)
+
+    columns = compute_layout(
+        size,
+        spec["ROWS"],
+        spec["COLS"],
+        cell_width,
+        cell_height,
+        round(spec["MARGIN"] * scale),
+        spec["ROTATION_ANGLE"],
+        round(spec["START_X"] * scale),
+        round(spec["START_Y"] * scale),
+        round(spec["COLUMN_SPACING"] * scale),
+        scale=scale,
+        column_offsets=spec.get("COLUMN_OFFSETS", DEFAULT_COLUMN_OFFSETS),
+        shadow_padding=shadow_padding,
+    )
+
+    texts = []
+    for text in spec.get("TEXTS", []):
+        texts.append(
+            {
+                "role": text["role"],
+                "font": text["font"],
+                "position": (text["position"][0] * scale, text["position"][1] * scale),
+                "size": text["size"],
+                "fit_length": text.get("fit_length", 0),
+                "min_size": text.get("min_size", 0),
+            }
+        )
+
+    accents = []
+    for accent in spec.get("ACCENTS", []):
+        accents.append(
+            {
+                "shape": accent.get("shape", "rect"),
+                "role": accent.get("role", ""),
+                "position": (
+                    accent["position"][0] * scale,
+                    accent["position"][1] * scale,
+                ),
+                "size": (accent["size"][0] * scale, accent["size"][1] * scale),
+            }
+        )
+
+    plan = {
+        "size": size,
+        "scale": scale,
+        "cell_size": (cell_width, cell_height),
+        "corner_radius": spec["CORNER_RADIUS"] * scale,
+        "shadow": (shadow_offset, shadow_blur, shadow_color),
+        "sprite_size": (cell_width + shadow_padding, cell_height + shadow_padding),
+        "poster_count": spec["ROWS"] * spec["COLS"],
+        "columns": columns,
+        "texts": texts,
+        "accents": accents,
+    }
+    with _COMPILED_LOCK:
+        _COMPILED_LAYOUTS[key] = plan
+        while len(_COMPILED_LAYOUTS) > MAX_COMPILED_LAYOUTS:
+            _COMPILED_LAYOUTS.popitem(last=False)
+    return plan
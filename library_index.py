@@ -0,0 +1,217 @@
+import os
+import sqlite3
+import time
+
+import config
+import get_poster
+
+# 建立索引时需要服务器额外返回的字段
+INDEX_FIELDS = "DateCreated,DateLastSaved,DateLastMediaAdded,CommunityRating,Path"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT NOT NULL,
+    library_id TEXT NOT NULL,
+    name TEXT,
+    type TEXT,
+    date_created TEXT,
+    date_last_media_added TEXT,
+    date_last_saved TEXT,
+    sort_date TEXT,
+    primary_tag TEXT,
+    rating REAL,
+    play_count INTEGER,
+    path TEXT,
+    PRIMARY KEY (library_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_items_sort_date ON items (library_id, sort_date DESC);
+CREATE INDEX IF NOT EXISTS idx_items_rating ON items (library_id, rating DESC);
+CREATE TABLE IF NOT EXISTS sync_state (
+    library_id TEXT PRIMARY KEY,
+    last_saved TEXT,
+    last_full_sync REAL
+);
+"""
+
+
+def connect():
+    """打开索引数据库（每次调用使用独立连接，可在多线程中使用）"""
+    db_path = config.LIBRARY_INDEX_CONFIG["PATH"]
+    server_key = config.get_server_key()
+    if server_key:
+        # 多服务器时每个服务器使用独立的索引
+        root, ext = os.path.splitext(db_path)
+        db_path = f"{root}_{server_key}{ext}"
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir, exist_ok=True)
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    # 旧版本数据库没有 path 列
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(items)")]
+    if "path" not in columns:
+        conn.execute("ALTER TABLE items ADD COLUMN path TEXT")
+    return conn
+
+
+def _item_to_row(library_id, item):
+    """把服务器返回的媒体项转换为数据库行"""
+    date_last_media_added = item.get("DateLastMediaAdded") or None
+    date_created = item.get("DateCreated") or None
+    user_data = item.get("UserData") or {}
+    return (
+        item["Id"],
+        library_id,
+        item.get("Name", ""),
+        item.get("Type", ""),
+        date_created,
+        date_last_media_added,
+        item.get("DateLastSaved") or None,
+        # 与 sort_and_select_items 一致：优先 DateLastMediaAdded，其次 DateCreated
+        date_last_media_added or date_created,
+        (item.get("ImageTags") or {}).get("Primary"),
+        item.get("CommunityRating"),
+        user_data.get("PlayCount", 0),
+        item.get("Path"),
+    )
+
+
+def _upsert_items(conn, library_id, items):
+    """写入或更新媒体项"""
+    rows = [_item_to_row(library_id, item) for item in items if "Id" in item]
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO items (
+            id, library_id, name, type, date_created, date_last_media_added,
+            date_last_saved, sort_date, primary_tag, rating, play_count, path
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    return len(rows)
+
+
+def sync_library(library_id):
+    """
+    同步媒体库的本地索引
+
+    首次或距上次全量同步超过 FULL_SYNC_HOURS 时全量同步（可清除已删除的媒体项），
+    其余情况只按 MinDateLastSaved 获取上次同步后有变化的媒体项
+
+    返回:
+        本次写入的媒体项数量
+    """
+    full_sync_seconds = config.LIBRARY_INDEX_CONFIG["FULL_SYNC_HOURS"] * 3600
+
+    conn = connect()
+    try:
+        state = conn.execute(
+            "SELECT last_saved, last_full_sync FROM sync_state WHERE library_id = ?",
+            (library_id,),
+        ).fetchone()
+
+        full_sync = (
+            state is None
+            or not state["last_saved"]
+            or time.time() - (state["last_full_sync"] or 0) > full_sync_seconds
+        )
+
+        params = {"Fields": INDEX_FIELDS, "EnableUserData": "true"}
+        if not full_sync:
+            params["MinDateLastSaved"] = state["last_saved"]
+
+        items = get_poster.get_items(library_id, params)
+
+        # 请求失败时不修改索引和同步进度，下次从同一位置重新同步
+        if items is None:
+            print("获取媒体项失败，保留已有索引和同步进度")
+            return 0
+
+        # 下次增量同步的起点只取服务器返回的 DateLastSaved，不使用本地时钟，
+        # 没有返回任何日期时保留原来的起点
+        saved_dates = [
+            item["DateLastSaved"] for item in items if item.get("DateLastSaved")
+        ]
+        previous = state["last_saved"] if state is not None else None
+        last_saved = max(saved_dates + ([previous] if previous else []), default=None)
+
+        with conn:
+            if full_sync:
+                conn.execute("DELETE FROM items WHERE library_id = ?", (library_id,))
+            count = _upsert_items(conn, library_id, items)
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO sync_state (library_id, last_saved, last_full_sync)
+                VALUES (?, ?, ?)
+                """,
+                (
+                    library_id,
+                    last_saved,
+                    time.time() if full_sync else state["last_full_sync"],
+                ),
+            )
+
+        mode = "全量" if full_sync else "增量"
+        print(f"本地媒体索引{mode}同步完成，更新 {count} 个媒体项")
+        return count
+    finally:
+        conn.close()
+
+
+def _row_to_item(row):
+    """把数据库行转换为与服务器返回格式一致的媒体项字典"""
+    return {
+        "Id": row["id"],
+        "Name": row["name"],
+        "Type": row["type"],
+        "DateCreated": row["date_created"],
+        "DateLastMediaAdded": row["date_last_media_added"],
+        "CommunityRating": row["rating"],
+        "ImageTags": {"Primary": row["primary_tag"]},
+        "UserData": {"PlayCount": row["play_count"]},
+        "Path": row["path"],
+    }
+
+
+def select_items(library_id, count=9, rng=None):
+    """
+    从本地索引中选择媒体项，规则与 sort_and_select_items 相同：
+    只选有封面的项目，按日期降序；都没有日期时随机选择
+
+    返回:
+        媒体项字典列表
+    """
+    conn = connect()
+    try:
+        rows = conn.execute(
+            """
+            SELECT * FROM items
+            WHERE library_id = ? AND primary_tag IS NOT NULL AND sort_date IS NOT NULL
+            ORDER BY sort_date DESC
+            LIMIT ?
+            """,
+            (library_id, count),
+        ).fetchall()
+
+        if not rows:
+            rows = conn.execute(
+                """
+                SELECT * FROM items
+                WHERE library_id = ? AND primary_tag IS NOT NULL
+                ORDER BY id
+                """,
+                (library_id,),
+            ).fetchall()
+            if rows and rng is not None:
+                rows = rng.sample(rows, min(count, len(rows)))
+            rows = rows[:count]
+
+        print(f"已从本地索引选择 {len(rows)} 个媒体项")
+        return [_row_to_item(row) for row in rows]
+    finally:
+        conn.close()
+
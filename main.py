@@ -1,74 +1,302 @@
+import argparse
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # 导入自定义模块
+import animation
 import config
+import http_client
+import journal
+import poster_wall
 from gen_poster import gen_poster_workflow
 from get_library import get_libraries
+from planner import build_work_plan, print_work_plan
+from render_scheduler import get_scheduler, run_render_job
 
 
 from get_poster import download_posters_workflow
-from update_poster import upload_poster_workflow
+from update_poster import get_upload_stats, upload_poster_workflow
 
 
-def main():
+def new_report(server):
+    """创建服务器的工作统计"""
+    return {
+        "server": server["NAME"] or server["BASE_URL"],
+        "libraries": 0,
+        "skipped": 0,
+        "rendered": 0,
+        "uploaded": 0,
+        "failed": 0,
+        "seconds": 0.0,
+    }
+
+
+def process_library(entry, resume=False):
     """
-    主函数：先下载海报，然后生成九宫格海报，最后上传到 Jellyfin
+    处理一个媒体库：下载海报、生成九宫格海报、上传
+
+    参数:
+        entry: 工作计划中的一项
+        resume: 为 True 时根据运行日志跳过已经完成的阶段
+
+    返回:
+        dict: 本媒体库的统计增量（rendered/uploaded/failed）
     """
-    print("=" * 50)
-    print(f"开始执行 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 50)
+    result = {"rendered": 0, "uploaded": 0, "failed": 0}
+    library = entry["library"]
+    print(f"找到媒体库: {library['Name']} (ID: {library['Id']})")
 
-    # 1. 获取媒体库列表
+    completed = None
+    if resume:
+        completed = journal.get_completed_stage(library["Id"], library["Name"])
+        if completed:
+            print(f"[{library['Name']}]上次已完成阶段: {completed}")
+    if completed is None:
+        journal.mark_stage(library["Id"], library["Name"], "listed")
+    done = journal.STAGES.index(completed) if completed else -1
+
+    # 海报墙需要更多海报，由服务器缩小后再下载
+    wall = poster_wall.is_wall_library(library)
+
+    # 3. 下载海报
+    if done < journal.STAGES.index("downloaded"):
+        if wall:
+            success, _ = download_posters_workflow(
+                library["Id"],
+                library["Name"],
+                poster_wall.get_wall_poster_count(),
+                config.POSTER_WALL_CONFIG["THUMBNAIL_WIDTH"],
+            )
+        else:
+            success, _ = download_posters_workflow(library["Id"], library["Name"])
+
+        if not success:
+            print(f"下载海报失败: {library['Name']} (ID: {library['Id']})")
+            result["failed"] += 1
+            return result
+        journal.mark_stage(
+            library["Id"],
+            library["Name"],
+            "downloaded",
+            journal.file_hash(journal.get_poster_manifest_path(library["Name"])),
+        )
+
+    # 4. 生成九宫格海报
+    if done < journal.STAGES.index("rendered"):
+        if wall:
+            rendered = run_render_job(
+                poster_wall.render_wall_workflow,
+                library["Name"],
+                library["Id"],
+                memory_estimate=poster_wall.estimate_wall_memory(),
+            )
+        else:
+            rendered = run_render_job(
+                gen_poster_workflow, library["Name"], library["Id"]
+            )
+        if not rendered:
+            result["failed"] += 1
+            return result
+        journal.mark_stage(
+            library["Id"],
+            library["Name"],
+            "rendered",
+            journal.outputs_hash(library["Name"]),
+        )
+    result["rendered"] += 1
+
+    # 动态海报只在本地生成，不上传；失败时不影响静态海报
+    if not wall and animation.is_animated_library(library):
+        animation_path = animation.get_animation_path(library["Name"])
+        if done < journal.STAGES.index("rendered") or not os.path.exists(
+            animation_path
+        ):
+            if not run_render_job(
+                animation.render_animation_workflow,
+                library["Name"],
+                library["Id"],
+                memory_estimate=animation.estimate_animation_memory(),
+            ):
+                print(f"[{library['Name']}]动态海报生成失败")
+
+    # 5. 上传海报到Jellyfin
+    if entry["action"] == "upload":
+        if done >= journal.STAGES.index("uploaded"):
+            print(f"[{library['Name']}]海报已上传，跳过")
+            result["uploaded"] += 1
+            return result
+        print(f"[2/4] 上传[{library['Name']}]海报...")
+        print("-" * 40)
+        if upload_poster_workflow(library["Id"], library["Name"]):
+            result["uploaded"] += 1
+            journal.mark_stage(
+                library["Id"],
+                library["Name"],
+                "uploaded",
+                journal.outputs_hash(library["Name"]),
+            )
+        else:
+            result["failed"] += 1
+    else:
+        print(f"[2/4] 不更新[{library['Name']}]海报更新...")
+        print("-" * 40)
 
+    return result
+
+
+def run_server(resume=False):
+    """
+    处理当前服务器的所有媒体库：下载海报、生成九宫格海报、上传
+
+    参数:
+        resume: 为 True 时根据运行日志跳过每个媒体库已经完成的阶段
+
+    返回:
+        dict: 本服务器的工作统计
+    """
+    report = new_report(config.get_server_config())
+    started = time.time()
+    resume = journal.start_run(resume)
+
+    # 1. 获取媒体库列表
     libraries = get_libraries()
     if not libraries:
         print("未能获取媒体库列表，程序退出")
-        return
+        report["seconds"] = time.time() - started
+        return report
 
+    report["libraries"] = len(libraries)
     print(f"成功获取到 {len(libraries)} 个媒体库:")
     for i, library in enumerate(libraries, 1):
         print(f"  {i}. {library['Name']} (ID: {library['Id']})")
 
-    # 这里可以根据需要选择特定的媒体库
-    # 例如，选择名为"Anime"的媒体库
-    target_library = None
+    # 2. 在下载之前确定每个媒体库要做的工作，被排除的媒体库不会产生任何下载和生成
+    plan = build_work_plan(libraries)
+    print_work_plan(plan)
 
-    for library in libraries:
-        print(f"找到媒体库: {library['Name']} (ID: {library['Id']})")
-        # 2. 下载海报（这里假设您有一个函数来下载特定媒体库的海报）
+    # 多个媒体库同时处理，海报生成按内存预算排队
+    server = config.get_server_config()
 
-        success = download_posters_workflow(library["Id"], library["Name"])
+    def process(entry):
+        with config.use_server(server):
+            return process_library(entry, resume)
 
-        if not success:
-            print(f"下载海报失败: {library['Name']} (ID: {library['Id']})")
-            continue
-
-        # 3. 生成九宫格海报
-        gen_poster_workflow(library["Name"])
-        # 4. 上传海报到Jellyfin
-
-        if config.JELLYFIN_CONFIG["UPDATE_POSTER"]:  # 检查是否需要更新海报
-            if library["Name"] not in config.EXCLUDE_LIBRARY:
-                print(f"[2/4] 上传[{library['Name']}]海报...")
-                print("-" * 40)
-                upload_poster_workflow(library["Id"], library["Name"])
-            else:
-                print(f"[2/4] 不更新[{library['Name']}]海报更新...")
-                print("-" * 40)
-        else:
-            print(f"[2/4] 不更新[{library['Name']}]海报更新...")
-            print("-" * 40)
+    work = [entry for entry in plan if entry["action"] != "skip"]
+    report["skipped"] = len(plan) - len(work)
+    max_jobs = max(1, min(len(work), config.RENDER_MEMORY_CONFIG["MAX_JOBS"]))
+    if max_jobs == 1:
+        results = [process(entry) for entry in work]
+    else:
+        with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+            results = list(executor.map(process, work))
+
+    for result in results:
+        for key in ("rendered", "uploaded", "failed"):
+            report[key] += result[key]
+
+    journal.finish_run()
+    report["seconds"] = time.time() - started
+    report["http"] = http_client.get_stats()
+    report["images"] = get_upload_stats()
+    return report
+
+
+def run_server_in_thread(server, resume=False):
+    """在线程中切换到指定服务器并处理"""
+    with config.use_server(server):
+        try:
+            return run_server(resume)
+        except Exception as e:
+            print(f"处理服务器 {server['NAME']} 时出错: {e}")
+            report = new_report(server)
+            report["failed"] = 1
+            return report
+
+
+def print_reports(reports):
+    """打印每个服务器的工作统计"""
+    print("\n各服务器处理结果:")
+    for report in reports:
+        print(
+            f"  {report['server']}: 媒体库 {report['libraries']} 个，"
+            f"生成 {report['rendered']} 个，上传 {report['uploaded']} 个，"
+            f"跳过 {report['skipped']} 个，失败 {report['failed']} 个，"
+            f"耗时 {report['seconds']:.1f} 秒"
+        )
+        image_stats = report.get("images")
+        if image_stats and (image_stats["uploaded"] or image_stats["skipped"]):
+            print(
+                f"    图片上传 {image_stats['uploaded']} 张，"
+                f"未变化跳过 {image_stats['skipped']} 张，"
+                f"失败 {image_stats['failed']} 张"
+            )
+        http_stats = report.get("http")
+        if http_stats:
+            print(
+                f"    请求 {http_stats['requests']} 次，过载 {http_stats['errors']} 次，"
+                f"并发上限 {http_stats['limit']}（{http_stats['min_limit']}-"
+                f"{http_stats['max_limit']}），最大并发 {http_stats['max_in_flight']}，"
+                f"传输 {http_stats['bytes'] / 1024 / 1024:.1f} MB"
+            )
+
+
+def main(resume=False):
+    """
+    主函数：先下载海报，然后生成九宫格海报，最后上传到 Jellyfin
+    配置了多个服务器时并行处理，各服务器共用字体、调色板和海报缓存
+
+    参数:
+        resume: 为 True 时从上次中断的位置继续
+    """
+    print("=" * 50)
+    print(f"开始执行 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 50)
+
+    if len(config.SERVERS) == 1:
+        reports = [run_server_in_thread(config.SERVERS[0], resume)]
+    else:
+        print(f"共 {len(config.SERVERS)} 个服务器，并行处理")
+        with ThreadPoolExecutor(max_workers=len(config.SERVERS)) as executor:
+            reports = list(
+                executor.map(
+                    run_server_in_thread,
+                    config.SERVERS,
+                    [resume] * len(config.SERVERS),
+                )
+            )
+
+    print_reports(reports)
+
+    render_stats = get_scheduler().stats()
+    print(
+        f"  海报生成: {render_stats['jobs']} 次，内存预算 "
+        f"{render_stats['budget'] / 1024 / 1024:.0f} MB，"
+        f"预计峰值 {render_stats['peak_used'] / 1024 / 1024:.0f} MB，"
+        f"排队 {render_stats['waits']} 次，估算系数 {render_stats['factor']}"
+    )
 
     print("\n所有任务已完成")
     print("=" * 50)
 
 
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="生成媒体库九宫格海报并上传")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="从上次中断的位置继续，跳过每个媒体库已经完成的阶段",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        main()
+        main(resume=args.resume)
         input("\n按回车键退出...")
     except Exception as e:
         print(f"程序运行出错: {e}")
@@ -0,0 +1,169 @@
+import colorsys
+import json
+import os
+import threading
+
+from PIL import Image
+
+from cache import atomic_write_bytes, get_cache_dir, make_cache_key
+
+# 提取主色时使用的缩略图边长
+PALETTE_SAMPLE_SIZE = 64
+
+# 每张海报提取的颜色数量
+PALETTE_COLOR_COUNT = 5
+
+# 已读取的调色板：{(item_id, image_tag): [(r, g, b), ...]}
+_PALETTE_CACHE = {}
+
+# 多个服务器并行处理时共用同一份缓存
+_PALETTE_LOCK = threading.RLock()
+
+
+def _get_cache_path(item_id, image_tag):
+    """
+    调色板缓存文件路径
+
+    每个 (媒体项 ID, 图片标签) 保存为单独的小文件，
+    多个生成进程同时写入时不会覆盖彼此的结果
+    """
+    key = make_cache_key("palette", item_id, image_tag)
+    return os.path.join(get_cache_dir("palettes"), f"{key}.json")
+
+
+def get_cached_palette(item_id, image_tag):
+    """
+    根据 (媒体项 ID, 图片标签) 获取已缓存的调色板
+
+    返回:
+        颜色列表 [(r, g, b), ...]，没有缓存时返回 None
+    """
+    if not item_id or not image_tag:
+        return None
+    with _PALETTE_LOCK:
+        palette = _PALETTE_CACHE.get((item_id, image_tag))
+    if palette is not None:
+        return palette
+
+    try:
+        with open(_get_cache_path(item_id, image_tag), "r", encoding="utf-8") as f:
+            palette = [tuple(color) for color in json.load(f)]
+    except (OSError, ValueError, TypeError):
+        return None
+    with _PALETTE_LOCK:
+        _PALETTE_CACHE[(item_id, image_tag)] = palette
+    return palette
+
+
+def store_palette(item_id, image_tag, palette):
+    """保存调色板"""
+    with _PALETTE_LOCK:
+        _PALETTE_CACHE[(item_id, image_tag)] = palette
+    data = json.dumps([list(color) for color in palette]).encode("utf-8")
+    try:
+        atomic_write_bytes(_get_cache_path(item_id, image_tag), data)
+    except OSError as e:
+        print(f"警告: 保存调色板缓存失败: {e}")
+
+
+def extract_palette(img, count=PALETTE_COLOR_COUNT):
+    """
+    从已解码的图片中提取主色调色板
+
+    在不超过 64x64 的缩略图上做中位切分量化，按像素占比从高到低排序
+
+    参数:
+        img: PIL.Image对象
+        count: 颜色数量
+
+    返回:
+        颜色列表 [(r, g, b), ...]
+    """
+    small = img if img.mode == "RGB" else img.convert("RGB")
+    factor = max(1, min(small.width, small.height) // PALETTE_SAMPLE_SIZE)
+    if factor > 1:
+        small = small.reduce(factor)
+    if max(small.size) > PALETTE_SAMPLE_SIZE:
+        small = small.copy()
+        small.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+
+    quantized = small.quantize(colors=count, method=Image.Quantize.MEDIANCUT)
+    raw_palette = quantized.getpalette()
+    color_counts = sorted(quantized.getcolors(), reverse=True)
+
+    return [
+        tuple(raw_palette[index * 3 : index * 3 + 3]) for _, index in color_counts
+    ]
+
+
+def get_palette(img, item_id=None, image_tag=None):
+    """
+    获取图片调色板，优先使用 (媒体项 ID, 图片标签) 缓存
+
+    参数:
+        img: 已解码的 PIL.Image 对象
+        item_id: 媒体项 ID
+        image_tag: 图片标签（图片变化时服务器会更新该值）
+
+    返回:
+        颜色列表 [(r, g, b), ...]
+    """
+    palette = get_cached_palette(item_id, image_tag)
+    if palette is not None:
+        return palette
+
+    palette = extract_palette(img)
+    if item_id and image_tag:
+        store_palette(item_id, image_tag, palette)
+    return palette
+
+
+def _with_value(color, saturation=None, value=None):
+    """调整颜色的饱和度和明度，结果限制在 0-255"""
+    h, s, v = colorsys.rgb_to_hsv(*(c / 255.0 for c in color[:3]))
+    if saturation is not None:
+        s = saturation
+    if value is not None:
+        v = value
+    r, g, b = colorsys.hsv_to_rgb(h, min(max(s, 0.0), 1.0), min(max(v, 0.0), 1.0))
+    return (
+        min(max(int(round(r * 255)), 0), 255),
+        min(max(int(round(g * 255)), 0), 255),
+        min(max(int(round(b * 255)), 0), 255),
+    )
+
+
+def pick_accent_color(palette):
+    """
+    从调色板中选出色块颜色：优先饱和度高且不过暗的颜色，并保证足够亮
+
+    返回:
+        RGBA 颜色
+    """
+
+    def score(color):
+        _, s, v = colorsys.rgb_to_hsv(*(c / 255.0 for c in color))
+        return s * 0.7 + v * 0.3
+
+    best = max(palette, key=score)
+    v = colorsys.rgb_to_hsv(*(c / 255.0 for c in best))[2]
+    r, g, b = _with_value(best, value=max(v, 0.75))
+    return (r, g, b, 255)
+
+
+def gradient_colors_from_palette(palette):
+    """
+    根据调色板生成渐变背景的左右两种颜色
+
+    返回:
+        (左侧深色, 右侧浅色)，均为 RGB
+    """
+    dominant = palette[0]
+    secondary = palette[1] if len(palette) > 1 else dominant
+
+    _, dominant_s, _ = colorsys.rgb_to_hsv(*(c / 255.0 for c in dominant))
+    _, secondary_s, _ = colorsys.rgb_to_hsv(*(c / 255.0 for c in secondary))
+
+    color1 = _with_value(dominant, saturation=min(dominant_s, 0.7), value=0.4)
+    color2 = _with_value(secondary, saturation=min(secondary_s, 0.5), value=0.9)
+    return color1, color2
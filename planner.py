@@ -0,0 +1,84 @@
+import fnmatch
+
+import config
+
+# 规则前缀：按媒体库类型（CollectionType）匹配
+TYPE_RULE_PREFIX = "type:"
+
+
+def match_rule(library, rule):
+    """
+    判断媒体库是否匹配规则
+
+    参数:
+        library: 媒体库字典，包含'Name'和'CollectionType'
+        rule: 名称通配符（如 "Hot*"），或 "type:类型"（如 "type:playlists"）
+
+    返回:
+        bool
+    """
+    if rule.lower().startswith(TYPE_RULE_PREFIX):
+        collection_type = library.get("CollectionType") or ""
+        return fnmatch.fnmatch(
+            collection_type.lower(), rule[len(TYPE_RULE_PREFIX) :].strip().lower()
+        )
+    return fnmatch.fnmatchcase(library.get("Name", ""), rule)
+
+
+def match_any(library, rules):
+    """判断媒体库是否匹配任意一条规则"""
+    return any(match_rule(library, rule) for rule in rules)
+
+
+def build_work_plan(libraries):
+    """
+    在下载和生成海报之前确定每个媒体库要做的工作
+
+    参数:
+        libraries: get_libraries() 返回的媒体库列表
+
+    返回:
+        列表，每项为 {"library": 媒体库, "action": 动作, "reason": 原因}
+        动作为 "skip"（不处理）、"render"（只生成）或 "upload"（生成并上传）
+    """
+    update_poster = config.get_server_config()["UPDATE_POSTER"]
+    plan = []
+
+    for library in libraries:
+        if not match_any(library, config.INCLUDE_LIBRARY):
+            action, reason = "skip", "不在 include_library 中"
+        elif match_any(library, config.EXCLUDE_LIBRARY):
+            if config.RENDER_EXCLUDED_LIBRARY:
+                action, reason = "render", "在 exclude_Update_library 中，只生成不上传"
+            else:
+                action, reason = "skip", "在 exclude_Update_library 中"
+        elif not update_poster:
+            action, reason = "render", "未开启 update_poster，只生成不上传"
+        else:
+            action, reason = "upload", "生成并上传"
+
+        plan.append({"library": library, "action": action, "reason": reason})
+
+    return plan
+
+
+def print_work_plan(plan):
+    """打印工作计划"""
+    action_names = {"skip": "跳过", "render": "生成", "upload": "生成+上传"}
+
+    print("\n工作计划:")
+    for i, entry in enumerate(plan, 1):
+        library = entry["library"]
+        collection_type = library.get("CollectionType") or "-"
+        print(
+            f"  {i}. [{action_names[entry['action']]}] {library['Name']} "
+            f"({collection_type}) - {entry['reason']}"
+        )
+
+    counts = {action: 0 for action in action_names}
+    for entry in plan:
+        counts[entry["action"]] += 1
+    print(
+        f"共 {len(plan)} 个媒体库: 生成并上传 {counts['upload']} 个，"
+        f"只生成 {counts['render']} 个，跳过 {counts['skip']} 个"
+    )
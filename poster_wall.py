@@ -0,0 +1,406 @@
+import math
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFilter
+
+import config
+from background import expand_background, get_blur_style, get_blurred_artwork
+from cache import atomic_save_image
+from gen_poster import (
+    create_gradient_background,
+    draw_titles,
+    find_poster_files,
+    get_format_config,
+    get_format_output_path,
+    load_poster_manifest,
+    load_poster_palette,
+    make_poster_seed,
+    pick_render_colors,
+    plan_format,
+)
+from layout import DESIGN_SIZE, scale_shadow
+from planner import match_any
+
+# 解码海报的线程数（PIL 解码和缩放时释放 GIL）
+DECODE_WORKERS = min(8, os.cpu_count() or 1)
+
+# 渐变遮罩中完全露出背景的部分占 FADE_WIDTH 的比例
+FADE_SOLID = 0.5
+
+
+def is_wall_library(library):
+    """媒体库是否使用海报墙（匹配 poster_wall.libraries 中的任意规则）"""
+    return match_any(library, config.POSTER_WALL_CONFIG["LIBRARIES"])
+
+
+def get_wall_poster_count(output_formats=None):
+    """海报墙需要的海报数量（只计算旋转后在画布上可见的位置）"""
+    if output_formats is None:
+        output_formats = config.OUTPUT_FORMATS
+    atlas_scale = get_atlas_scale(1.0, output_formats)
+    plans = [plan_format(output_format) for output_format in output_formats]
+    geometry = compute_wall_geometry(atlas_scale)
+    return len(find_visible_tiles(geometry, atlas_scale, plans))
+
+
+def get_atlas_scale(scale=1.0, output_formats=None):
+    """
+    图集的缩放比例：按所有输出格式中最大的设计缩放比例生成，
+    较小的输出格式在整体旋转时一起缩小
+    """
+    if output_formats is None:
+        output_formats = config.OUTPUT_FORMATS
+    fits = [
+        min(
+            output_format["WIDTH"] / DESIGN_SIZE[0],
+            output_format["HEIGHT"] / DESIGN_SIZE[1],
+        )
+        for output_format in output_formats
+    ]
+    return scale * max(fits)
+
+
+def compute_wall_geometry(scale=1.0):
+    """
+    计算图集中每张海报的尺寸和位置
+
+    返回:
+        dict: cell_size、radius、shadow（偏移量, 模糊半径）、size（图集尺寸）、
+        positions（按行优先排列的左上角坐标列表）
+    """
+    wall_config = config.POSTER_WALL_CONFIG
+    cell_width = max(1, round(wall_config["CELL_WIDTH"] * scale))
+    cell_height = max(1, round(wall_config["CELL_HEIGHT"] * scale))
+    gap = round(wall_config["GAP"] * scale)
+    shadow_offset, shadow_blur, padding = scale_shadow(
+        scale, wall_config["SHADOW_OFFSET"], wall_config["SHADOW_BLUR"]
+    )
+
+    pitch_x = cell_width + gap
+    pitch_y = cell_height + gap
+    positions = [
+        (padding + col * pitch_x, padding + row * pitch_y)
+        for row in range(wall_config["ROWS"])
+        for col in range(wall_config["COLS"])
+    ]
+    size = (
+        padding * 2 + wall_config["COLS"] * pitch_x - gap,
+        padding * 2 + wall_config["ROWS"] * pitch_y - gap,
+    )
+    return {
+        "cell_size": (cell_width, cell_height),
+        "radius": wall_config["CORNER_RADIUS"] * scale,
+        "shadow": (shadow_offset, shadow_blur),
+        "size": size,
+        "positions": positions,
+    }
+
+
+def find_visible_tiles(geometry, atlas_scale, plans):
+    """
+    找出旋转后至少在一个输出格式中可见的海报位置，
+    完全落在画布外或左侧完全露出背景区域内的位置不需要下载、解码和绘制
+
+    参数:
+        geometry: compute_wall_geometry 的结果
+        atlas_scale: 图集的缩放比例
+        plans: 每个输出格式的渲染计划
+
+    返回:
+        可见位置的序号列表（按行优先排列）
+    """
+    cell_width, cell_height = geometry["cell_size"]
+    shadow_offset, shadow_blur = geometry["shadow"]
+    # 海报范围加上阴影偏移，四周再留出模糊范围和双三次插值需要的像素
+    margin = shadow_blur * 3 + 2
+    extent_x = cell_width + shadow_offset + margin
+    extent_y = cell_height + shadow_offset + margin
+
+    visible = set()
+    for plan in plans:
+        canvas_width, canvas_height = plan["size"]
+        a, b, c, d, e, f = wall_matrix(
+            geometry["size"],
+            plan["size"],
+            config.POSTER_WALL_CONFIG["ROTATION_ANGLE"],
+            plan["scale"] / atlas_scale,
+        )
+        # 海报墙坐标到画布坐标的正向变换
+        det = a * e - b * d
+        # 左侧完全露出背景的区域
+        fade_start = (
+            config.POSTER_WALL_CONFIG["FADE_WIDTH"] * canvas_width * FADE_SOLID
+        )
+        for index, (x, y) in enumerate(geometry["positions"]):
+            xs = []
+            ys = []
+            for wall_x in (x - margin, x + extent_x):
+                for wall_y in (y - margin, y + extent_y):
+                    dx = wall_x - c
+                    dy = wall_y - f
+                    xs.append((e * dx - b * dy) / det)
+                    ys.append((a * dy - d * dx) / det)
+            if (
+                max(xs) > max(0, fade_start)
+                and min(xs) < canvas_width
+                and max(ys) > 0
+                and min(ys) < canvas_height
+            ):
+                visible.add(index)
+    return sorted(visible)
+
+
+def estimate_wall_memory(scale=1.0):
+    """
+    估算一次海报墙生成的内存峰值（未乘估算系数，供 render_scheduler 使用）
+
+    同时持有：所有缩小后的海报、图集（RGB）、遮罩和阴影（L）、海报墙（RGBA），
+    以及最大输出格式的背景、结果、旋转结果和绘制标题时的副本
+    """
+    geometry = compute_wall_geometry(get_atlas_scale(scale))
+    cell_width, cell_height = geometry["cell_size"]
+    atlas_width, atlas_height = geometry["size"]
+    atlas_pixels = atlas_width * atlas_height
+
+    thumbnails = cell_width * cell_height * 4 * get_wall_poster_count()
+    atlas = atlas_pixels * (4 + 1 + 1 * 2 + 4)
+    canvas = max(
+        round(output_format["WIDTH"] * scale) * round(output_format["HEIGHT"] * scale)
+        for output_format in config.OUTPUT_FORMATS
+    ) * 4 * 5
+    return 16 * 1024 * 1024 + thumbnails + atlas + canvas
+
+
+def decode_thumbnail(path, cell_size):
+    """按海报墙单元尺寸解码并缩放一张海报（JPEG 直接按 1/2、1/4、1/8 缩小解码）"""
+    with Image.open(path) as img:
+        img.draft("RGB", cell_size)
+        img = img.convert("RGB")
+    return img.resize(cell_size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def build_atlas(thumbnails, tiles, geometry):
+    """
+    把缩小后的海报紧密排列到一张图集上，圆角遮罩和阴影对整张图集一次完成
+
+    参数:
+        thumbnails: {海报键: 缩小后的海报}
+        tiles: 每个位置使用的海报键列表（与 geometry["positions"] 对应，只包括可见的位置）
+        geometry: compute_wall_geometry 的结果
+
+    返回:
+        带阴影的 RGBA 海报墙（旋转前）
+    """
+    size = geometry["size"]
+    cell_width, cell_height = geometry["cell_size"]
+    shadow_offset, shadow_blur = geometry["shadow"]
+
+    # 所有海报共用一个圆角遮罩
+    cell_mask = Image.new("L", (cell_width, cell_height), 0)
+    ImageDraw.Draw(cell_mask).rounded_rectangle(
+        [(0, 0), (cell_width, cell_height)], radius=geometry["radius"], fill=255
+    )
+
+    atlas = Image.new("RGB", size, (0, 0, 0))
+    mask = Image.new("L", size, 0)
+    shadow = Image.new("L", size, 0)
+    for key, position in zip(tiles, geometry["positions"]):
+        atlas.paste(thumbnails[key], position)
+        mask.paste(cell_mask, position)
+        shadow.paste(
+            cell_mask, (position[0] + shadow_offset, position[1] + shadow_offset)
+        )
+
+    # 整张图集只做一次模糊，代替每张海报单独添加阴影
+    shadow = shadow.filter(ImageFilter.GaussianBlur(shadow_blur))
+
+    black = Image.new("L", size, 0)
+    wall = Image.merge("RGBA", (black, black, black, shadow))
+    wall.paste(atlas, (0, 0), mask)
+    return wall
+
+
+def wall_matrix(wall_size, canvas_size, angle, fit):
+    """
+    整面海报墙旋转并缩放到画布上的仿射矩阵（画布坐标到海报墙坐标），
+    海报墙中心对齐画布中心，角度方向与 Image.rotate 一致
+    """
+    radians = math.radians(angle)
+    cos_a = math.cos(radians) / fit
+    sin_a = math.sin(radians) / fit
+    canvas_cx, canvas_cy = canvas_size[0] / 2.0, canvas_size[1] / 2.0
+    wall_cx, wall_cy = wall_size[0] / 2.0, wall_size[1] / 2.0
+    return (
+        cos_a,
+        -sin_a,
+        wall_cx - cos_a * canvas_cx + sin_a * canvas_cy,
+        sin_a,
+        cos_a,
+        wall_cy - sin_a * canvas_cx - cos_a * canvas_cy,
+    )
+
+
+def make_fade_mask(canvas_size):
+    """左侧露出背景、向右渐变到海报墙的遮罩，保证标题清晰"""
+    width, height = canvas_size
+    fade_end = config.POSTER_WALL_CONFIG["FADE_WIDTH"] * width
+    fade_start = fade_end * FADE_SOLID
+    values = []
+    for x in range(width):
+        if x < fade_start:
+            values.append(255)
+        elif x >= fade_end:
+            values.append(0)
+        else:
+            values.append(round(255 * (fade_end - x) / (fade_end - fade_start)))
+    row = Image.new("L", (width, 1))
+    row.putdata(values)
+    return row.resize(canvas_size, Image.NEAREST)
+
+
+def render_wall_workflow(
+    name,
+    library_id=None,
+    seed=None,
+    scale=1.0,
+    output_path=None,
+    poster_folder=None,
+    output_formats=None,
+):
+    """
+    生成海报墙：大量缩小的海报排成网格，整体旋转后铺满画面
+
+    所有海报先排列到一张图集上，圆角遮罩和阴影对图集整体处理，
+    每个输出格式只做一次整体旋转，几百张海报也只需几秒
+
+    参数与 gen_poster_workflow 相同
+    """
+    try:
+        print("\n[3/4] 正在生成海报墙...")
+        print("-" * 40)
+        if poster_folder is None:
+            poster_folder = os.path.join(config.get_poster_folder(), name)
+        if output_formats is None:
+            output_formats = config.OUTPUT_FORMATS
+        if output_path is None:
+            output_path = os.path.join(config.get_output_folder(), f"{name}.png")
+
+        # 只为旋转后可见的位置准备海报
+        atlas_scale = get_atlas_scale(scale, output_formats)
+        geometry = compute_wall_geometry(atlas_scale)
+        plans = [plan_format(output_format, scale) for output_format in output_formats]
+        visible = find_visible_tiles(geometry, atlas_scale, plans)
+        geometry = dict(
+            geometry, positions=[geometry["positions"][index] for index in visible]
+        )
+
+        poster_files = find_poster_files(poster_folder)[: len(visible)]
+        if not poster_files:
+            print(f"错误: 在 {poster_folder} 中没有找到支持的图片文件")
+            return False
+
+        manifest = load_poster_manifest(poster_folder)
+        if seed is None:
+            seed = make_poster_seed(library_id or name, poster_files, manifest)
+        rng = random.Random(seed)
+
+        # 下载不足时复制出的海报与原海报是同一张图片，只解码一次
+        def poster_key(path):
+            entry = manifest.get(os.path.basename(path), {})
+            if entry.get("Id"):
+                return (entry["Id"], entry.get("ImageTag", ""))
+            return (path, "")
+
+        unique_files = {}
+        for path in poster_files:
+            unique_files.setdefault(poster_key(path), path)
+
+        keys = list(unique_files)
+
+        def decode(key):
+            try:
+                return decode_thumbnail(unique_files[key], geometry["cell_size"])
+            except Exception as e:
+                print(f"错误: 处理图片 {os.path.basename(unique_files[key])} 时出错: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as executor:
+            decoded = list(executor.map(decode, keys))
+        thumbnails = {
+            key: thumbnail for key, thumbnail in zip(keys, decoded) if thumbnail
+        }
+        if not thumbnails:
+            print("错误: 没有可用的海报")
+            return False
+
+        # 海报不足时随机重复已有的海报填满整面墙
+        tiles = [poster_key(path) for path in poster_files]
+        tiles = [key for key in tiles if key in thumbnails]
+        available = list(thumbnails)
+        while len(tiles) < len(geometry["positions"]):
+            tiles.append(available[rng.randrange(len(available))])
+
+        # 第一张海报的主色（缩小后的海报足以提取调色板），
+        # 结果与原图提取的不完全相同，不写入按 ID 和图片标签共用的缓存
+        palette = None
+        first_key = tiles[0]
+        try:
+            palette = load_poster_palette(
+                first_key[0], first_key[1], lambda: thumbnails[first_key], store=False
+            )
+        except Exception as e:
+            print(f"获取海报主色时出错: {e}")
+        color1, color2, accent_color = pick_render_colors(palette, rng)
+
+        # 模糊海报背景（背景经过大半径模糊，缩小后的海报已足够）
+        artwork_backgrounds = {}
+        for index, (output_format, plan) in enumerate(zip(output_formats, plans)):
+            style = get_blur_style(get_format_config(output_format), plan["scale"])
+            if style:
+                artwork_backgrounds[index] = get_blurred_artwork(
+                    first_key[0],
+                    first_key[1],
+                    lambda: thumbnails[first_key],
+                    plan["size"],
+                    style,
+                    store=False,
+                )
+
+        wall = build_atlas(thumbnails, tiles, geometry)
+        thumbnails.clear()
+
+        for index, (output_format, plan) in enumerate(zip(output_formats, plans)):
+            canvas_size = plan["size"]
+            if artwork_backgrounds.get(index) is not None:
+                gradient_bg = expand_background(artwork_backgrounds[index], canvas_size)
+            else:
+                gradient_bg = create_gradient_background(
+                    canvas_size[0], canvas_size[1], color1, color2
+                )
+            rotated = wall.transform(
+                canvas_size,
+                Image.AFFINE,
+                wall_matrix(
+                    wall.size,
+                    canvas_size,
+                    config.POSTER_WALL_CONFIG["ROTATION_ANGLE"],
+                    plan["scale"] / atlas_scale,
+                ),
+                Image.BICUBIC,
+            )
+            result = gradient_bg.copy()
+            result.alpha_composite(rotated)
+            result.paste(gradient_bg, (0, 0), make_fade_mask(canvas_size))
+
+            result = draw_titles(result, name, accent_color, plan)
+
+            format_path = get_format_output_path(output_path, index, output_format)
+            atomic_save_image(result, format_path)
+            print(f"成功: {output_format['IMAGE_TYPE']} 海报墙已保存到 {format_path}")
+        return True
+
+    except Exception as e:
+        print(f"错误: 创建海报墙时出错: {e}")
+        return False
@@ -0,0 +1,84 @@
+import argparse
+import os
+import time
+
+import config
+from gen_poster import gen_poster_workflow
+from poster_wall import is_wall_library, render_wall_workflow
+
+# 检查 config.json 是否修改的间隔（秒）
+WATCH_INTERVAL = 0.2
+
+
+def get_preview_path(name):
+    """预览图保存路径，与正式输出分开，避免被上传"""
+    return os.path.join(config.get_output_folder(), "preview", f"{name}.png")
+
+
+def render_preview(name, scale):
+    """
+    使用已下载的海报按缩放比例生成一次预览图
+
+    返回:
+        bool: 是否生成成功
+    """
+    started = time.time()
+    # 预览只知道媒体库名称，海报墙按名称规则判断
+    render = gen_poster_workflow
+    if is_wall_library({"Name": name}):
+        render = render_wall_workflow
+    success = render(name, scale=scale, output_path=get_preview_path(name))
+    print(f"预览生成耗时 {(time.time() - started) * 1000:.0f} ms")
+    return success
+
+
+def watch_config(name, scale):
+    """config.json 每次修改后重新加载布局参数并重新生成预览，按 Ctrl+C 退出"""
+    last_mtime = None
+    print(f"正在监视 {config.CONFIG_JSON_PATH}，按 Ctrl+C 退出")
+    try:
+        while True:
+            try:
+                mtime = os.path.getmtime(config.CONFIG_JSON_PATH)
+            except OSError:
+                mtime = None
+            if mtime != last_mtime:
+                last_mtime = mtime
+                if config.reload_layout_config():
+                    render_preview(name, scale)
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        print("\n已停止监视")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="使用已下载的海报快速生成低分辨率预览，用于调整布局参数"
+    )
+    parser.add_argument("name", help="媒体库名称（poster 文件夹下的目录名）")
+    parser.add_argument(
+        "--scale", type=float, default=0.25, help="缩放比例，默认 0.25"
+    )
+    parser.add_argument(
+        "--watch", action="store_true", help="config.json 修改后自动重新生成"
+    )
+    parser.add_argument("--server", default="", help="多服务器时的服务器名称")
+    args = parser.parse_args()
+
+    if not 0 < args.scale <= 1:
+        raise SystemExit("缩放比例必须在 0 到 1 之间")
+
+    server = config.find_server(args.server)
+    if server is None:
+        raise SystemExit(f"找不到服务器: {args.server}")
+
+    with config.use_server(server):
+        print(f"预览图保存到: {get_preview_path(args.name)}")
+        if args.watch:
+            watch_config(args.name, args.scale)
+        else:
+            render_preview(args.name, args.scale)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不测量内存
+    resource = None
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+
+# 回归检查只使用合成海报，导入配置时不连接服务器认证（测量内存的子进程会继承该变量）
+os.environ.setdefault("POSTER_SKIP_AUTH", "1")
+
+import config
+from font_cache import get_font
+from gen_poster import (
+    CELL_SHADOW,
+    add_shadow,
+    create_gradient_background,
+    draw_text_on_image,
+    gen_poster_workflow,
+    render_cell,
+)
+from render_scheduler import read_rss
+
+# 基准图片和性能基线的保存位置
+REGRESSION_DIR = os.path.join(config.CURRENT_DIR, "regression")
+GOLDEN_DIR = os.path.join(REGRESSION_DIR, "golden")
+BASELINE_PATH = os.path.join(REGRESSION_DIR, "baseline.json")
+
+# 合成输入的固定种子，修改后需要重新生成基准
+INPUT_SEED = 20240601
+
+# 固定的渲染种子，不依赖日期和海报清单
+RENDER_SEED = 1234
+
+# 合成海报的尺寸（与服务器返回的海报尺寸相近）
+SYNTHETIC_POSTER_SIZE = (600, 900)
+
+# 感知比较：先模糊消除亚像素差异，再比较亮度
+COMPARE_BLUR = 1.5
+MAX_MEAN_DIFF = 1.0  # 平均亮度差上限（0-255）
+PIXEL_DIFF_THRESHOLD = 16  # 单个像素亮度差超过该值视为明显差异
+MAX_DIFF_RATIO = 0.001  # 明显差异像素占比上限
+
+# 性能回归阈值：同时超过相对比例和绝对余量才算回归，避免小耗时的抖动
+TIME_TOLERANCE = 0.25
+TIME_SLACK = 0.02  # 秒
+MEMORY_TOLERANCE = 0.2
+MEMORY_SLACK = 8  # MB
+
+# 生成海报时需要的字体
+REQUIRED_FONTS = [
+    os.path.join("font", "方正风雅宋简体.ttf"),
+    os.path.join("font", "Melete-UltraLight.otf"),
+]
+
+
+def make_synthetic_poster(rng, size=SYNTHETIC_POSTER_SIZE):
+    """生成一张带有色块和渐变的合成海报（只依赖随机数生成器）"""
+    poster = create_gradient_background(size[0], size[1], rng=rng).convert("RGB")
+    draw = ImageDraw.Draw(poster)
+    for _ in range(12):
+        x = rng.randint(-100, size[0])
+        y = rng.randint(-100, size[1])
+        w = rng.randint(60, 260)
+        h = rng.randint(60, 260)
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse([x, y, x + w, y + h], fill=color)
+        else:
+            draw.rectangle([x, y, x + w, y + h], fill=color)
+    return poster
+
+
+# 合成海报所在的媒体库名称
+LIBRARY_NAME = "Regression"
+
+
+def use_workspace(root):
+    """让配置指向临时目录，避免已有的缓存和输出影响结果"""
+    config.POSTER_FOLDER = os.path.join(root, "poster")
+    config.OUTPUT_FOLDER = os.path.join(root, "output")
+    config.CACHE_FOLDER = os.path.join(root, "cache")
+    config.POSTER_GEN_CONFIG["SAVE_COLUMNS"] = False
+
+
+def prepare_workspace(root):
+    """
+    在临时目录中准备合成海报和海报清单，并让配置指向该目录
+
+    返回:
+        媒体库名称
+    """
+    name = LIBRARY_NAME
+    use_workspace(root)
+
+    poster_dir = os.path.join(config.POSTER_FOLDER, name)
+    os.makedirs(poster_dir)
+    rng = random.Random(INPUT_SEED)
+    manifest = []
+    poster_count = config.POSTER_GEN_CONFIG["ROWS"] * config.POSTER_GEN_CONFIG["COLS"]
+    for index in range(1, poster_count + 1):
+        file_name = f"{index}.jpg"
+        make_synthetic_poster(rng).save(
+            os.path.join(poster_dir, file_name), quality=95
+        )
+        manifest.append(
+            {"file": file_name, "Id": f"item{index}", "Name": "", "ImageTag": "golden"}
+        )
+    with open(
+        os.path.join(poster_dir, config.POSTER_MANIFEST), "w", encoding="utf-8"
+    ) as f:
+        json.dump(manifest, f)
+    return name
+
+
+def case_gradient(name):
+    return create_gradient_background(1920, 1080, rng=random.Random(RENDER_SEED))
+
+
+def case_shadow(name):
+    poster = make_synthetic_poster(random.Random(INPUT_SEED)).convert("RGBA")
+    offset, blur_radius, shadow_color = CELL_SHADOW
+    return add_shadow(poster, (offset, offset), shadow_color, blur_radius)
+
+
+def case_cell(name):
+    poster = make_synthetic_poster(random.Random(INPUT_SEED))
+    return render_cell(
+        poster,
+        config.POSTER_GEN_CONFIG["CELL_WIDTH"],
+        config.POSTER_GEN_CONFIG["CELL_HEIGHT"],
+        config.POSTER_GEN_CONFIG["CORNER_RADIUS"],
+    )
+
+
+def _render_workflow(name, scale=1.0):
+    output_path = os.path.join(config.OUTPUT_FOLDER, f"{name}_{scale}.png")
+    success = gen_poster_workflow(
+        name, seed=RENDER_SEED, scale=scale, output_path=output_path
+    )
+    if not success:
+        raise RuntimeError("gen_poster_workflow 返回失败")
+    with Image.open(output_path) as img:
+        img.load()
+        return img
+
+
+def case_workflow_plain(name):
+    # 不绘制标题的完整生成流程，不需要字体文件
+    texts = config.POSTER_GEN_CONFIG["TEXTS"]
+    config.POSTER_GEN_CONFIG["TEXTS"] = []
+    try:
+        output_path = os.path.join(config.OUTPUT_FOLDER, f"{name}_plain.png")
+        if not gen_poster_workflow(name, seed=RENDER_SEED, output_path=output_path):
+            raise RuntimeError("gen_poster_workflow 返回失败")
+        with Image.open(output_path) as img:
+            img.load()
+            return img
+    finally:
+        config.POSTER_GEN_CONFIG["TEXTS"] = texts
+
+
+def case_workflow_cold(name):
+    # 清空缓存，测量首次生成（解码、缩放、阴影、标题光栅化）
+    shutil.rmtree(config.CACHE_FOLDER, ignore_errors=True)
+    return _render_workflow(name)
+
+
+def case_workflow_warm(name):
+    # 缓存已由上一次生成填充，测量日常重复生成
+    return _render_workflow(name)
+
+
+def case_preview(name):
+    return _render_workflow(name, scale=0.25)
+
+
+# (名称, 函数, 是否需要字体)
+CASES = [
+    ("gradient", case_gradient, False),
+    ("shadow", case_shadow, False),
+    ("cell", case_cell, False),
+    ("workflow_plain", case_workflow_plain, False),
+    ("workflow_cold", case_workflow_cold, True),
+    ("workflow_warm", case_workflow_warm, True),
+    ("preview", case_preview, True),
+]
+
+# 每次运行都需要在全新进程中进行的用例（本进程内的缓存会让重复运行变成热启动）
+FRESH_PROCESS_CASES = {"workflow_cold"}
+
+
+def check_title_sprites():
+    """
+    检查缓存的标题贴图与直接用 ImageDraw.text 绘制的结果逐像素一致
+    （分别在缓存未命中和命中时检查）
+
+    返回:
+        问题列表
+    """
+    problems = []
+    background = Image.new("RGBA", (1920, 1080), (30, 60, 90, 255))
+    for text_config in config.POSTER_GEN_CONFIG["TEXTS"]:
+        font_path = text_config["font"]
+        font_size = text_config["size"]
+        font = get_font(font_path, font_size)
+        for position in [tuple(text_config["position"]), (10.999, 3.001), (0, 0)]:
+            for text in ["电影 Movie", "jgpqy ÅÉ"]:
+                expected = background.copy()
+                ImageDraw.Draw(expected).text(
+                    position, text, font=font, fill=(255, 255, 255, 255)
+                )
+                for attempt in ("未命中", "命中"):
+                    actual = draw_text_on_image(
+                        background, text, position, font_path, font_size
+                    )
+                    diff = ImageChops.difference(actual, expected).getbbox()
+                    if diff:
+                        problems.append(
+                            f"{os.path.basename(font_path)} {text!r} {position} "
+                            f"缓存{attempt}时与直接绘制不一致，区域 {diff}"
+                        )
+    return problems
+
+
+def compare_images(actual, golden):
+    """
+    感知比较两张图片
+
+    返回:
+        (是否一致, 说明)
+    """
+    if actual.size != golden.size:
+        return False, f"尺寸不同 {actual.size} != {golden.size}"
+
+    def prepare(img):
+        return img.convert("L").filter(ImageFilter.GaussianBlur(COMPARE_BLUR))
+
+    diff = ImageChops.difference(prepare(actual), prepare(golden))
+    mean_diff = ImageStat.Stat(diff).mean[0]
+    histogram = diff.histogram()
+    changed = sum(histogram[PIXEL_DIFF_THRESHOLD + 1 :])
+    ratio = changed / (actual.width * actual.height)
+    detail = f"平均差 {mean_diff:.3f}，明显差异像素 {ratio:.4%}"
+    return mean_diff <= MAX_MEAN_DIFF and ratio <= MAX_DIFF_RATIO, detail
+
+
+def reset_peak_rss():
+    """清零进程的内存峰值记录（Linux 的 VmHWM），不支持时返回 False"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def read_max_rss():
+    """当前进程的内存峰值（字节），无法获取时返回 None"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _measure_case(case_name, workspace):
+    """
+    在新进程中运行一次用例
+
+    返回:
+        (耗时秒数, 运行期间内存峰值相对运行前的增量字节数或 None)
+    """
+    os.chdir(config.CURRENT_DIR)
+    use_workspace(workspace)
+    func = {name: func for name, func, _ in CASES}[case_name]
+    # 导入模块时的峰值可能高于用例本身，能清零时从当前内存开始记录峰值
+    before = read_rss() if reset_peak_rss() else read_max_rss()
+    started = time.perf_counter()
+    func(LIBRARY_NAME)
+    seconds = time.perf_counter() - started
+    after = read_max_rss()
+    if before is None or after is None:
+        return seconds, None
+    return seconds, max(0, after - before)
+
+
+def run_in_fresh_process(case_name, workspace):
+    """
+    在全新的子进程中运行一次用例并读取进程内存峰值（VmHWM 或 ru_maxrss），
+    不受本进程已分配内存、已填充的缓存和其他用例的影响
+
+    返回:
+        (耗时秒数, 内存峰值增量 MB 或 None)
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        seconds, measured = executor.submit(
+            _measure_case, case_name, workspace
+        ).result()
+    return seconds, measured / 1024 / 1024 if measured is not None else None
+
+
+def run_case(case_name, func, name, repeat, workspace):
+    """
+    运行一个用例，耗时取多次运行的最小值，内存峰值在单独的子进程中测量
+
+    FRESH_PROCESS_CASES 中的用例每次都在全新的子进程中计时，本进程只生成用于比较的图片
+
+    返回:
+        (图片, 耗时秒数, 内存峰值 MB 或 None)
+    """
+    if case_name in FRESH_PROCESS_CASES:
+        image = func(name)
+        runs = [run_in_fresh_process(case_name, workspace) for _ in range(repeat)]
+        return image, min(seconds for seconds, _ in runs), runs[0][1]
+
+    started = time.perf_counter()
+    image = func(name)
+    best = time.perf_counter() - started
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        func(name)
+        best = min(best, time.perf_counter() - started)
+    _, peak_mb = run_in_fresh_process(case_name, workspace)
+    return image, best, peak_mb
+
+
+def check_performance(case_name, seconds, peak_mb, baseline):
+    """与性能基线比较，返回问题列表"""
+    problems = []
+    expected = baseline.get(case_name)
+    if not expected:
+        return problems
+
+    limit = expected["seconds"] * (1 + TIME_TOLERANCE) + TIME_SLACK
+    if seconds > limit:
+        problems.append(
+            f"耗时 {seconds * 1000:.0f} ms 超过基线 {expected['seconds'] * 1000:.0f} ms"
+        )
+
+    if peak_mb is not None and expected.get("peak_mb") is not None:
+        limit = expected["peak_mb"] * (1 + MEMORY_TOLERANCE) + MEMORY_SLACK
+        if peak_mb > limit:
+            problems.append(
+                f"内存 {peak_mb:.1f} MB 超过基线 {expected['peak_mb']:.1f} MB"
+            )
+    return problems
+
+
+def load_baseline():
+    try:
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="海报生成的基准图片和性能回归检查"
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="重新生成基准图片和性能基线"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="每个用例的运行次数，耗时取最小值"
+    )
+    parser.add_argument("--case", action="append", help="只运行指定用例（可重复）")
+    args = parser.parse_args()
+
+    # 字体路径相对于程序目录
+    os.chdir(config.CURRENT_DIR)
+    fonts_ready = all(os.path.exists(path) for path in REQUIRED_FONTS)
+    baseline = {} if args.update else load_baseline()
+    new_baseline = dict(load_baseline()) if args.update else {}
+    failures = []
+
+    workspace = tempfile.mkdtemp(prefix="poster_regression_")
+    try:
+        name = prepare_workspace(workspace)
+        for case_name, func, needs_fonts in CASES:
+            if args.case and case_name not in args.case:
+                continue
+            if needs_fonts and not fonts_ready:
+                print(f"{case_name}: 跳过（缺少字体文件）")
+                continue
+
+            try:
+                image, seconds, peak_mb = run_case(
+                    case_name, func, name, max(1, args.repeat), workspace
+                )
+            except Exception as e:
+                print(f"{case_name}: 失败 - {e}")
+                failures.append(case_name)
+                continue
+
+            memory_text = f"{peak_mb:.1f} MB" if peak_mb is not None else "未知"
+            summary = f"{case_name}: {seconds * 1000:.0f} ms，内存 {memory_text}"
+            golden_path = os.path.join(GOLDEN_DIR, f"{case_name}.png")
+
+            if args.update:
+                os.makedirs(GOLDEN_DIR, exist_ok=True)
+                image.save(golden_path)
+                new_baseline[case_name] = {"seconds": seconds, "peak_mb": peak_mb}
+                print(f"{summary}，已更新基准")
+                continue
+
+            problems = []
+            if os.path.exists(golden_path):
+                with Image.open(golden_path) as golden:
+                    same, detail = compare_images(image, golden)
+                summary += f"，{detail}"
+                if not same:
+                    problems.append("图片与基准不一致")
+            else:
+                problems.append("没有基准图片，请先运行 --update")
+            problems.extend(check_performance(case_name, seconds, peak_mb, baseline))
+
+            if problems:
+                failures.append(case_name)
+                print(f"{summary}\n  失败: {'；'.join(problems)}")
+            else:
+                print(f"{summary}，通过")
+        if fonts_ready and not args.case:
+            problems = check_title_sprites()
+            if problems:
+                failures.append("title_sprite")
+                print("title_sprite: 失败\n  " + "\n  ".join(problems))
+            else:
+                print("title_sprite: 与直接绘制一致，通过")
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    if args.update:
+        os.makedirs(REGRESSION_DIR, exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(new_baseline, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {BASELINE_PATH}")
+        return 0
+
+    if failures:
+        print(f"\n{len(failures)} 个用例失败: {', '.join(failures)}")
+        return 1
+    print("\n全部用例通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
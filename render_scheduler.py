@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+import config
+from cache import atomic_write_bytes, get_cache_dir
+from gen_poster import cell_spec, get_format_config, plan_format, poster_sort_key
+
+# 每个生成任务的固定开销（字体、临时对象等）
+BASE_OVERHEAD = 16 * 1024 * 1024
+
+# 实测值对估算系数的影响权重（指数移动平均）
+FEEDBACK_WEIGHT = 0.3
+
+# 估算系数的取值范围，避免个别异常测量把估算带偏
+MIN_FACTOR = 0.5
+MAX_FACTOR = 4.0
+
+# 采样进程内存的间隔（秒）
+SAMPLE_INTERVAL = 0.05
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def _bytes_per_pixel(mode):
+    """PIL 解码后每个像素占用的字节数"""
+    return {"1": 1, "L": 1, "P": 1, "LA": 4, "RGB": 4, "RGBA": 4, "CMYK": 4}.get(
+        mode, 4
+    )
+
+
+def estimate_render_memory(poster_files):
+    """
+    根据布局和输入海报尺寸估算一次海报生成的内存峰值（未乘估算系数）
+
+    生成过程同时持有：第一张海报（提取主色）和当前正在处理的海报、
+    所有输出格式要用到的海报单元贴图及一次贴图处理的中间结果，
+    以及正在合成的输出格式的背景、结果画布（加上绘制标题时的副本）、
+    当前列的列画布、遮罩画布和旋转结果
+
+    参数:
+        poster_files: 海报文件路径列表（只读取文件头，不解码）
+
+    返回:
+        估算的字节数
+    """
+    plans = [plan_format(output_format) for output_format in config.OUTPUT_FORMATS]
+
+    # 解码后的海报：第一张一直保留到贴图完成，其余逐张解码后释放
+    poster_bytes = []
+    for path in poster_files:
+        try:
+            with Image.open(path) as img:
+                width, height = img.size
+                poster_bytes.append(width * height * _bytes_per_pixel(img.mode))
+        except OSError:
+            continue
+    decoded = 0
+    if poster_bytes:
+        decoded = poster_bytes[0] + max(poster_bytes)
+
+    # 海报单元贴图：每种贴图参数每张海报一张；处理时还有缩放结果、圆角遮罩和阴影层
+    sprite_bytes = {}
+    for plan in plans:
+        sprite_width, sprite_height = plan["sprite_size"]
+        sprite_bytes[cell_spec(plan)] = sprite_width * sprite_height * 4
+    cells = (
+        sum(sprite_bytes.values()) * len(poster_files)
+        + max(sprite_bytes.values()) * 3
+    )
+
+    # 各输出格式依次合成，只计算最大的一个；格式内各列依次处理，只计算最大的一列
+    compose = 0
+    for plan in plans:
+        # 背景、结果以及绘制文字和色块时的两个副本
+        canvas = plan["size"][0] * plan["size"][1] * 4 * 4
+        column = 0
+        for entry in plan["columns"]:
+            if entry["crop"] is None:
+                continue
+            crop_top, crop_bottom = entry["crop"]
+            box = entry["box"]
+            column_canvas = plan["sprite_size"][0] * (crop_bottom - crop_top) * 4 * 2
+            rotated = (box[2] - box[0]) * (box[3] - box[1]) * 4
+            column = max(column, column_canvas + rotated)
+        compose = max(compose, canvas + column)
+
+    return BASE_OVERHEAD + decoded + cells + compose
+
+
+def read_rss():
+    """当前进程的常驻内存（字节），无法读取时返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """在后台线程中定期采样进程内存，记录任务期间的峰值"""
+
+    def __init__(self):
+        self.baseline = read_rss()
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.baseline is None:
+            return self
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._sample()
+
+    def _sample(self):
+        rss = read_rss()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def stop(self):
+        """停止采样，返回任务期间的内存增量（字节），无法测量时返回 None"""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return max(0, self.peak - self.baseline)
+
+
+class MemoryScheduler:
+    """
+    按内存预算调度海报生成任务
+
+    每个任务按估算的内存峰值占用预算，预算不足时等待其他任务完成；
+    没有其他任务在运行时总是放行，保证单个超出预算的任务也能完成。
+    单独运行的任务会测量实际内存增量，用于修正之后的估算
+    """
+
+    def __init__(self, budget_bytes, factor=1.0):
+        self.budget = budget_bytes
+        self.factor = factor
+        self.used = 0
+        self.running = 0
+        self.jobs = 0
+        self.waits = 0
+        self.peak_used = 0
+        self._active_ids = set()
+        self._overlapped = set()
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def admit(self, raw_estimate):
+        """
+        占用内存预算并在任务结束后归还
+
+        参数:
+            raw_estimate: estimate_render_memory 的估算值（未乘估算系数）
+        """
+        with self._condition:
+            estimate = int(raw_estimate * self.factor)
+            if self.running and self.used + estimate > self.budget:
+                self.waits += 1
+            while self.running and self.used + estimate > self.budget:
+                self._condition.wait()
+
+            job_id = self.jobs
+            self.jobs += 1
+            if self.running:
+                # 与其他任务同时运行，测得的内存增量不能只归于某一个任务
+                self._overlapped.update(self._active_ids)
+                self._overlapped.add(job_id)
+            self._active_ids.add(job_id)
+            self.running += 1
+            self.used += estimate
+            self.peak_used = max(self.peak_used, self.used)
+
+        sampler = RssSampler().start()
+        try:
+            yield estimate
+        finally:
+            measured = sampler.stop()
+            with self._condition:
+                self.running -= 1
+                self.used -= estimate
+                self._active_ids.discard(job_id)
+                alone = job_id not in self._overlapped
+                self._overlapped.discard(job_id)
+                if alone and measured:
+                    self._record(raw_estimate, measured)
+                self._condition.notify_all()
+
+    def _record(self, raw_estimate, measured):
+        """根据单独运行任务的实测内存修正估算系数"""
+        ratio = min(MAX_FACTOR, max(MIN_FACTOR, measured / raw_estimate))
+        self.factor = (1 - FEEDBACK_WEIGHT) * self.factor + FEEDBACK_WEIGHT * ratio
+        save_factor(self.factor)
+
+    def stats(self):
+        """调度统计，用于运行报告"""
+        with self._condition:
+            return {
+                "budget": self.budget,
+                "factor": round(self.factor, 3),
+                "jobs": self.jobs,
+                "waits": self.waits,
+                "peak_used": self.peak_used,
+            }
+
+
+def _factor_path():
+    return os.path.join(get_cache_dir("render"), "memory.json")
+
+
+def load_factor():
+    """读取上次运行保存的估算系数"""
+    try:
+        with open(_factor_path(), "r", encoding="utf-8") as f:
+            factor = float(json.load(f)["factor"])
+        return min(MAX_FACTOR, max(MIN_FACTOR, factor))
+    except (OSError, ValueError, KeyError, TypeError):
+        return 1.0
+
+
+def save_factor(factor):
+    """保存估算系数，供下次运行使用"""
+    data = json.dumps({"factor": factor, "updated": time.time()})
+    try:
+        atomic_write_bytes(_factor_path(), data.encode("utf-8"))
+    except OSError as e:
+        print(f"警告: 保存内存估算系数失败: {e}")
+
+
+def get_scheduler():
+    """获取进程内共用的调度器（所有服务器共用同一内存预算）"""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            budget = config.RENDER_MEMORY_CONFIG["BUDGET_MB"] * 1024 * 1024
+            _SCHEDULER = MemoryScheduler(budget, load_factor())
+    return _SCHEDULER
+
+
+def list_poster_files(name):
+    """媒体库已下载的海报文件（用于估算内存，顺序与生成时一致）"""
+    poster_folder = os.path.join(config.get_poster_folder(), name)
+    try:
+        files = [
+            os.path.join(poster_folder, f)
+            for f in os.listdir(poster_folder)
+            if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp"))
+        ]
+    except OSError:
+        return []
+    files.sort(key=poster_sort_key)
+    poster_count = 0
+    for output_format in config.OUTPUT_FORMATS:
+        gen_config = get_format_config(output_format)
+        poster_count = max(poster_count, gen_config["ROWS"] * gen_config["COLS"])
+    return files[:poster_count]
+
+
+def run_render_job(render, name, *args, memory_estimate=None, **kwargs):
+    """
+    在内存预算内运行一次海报生成
+
+    参数:
+        render: 生成函数（如 gen_poster_workflow），第一个参数为媒体库名称
+        name: 媒体库名称
+        memory_estimate: 生成函数自带的内存估算（未乘估算系数），
+            为None时按九宫格布局估算
+
+    返回:
+        生成函数的返回值
+    """
+    scheduler = get_scheduler()
+    raw_estimate = memory_estimate
+    if raw_estimate is None:
+        raw_estimate = estimate_render_memory(list_poster_files(name))
+    with scheduler.admit(raw_estimate) as estimate:
+        print(f"[{name}]预计占用内存 {estimate / 1024 / 1024:.0f} MB")
+        return render(name, *args, **kwargs)
@@ -0,0 +1,448 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import config
+import poster_wall
+from cache import get_cache_dir, make_cache_key
+from collection_batch import (
+    download_shared_images,
+    get_members,
+    link_poster_folder,
+    query_items,
+)
+from gen_poster import gen_poster_workflow, get_format_config
+from get_library import get_libraries
+from get_poster import select_library_items
+from seed import get_seed_period
+
+# 支持的输出格式：(Content-Type, 扩展名)
+IMAGE_FORMATS = {
+    "png": ("image/png", ".png"),
+    "jpeg": ("image/jpeg", ".jpg"),
+    "jpg": ("image/jpeg", ".jpg"),
+    "webp": ("image/webp", ".webp"),
+}
+
+# 支持的布局：grid 为九宫格海报，wall 为海报墙
+LAYOUTS = ("grid", "wall")
+
+
+class RequestError(Exception):
+    """请求参数错误或服务繁忙，status 为返回的 HTTP 状态码"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _cache_dir():
+    """生成结果缓存目录"""
+    return get_cache_dir("service")
+
+
+def evict_responses(max_bytes):
+    """淘汰最久未使用的生成结果，直到缓存总大小不超过 max_bytes"""
+    entries = []
+    total = 0
+    for entry in os.scandir(_cache_dir()):
+        if not entry.is_file() or entry.name.startswith("."):
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            continue
+
+
+def parse_request(query):
+    """
+    解析并检查请求参数
+
+    参数:
+        query: parse_qs 的结果
+
+    返回:
+        dict: server、kind（library 或 collection）、item_id、layout（None 表示自动）、
+        width、height、format
+    """
+
+    def get(key, default=None):
+        values = query.get(key)
+        return values[0] if values else default
+
+    library_id = get("library")
+    collection_id = get("collection")
+    if bool(library_id) == bool(collection_id):
+        raise RequestError(400, "需要指定 library 或 collection 之一")
+
+    layout = get("layout")
+    if layout is not None and layout not in LAYOUTS:
+        raise RequestError(400, f"不支持的布局: {layout}")
+
+    image_format = get("format", "png").lower()
+    if image_format not in IMAGE_FORMATS:
+        raise RequestError(400, f"不支持的格式: {image_format}")
+
+    default_format = config.OUTPUT_FORMATS[0]
+    try:
+        width = int(get("width", default_format["WIDTH"]))
+        height = int(get("height", default_format["HEIGHT"]))
+    except ValueError:
+        raise RequestError(400, "width 和 height 必须是整数")
+    service_config = config.RENDER_SERVICE_CONFIG
+    if not (0 < width <= service_config["MAX_WIDTH"]) or not (
+        0 < height <= service_config["MAX_HEIGHT"]
+    ):
+        raise RequestError(
+            400,
+            f"尺寸超出范围（最大 {service_config['MAX_WIDTH']}x"
+            f"{service_config['MAX_HEIGHT']}）",
+        )
+
+    server = config.find_server(get("server", ""))
+    if server is None:
+        raise RequestError(404, f"找不到服务器: {get('server')}")
+
+    return {
+        "server": server,
+        "kind": "library" if library_id else "collection",
+        "item_id": library_id or collection_id,
+        "name": get("name"),
+        "layout": layout,
+        "width": width,
+        "height": height,
+        "format": "jpeg" if image_format == "jpg" else image_format,
+    }
+
+
+class RenderService:
+    """
+    按需生成封面
+
+    每个请求先确定输入（选中的海报及其图片标签、布局参数、尺寸和格式）并计算指纹，
+    生成结果按指纹缓存；同一指纹的并发请求只生成一次，生成在有界的线程池中进行
+    """
+
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.max_pending = max(1, max_pending)
+        self._inflight = {}
+        self._libraries = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "hits": 0,
+            "not_modified": 0,
+            "renders": 0,
+            "joined": 0,
+            "rejected": 0,
+            "failed": 0,
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get_library(self, library_id):
+        """按 ID 查找当前服务器的媒体库（媒体库列表缓存 LIBRARY_TTL 秒）"""
+        server_key = config.get_server_key()
+        with self._lock:
+            cached = self._libraries.get(server_key)
+        ttl = config.RENDER_SERVICE_CONFIG["LIBRARY_TTL"]
+        if cached is None or time.time() - cached[0] > ttl:
+            libraries = {library["Id"]: library for library in get_libraries()}
+            cached = (time.time(), libraries)
+            with self._lock:
+                self._libraries[server_key] = cached
+        library = cached[1].get(library_id)
+        if library is None:
+            raise RequestError(404, f"找不到媒体库: {library_id}")
+        return library
+
+    def get_collection_name(self, collection_id):
+        """获取合集名称"""
+        data = query_items({"Ids": collection_id})
+        items = (data or {}).get("Items", [])
+        if not items:
+            raise RequestError(404, f"找不到合集: {collection_id}")
+        return items[0].get("Name", collection_id)
+
+    def resolve(self, request):
+        """
+        确定请求的输入并计算指纹（需要在 config.use_server 中调用）
+
+        返回:
+            dict: 在 request 的基础上加入 name、layout、members、count、max_width、fingerprint
+        """
+        resolved = dict(request)
+        if request["kind"] == "library":
+            library = self.get_library(request["item_id"])
+            resolved["name"] = library["Name"]
+            if resolved["layout"] is None:
+                resolved["layout"] = (
+                    "wall" if poster_wall.is_wall_library(library) else "grid"
+                )
+        else:
+            if not resolved["name"]:
+                resolved["name"] = self.get_collection_name(request["item_id"])
+            if resolved["layout"] is None:
+                resolved["layout"] = "grid"
+
+        if resolved["layout"] == "wall":
+            count = poster_wall.get_wall_poster_count()
+            max_width = config.POSTER_WALL_CONFIG["THUMBNAIL_WIDTH"]
+        else:
+            count = config.POSTER_DOWNLOAD_CONFIG["POSTER_COUNT"]
+            max_width = None
+
+        if request["kind"] == "library":
+            members = select_library_items(request["item_id"], count)
+        else:
+            members = get_members(request["item_id"], count)
+        if not members:
+            raise RequestError(404, f"[{resolved['name']}]没有可用的媒体封面")
+
+        output_format = self.get_output_format(resolved)
+        tag_type = config.get_server_config()["IMAGE_TYPE"]
+        poster_keys = [
+            (item["Id"], item.get("ImageTags", {}).get(tag_type)) for item in members
+        ]
+        titles = [
+            template
+            for template in config.TEMPLATE_MAPPING
+            if template.get("library_name") == resolved["name"]
+        ]
+        resolved.update(
+            members=members,
+            count=count,
+            max_width=max_width,
+            fingerprint=make_cache_key(
+                "render_service",
+                config.get_server_key(),
+                request["kind"],
+                request["item_id"],
+                resolved["name"],
+                resolved["layout"],
+                resolved["format"],
+                poster_keys,
+                get_format_config(output_format),
+                output_format["WIDTH"],
+                output_format["HEIGHT"],
+                config.POSTER_WALL_CONFIG if resolved["layout"] == "wall" else None,
+                titles,
+                # 配色按周期轮换时，每个周期的生成结果和 ETag 都不同
+                get_seed_period(),
+            ),
+        )
+        return resolved
+
+    def get_output_format(self, request):
+        """请求对应的输出格式（沿用第一个输出格式的布局参数）"""
+        return {
+            "IMAGE_TYPE": config.OUTPUT_FORMATS[0]["IMAGE_TYPE"],
+            "WIDTH": request["width"],
+            "HEIGHT": request["height"],
+            "LAYOUT": config.OUTPUT_FORMATS[0].get("LAYOUT", {}),
+        }
+
+    def get_cache_path(self, resolved):
+        """生成结果的缓存路径"""
+        ext = IMAGE_FORMATS[resolved["format"]][1]
+        return os.path.join(_cache_dir(), f"{resolved['fingerprint']}{ext}")
+
+    def get_image(self, resolved):
+        """
+        获取生成结果：缓存命中时直接返回，否则生成（同一指纹的并发请求共用一次生成）
+
+        返回:
+            图片数据
+        """
+        path = self.get_cache_path(resolved)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            self._count("hits")
+            return data
+        except OSError:
+            pass
+
+        fingerprint = resolved["fingerprint"]
+        with self._lock:
+            future = self._inflight.get(fingerprint)
+            if future is not None:
+                self.stats["joined"] += 1
+            else:
+                if len(self._inflight) >= self.max_pending:
+                    self.stats["rejected"] += 1
+                    raise RequestError(503, "生成任务过多，请稍后重试")
+                self.stats["renders"] += 1
+                future = self.executor.submit(
+                    self.render, config.get_server_config(), resolved
+                )
+                self._inflight[fingerprint] = future
+                future.add_done_callback(lambda _: self._release(fingerprint))
+        return future.result()
+
+    def _release(self, fingerprint):
+        with self._lock:
+            self._inflight.pop(fingerprint, None)
+
+    def render(self, server, resolved):
+        """在工作线程中下载海报并生成，返回图片数据"""
+        with config.use_server(server):
+            fingerprint = resolved["fingerprint"]
+            poster_folder = os.path.join(
+                config.get_poster_folder(), "service", fingerprint
+            )
+            path = self.get_cache_path(resolved)
+            try:
+                download_shared_images(
+                    {fingerprint: resolved["members"]}, resolved["max_width"]
+                )
+                if not link_poster_folder(
+                    poster_folder,
+                    resolved["members"],
+                    resolved["count"],
+                    resolved["max_width"],
+                ):
+                    raise RequestError(502, "下载海报失败")
+
+                render = gen_poster_workflow
+                if resolved["layout"] == "wall":
+                    render = poster_wall.render_wall_workflow
+                if not render(
+                    resolved["name"],
+                    resolved["item_id"],
+                    output_path=path,
+                    poster_folder=poster_folder,
+                    output_formats=[self.get_output_format(resolved)],
+                ):
+                    raise RequestError(500, "生成封面失败")
+            except Exception:
+                self._count("failed")
+                raise
+            finally:
+                shutil.rmtree(poster_folder, ignore_errors=True)
+
+            with open(path, "rb") as f:
+                data = f.read()
+        evict_responses(config.RENDER_SERVICE_CONFIG["CACHE_MB"] * 1024 * 1024)
+        return data
+
+
+def etag_matches(header, etag):
+    """If-None-Match 请求头是否包含指定的 ETag"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [value.strip() for value in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def make_handler(service):
+    """创建绑定到 service 的请求处理类"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/stats":
+                with service._lock:
+                    body = json.dumps(service.stats).encode("utf-8")
+                self._send(200, body, "application/json")
+                return
+            if url.path != "/cover":
+                self._send_error(404, "未知路径")
+                return
+
+            service._count("requests")
+            try:
+                request = parse_request(parse_qs(url.query))
+                with config.use_server(request["server"]):
+                    resolved = service.resolve(request)
+                    etag = f'"{resolved["fingerprint"]}"'
+                    if etag_matches(self.headers.get("If-None-Match"), etag):
+                        service._count("not_modified")
+                        self._send(304, b"", None, etag)
+                        return
+                    data = service.get_image(resolved)
+            except RequestError as e:
+                self._send_error(e.status, str(e))
+                return
+            except Exception as e:
+                print(f"处理请求时出错: {e}")
+                self._send_error(500, "生成封面时出错")
+                return
+            self._send(200, data, IMAGE_FORMATS[resolved["format"]][0], etag)
+
+        def _send(self, status, body, content_type, etag=None):
+            self.send_response(status)
+            if content_type:
+                self.send_header("Content-Type", content_type)
+            if etag:
+                self.send_header("ETag", etag)
+                # 媒体库内容变化后指纹随之变化，客户端每次都需要重新验证
+                self.send_header("Cache-Control", "no-cache")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def _send_error(self, status, message):
+            body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+            self._send(status, body, "application/json; charset=utf-8")
+
+        def log_message(self, format, *args):
+            print(f"[{self.address_string()}] {format % args}")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="通过 HTTP 按需生成媒体库或合集的封面")
+    parser.add_argument("--host", default=config.RENDER_SERVICE_CONFIG["HOST"])
+    parser.add_argument(
+        "--port", type=int, default=config.RENDER_SERVICE_CONFIG["PORT"]
+    )
+    args = parser.parse_args()
+
+    # 服务只返回最终结果，不保存中间文件
+    config.POSTER_GEN_CONFIG["SAVE_COLUMNS"] = False
+
+    service = RenderService(
+        config.RENDER_SERVICE_CONFIG["WORKERS"],
+        config.RENDER_SERVICE_CONFIG["MAX_PENDING"],
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"封面生成服务已启动: http://{args.host}:{args.port}/cover?library=<媒体库ID>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止服务")
+    finally:
+        server.server_close()
+        service.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import config
+from cache import make_cache_key
+
+
+def get_seed_period(rotation=None):
+    """
+    根据轮换周期返回当前周期标识，同一周期内生成的随机种子不变
+
+    参数:
+        rotation: "none"、"daily"、"weekly" 或 "monthly"
+
+    返回:
+        周期标识字符串
+    """
+    if rotation is None:
+        rotation = config.POSTER_GEN_CONFIG.get("SEED_ROTATION", "none")
+    now = datetime.now()
+    if rotation == "daily":
+        return now.strftime("%Y-%m-%d")
+    elif rotation == "weekly":
+        year, week, _ = now.isocalendar()
+        return f"{year}-W{week:02d}"
+    elif rotation == "monthly":
+        return now.strftime("%Y-%m")
+    return ""
+
+
+def make_render_seed(library_key, items, period=None):
+    """
+    根据媒体库和所选海报生成渲染用的随机种子，输入相同则种子相同
+
+    参数:
+        library_key: 媒体库 ID（没有时使用名称）
+        items: 所选海报的标识列表，如 [(ID, 图片标签), ...]
+        period: 轮换周期标识，为None时根据配置计算
+
+    返回:
+        整数种子
+    """
+    if period is None:
+        period = get_seed_period()
+    return int(make_cache_key("seed", library_key, items, period)[:16], 16)
@@ -0,0 +1,99 @@
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+# 可以直接映射共享内存的图片模式（PIL 内部的像素排列与原始数据一致）及每像素字节数
+BYTES_PER_PIXEL = {"RGBA": 4, "L": 1}
+
+# 当前进程已映射的共享内存块，图片释放后由 detach_all 关闭
+_ATTACHED = []
+
+
+def image_nbytes(mode, size):
+    """图片像素数据的字节数"""
+    return size[0] * size[1] * BYTES_PER_PIXEL[mode]
+
+
+class SharedImageStore:
+    """
+    在主进程中分配用于传递图片像素的共享内存块
+
+    所有内存块由主进程创建和删除，工作进程只映射已有的内存块，
+    工作进程崩溃时不会留下无人删除的内存块；close 在任何情况下都删除全部内存块
+    """
+
+    def __init__(self):
+        self._blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def allocate(self, key, mode, size):
+        """
+        为一张图片分配内存块
+
+        返回:
+            可在进程间传递的句柄 (内存块名称, 模式, 尺寸)
+        """
+        block = shared_memory.SharedMemory(
+            create=True, size=max(1, image_nbytes(mode, size))
+        )
+        self._blocks[key] = block
+        return (block.name, mode, tuple(size))
+
+    def nbytes(self):
+        """已分配的总字节数"""
+        return sum(block.size for block in self._blocks.values())
+
+    def close(self):
+        """关闭并删除所有内存块"""
+        for block in self._blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                pass
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks.clear()
+
+
+def write_image(handle, image):
+    """在工作进程中把图片像素写入主进程分配的内存块"""
+    name, mode, size = handle
+    if image.mode != mode or image.size != tuple(size):
+        raise ValueError(f"图片 {image.mode} {image.size} 与内存块 {mode} {size} 不一致")
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        block.buf[: image_nbytes(mode, size)] = image.tobytes()
+    finally:
+        block.close()
+
+
+def attach_image(handle):
+    """
+    在工作进程中把内存块映射为图片（不复制像素，图片只读）
+
+    图片使用期间内存块保持映射，用完后调用 detach_all 关闭
+    """
+    name, mode, size = handle
+    block = shared_memory.SharedMemory(name=name)
+    _ATTACHED.append(block)
+    return Image.frombuffer(
+        mode, size, block.buf[: image_nbytes(mode, size)], "raw", mode, 0, 1
+    )
+
+
+def detach_all():
+    """关闭当前进程映射的所有内存块（仍被图片引用的内存块留到下次再关闭）"""
+    still_attached = []
+    for block in _ATTACHED:
+        try:
+            block.close()
+        except BufferError:
+            still_attached.append(block)
+    _ATTACHED[:] = still_attached
@@ -2,14 +2,21 @@ import os
 import requests
 import sys
 import base64
+import json
+import threading
+import time
 from urllib.parse import urljoin
 import config
+import http_client
+from cache import atomic_write_bytes
+from gen_poster import get_format_output_path
+from journal import file_hash
 from PIL import Image, ImageFilter, ImageEnhance
 
 
 def load_config():
     """加载配置信息"""
-    return config.SERVER_CONFIG
+    return config.get_server_config()
 
 
 def read_image_file(path):
@@ -23,17 +30,18 @@ def read_image_file(path):
         raise IOError(f"错误: 读取图片文件时出错: {e}")
 
 
-def upload_jellyfin_image(item_id, image_data):
-    """上传图片到Jellyfin服务器"""
+def upload_jellyfin_image(item_id, image_data, image_type=None):
+    """上传图片到Jellyfin服务器（image_type 为None时使用服务器配置的图片类型）"""
     try:
         auth_info = config.get_auth_info()
+        image_type = image_type or config.get_server_config()["IMAGE_TYPE"]
         # 构造 URL 和请求头
-        url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.SERVER_CONFIG['IMAGE_TYPE']}"
+        url = f"{auth_info['base_url']}/Items/{item_id}/Images/{image_type}"
         headers = {
             "Authorization": f'MediaBrowser Token="{auth_info["access_token"]}"',
             "Content-Type": "Image/jpeg",
         }
-        response = requests.post(url, headers=headers, data=image_data, timeout=30)
+        response = http_client.post(url, headers=headers, data=image_data, timeout=30)
 
         if response.status_code in (200, 204):
             print("成功: 图片上传到Jellyfin成功")
@@ -49,25 +57,26 @@ def upload_jellyfin_image(item_id, image_data):
         print(f"错误: 上传到Jellyfin请求过程中出错: {e}")
         return False
 
-def upload_emby_image(item_id, image_data):
-    """上传图片到Emby服务器"""
+def upload_emby_image(item_id, image_data, image_type=None):
+    """上传图片到Emby服务器（image_type 为None时使用服务器配置的图片类型）"""
     try:
         auth_info = config.get_auth_info()
-        
+        image_type = image_type or config.get_server_config()["IMAGE_TYPE"]
+
         # Emby API可以使用API密钥或访问令牌
         if auth_info.get("is_api_key", False):
-            url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.SERVER_CONFIG['IMAGE_TYPE']}?api_key={auth_info['access_token']}"
+            url = f"{auth_info['base_url']}/Items/{item_id}/Images/{image_type}?api_key={auth_info['access_token']}"
             headers = {
                 "Content-Type": "Image/jpeg",
             }
         else:
-            url = f"{auth_info['base_url']}/Items/{item_id}/Images/{config.SERVER_CONFIG['IMAGE_TYPE']}"
+            url = f"{auth_info['base_url']}/Items/{item_id}/Images/{image_type}"
             headers = {
                 "Authorization": f'MediaBrowser Token="{auth_info["access_token"]}"',
                 "Content-Type": "Image/jpeg",
             }
         
-        response = requests.post(url, headers=headers, data=image_data, timeout=30)
+        response = http_client.post(url, headers=headers, data=image_data, timeout=30)
 
         if response.status_code in (200, 204):
             print("成功: 图片上传到Emby成功")
@@ -83,19 +92,167 @@ def upload_emby_image(item_id, image_data):
         print(f"错误: 上传到Emby请求过程中出错: {e}")
         return False
 
-def upload_image(item_id, image_data):
+def upload_image(item_id, image_data, image_type=None):
     """根据服务器类型上传图片"""
-    server_type = config.SERVER_TYPE
+    server_type = config.get_server_type()
     
     if server_type == "jellyfin":
-        return upload_jellyfin_image(item_id, image_data)
+        return upload_jellyfin_image(item_id, image_data, image_type)
     elif server_type == "emby":
-        return upload_emby_image(item_id, image_data)
+        return upload_emby_image(item_id, image_data, image_type)
     else:
         print(f"不支持的服务器类型: {server_type}")
         return False
 
 
+# 上传记录的读改写在多个线程之间共用一把锁
+_UPLOAD_LOCK = threading.RLock()
+
+# 每个服务器的图片上传统计
+_UPLOAD_STATS = {}
+
+
+def get_item_image_tags(item_id):
+    """
+    获取服务器上媒体项当前的图片标签
+
+    返回:
+        {图片类型: 标签}（Backdrop 使用第一张背景图的标签），获取失败时返回 None
+    """
+    auth_info = config.get_auth_info()
+    url = f"{auth_info['base_url']}/Users/{auth_info['user_id']}/Items/{item_id}"
+    headers = {}
+    if config.get_server_type() == "emby" and auth_info.get("is_api_key", False):
+        url += f"?api_key={auth_info['access_token']}"
+    else:
+        headers = {
+            "Authorization": f'MediaBrowser Token="{auth_info["access_token"]}"'
+        }
+    try:
+        response = http_client.get(url, headers=headers, timeout=30)
+        if response.status_code != 200:
+            print(f"获取图片标签失败，状态码: {response.status_code}")
+            return None
+        item = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"获取图片标签时出错: {e}")
+        return None
+
+    tags = dict(item.get("ImageTags") or {})
+    backdrop_tags = item.get("BackdropImageTags") or []
+    if backdrop_tags:
+        tags["Backdrop"] = backdrop_tags[0]
+    return tags
+
+
+def _records_path():
+    """当前服务器的上传记录路径"""
+    server_key = config.get_server_key()
+    file_name = f"uploads_{server_key}.json" if server_key else "uploads.json"
+    return os.path.join(config.CACHE_FOLDER, file_name)
+
+
+def load_upload_records():
+    """
+    读取上传记录：{"<媒体项ID>/<图片类型>": {"hash": 上传内容的 sha1, "tag": 上传后服务器的图片标签}}
+    """
+    try:
+        with open(_records_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_upload_records(changes):
+    """把本次上传的记录合并到上传记录中（先重新读取，避免覆盖其他线程的记录）"""
+    with _UPLOAD_LOCK:
+        records = load_upload_records()
+        records.update(changes)
+        data = json.dumps(records, ensure_ascii=False, indent=2).encode("utf-8")
+        try:
+            atomic_write_bytes(_records_path(), data)
+        except OSError as e:
+            print(f"警告: 保存上传记录失败: {e}")
+
+
+def _count_upload(key):
+    with _UPLOAD_LOCK:
+        stats = _UPLOAD_STATS.setdefault(
+            config.get_server_key(), {"uploaded": 0, "skipped": 0, "failed": 0}
+        )
+        stats[key] += 1
+
+
+def get_upload_stats():
+    """当前服务器的图片上传统计（uploaded/skipped/failed）"""
+    with _UPLOAD_LOCK:
+        return dict(
+            _UPLOAD_STATS.get(
+                config.get_server_key(), {"uploaded": 0, "skipped": 0, "failed": 0}
+            )
+        )
+
+
+def upload_output_images(item_id, base_path):
+    """
+    上传所有输出格式的图片，内容和服务器上的图片都未变化时跳过
+
+    与上次上传的内容哈希相同、且服务器当前的图片标签仍是上次上传后的标签时不再上传，
+    避免服务器重新处理图片、客户端缓存失效；图片在服务器上被手动替换后标签变化，重新上传
+
+    参数:
+        item_id: 媒体项 ID
+        base_path: 第一个输出格式的图片路径
+
+    返回:
+        bool: 是否全部上传成功（或无需上传）
+    """
+    current_tags = get_item_image_tags(item_id)
+    records = load_upload_records()
+    changes = {}
+    success = True
+
+    for index, output_format in enumerate(config.OUTPUT_FORMATS):
+        image_type = output_format["IMAGE_TYPE"]
+        file_path = get_format_output_path(base_path, index, output_format)
+        content_hash = file_hash(file_path)
+        if content_hash is None:
+            print(f"错误: 找不到 {image_type} 图片: {file_path}")
+            _count_upload("failed")
+            success = False
+            continue
+
+        record = records.get(f"{item_id}/{image_type}")
+        current_tag = (current_tags or {}).get(image_type)
+        if record and current_tag:
+            if record.get("hash") == content_hash and record.get("tag") == current_tag:
+                print(f"{image_type} 图片未变化，跳过上传")
+                _count_upload("skipped")
+                continue
+            if record.get("tag") != current_tag:
+                print(f"服务器上的 {image_type} 图片已被替换，重新上传")
+
+        image_data_base64 = read_image_file(file_path)
+        if not upload_image(item_id, image_data_base64, image_type):
+            print(f"{image_type} 图片上传失败")
+            _count_upload("failed")
+            success = False
+            continue
+        _count_upload("uploaded")
+
+        # 记录上传后服务器生成的新标签，之后据此判断图片是否被替换
+        new_tags = get_item_image_tags(item_id)
+        changes[f"{item_id}/{image_type}"] = {
+            "hash": content_hash,
+            "tag": (new_tags or {}).get(image_type),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    if changes:
+        save_upload_records(changes)
+    return success
+
+
 def add_shadow(img, offset=(5, 5), shadow_color=(0, 0, 0, 100), blur_radius=3):
     """
     给图片添加右侧和底部阴影
@@ -139,20 +296,18 @@ def add_shadow(img, offset=(5, 5), shadow_color=(0, 0, 0, 100), blur_radius=3):
 def upload_poster_workflow(item_id, name):
     """
     封装上传海报到Jellyfin的完整工作流程
+    每个输出格式的图片上传为对应的图片类型（Primary、Thumb、Backdrop 等），
+    内容和服务器上的图片都未变化时跳过
 
     返回:
-        bool: 上传是否成功
+        bool: 是否全部上传成功
     """
     try:
         print("\n[4/4] 正在更新Jellyfin海报...")
         print("-" * 40)
 
-        file_path = os.path.join(config.OUTPUT_FOLDER, f"{name}.png")
-        # 读取图片文件
-        image_data_base64 = read_image_file(file_path)
-
-        # 上传图片
-        success = upload_image(item_id, image_data_base64)
+        base_path = os.path.join(config.get_output_folder(), f"{name}.png")
+        success = upload_output_images(item_id, base_path)
 
         if success:
             print("\n海报上传成功！")
@@ -0,0 +1,454 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL,
+    server TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    claimed REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL,
+    not_before REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (run_id, status);
+"""
+
+
+def connect():
+    """
+    打开队列数据库（每个线程使用独立连接）
+
+    队列可能放在多台主机共享的网络卷上，WAL 模式依赖共享内存，
+    在网络文件系统上不可靠，因此使用默认的回滚日志模式
+    """
+    db_path = config.WORK_QUEUE_CONFIG["PATH"]
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    migrate(conn)
+    return conn
+
+
+def migrate(conn):
+    """为旧版本创建的队列数据库补充新增的列"""
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+    if "not_before" in columns:
+        return
+    try:
+        conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL")
+    except sqlite3.OperationalError as e:
+        # 其他工作进程可能同时完成了迁移
+        if "duplicate column" not in str(e):
+            raise
+
+
+def get_retry_delay(attempts):
+    """第 attempts 次尝试失败后，重试前等待的秒数（指数退避）"""
+    queue_config = config.WORK_QUEUE_CONFIG
+    delay = queue_config["RETRY_DELAY_SECONDS"] * 2 ** max(0, attempts - 1)
+    return min(delay, queue_config["MAX_RETRY_DELAY_SECONDS"])
+
+
+def get_latest_run(conn):
+    """最近一次运行的 ID，没有运行时返回 None"""
+    row = conn.execute("SELECT MAX(id) AS id FROM runs").fetchone()
+    return row["id"]
+
+
+def make_owner():
+    """工作进程的标识（主机名:进程号），用于租约"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_run(collections=False):
+    """
+    协调者：为所有服务器展开一次运行的任务
+
+    每个需要处理的媒体库是一个任务，collections 为 True 时每个合集也是一个任务，
+    被排除的媒体库不会进入队列
+
+    返回:
+        (运行 ID, 任务数量)
+    """
+    from collection_batch import list_collections
+    from get_library import get_libraries
+    from planner import build_work_plan, print_work_plan
+
+    jobs = []
+    for server in config.SERVERS:
+        with config.use_server(server):
+            label = server["NAME"] or server["BASE_URL"]
+            libraries = get_libraries()
+            if not libraries:
+                print(f"[{label}]未能获取媒体库列表")
+            else:
+                plan = build_work_plan(libraries)
+                print_work_plan(plan)
+                for entry in plan:
+                    if entry["action"] == "skip":
+                        continue
+                    library = entry["library"]
+                    payload = {"library": library, "action": entry["action"]}
+                    jobs.append((server["NAME"], "library", library["Name"], payload))
+
+            if collections:
+                for collection in list_collections():
+                    name = collection.get("Name", "")
+                    payload = {"collection": {"Id": collection["Id"], "Name": name}}
+                    jobs.append((server["NAME"], "collection", name, payload))
+
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        run_id = conn.execute(
+            "INSERT INTO runs (started) VALUES (?)", (now,)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO jobs (run_id, server, kind, name, payload, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (run_id, server_name, kind, name, json.dumps(payload), now)
+                for server_name, kind, name, payload in jobs
+            ],
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    print(f"运行 {run_id}: 已加入 {len(jobs)} 个任务")
+    return run_id, len(jobs)
+
+
+def claim_job(conn, run_id, owner):
+    """
+    领取一个任务：优先领取等待中的任务，其次是租约已过期的任务（工作进程崩溃或失联），
+    失败后等待重试的任务在退避时间结束前不会被领取
+
+    已用完尝试次数的过期任务标记为失败
+
+    返回:
+        任务行，没有可领取的任务时返回 None
+    """
+    queue_config = config.WORK_QUEUE_CONFIG
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        while True:
+            now = time.time()
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE run_id = ? AND ((status = 'pending' "
+                "AND (not_before IS NULL OR not_before <= ?)) "
+                "OR (status = 'leased' AND lease_expires < ?)) ORDER BY id LIMIT 1",
+                (run_id, now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            if row["status"] == "leased":
+                print(f"[{row['name']}]租约已过期（{row['owner']}），重新分配")
+                if row["attempts"] >= queue_config["MAX_ATTEMPTS"]:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', owner = NULL, "
+                        "error = ?, updated = ? WHERE id = ?",
+                        ("租约过期次数过多", now, row["id"]),
+                    )
+                    continue
+
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', owner = ?, lease_expires = ?, "
+                "claimed = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (owner, now + queue_config["LEASE_SECONDS"], now, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+            return conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (row["id"],)
+            ).fetchone()
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def finish_job(conn, job, owner, result=None, error=None):
+    """
+    记录任务结果：成功时标记为完成；失败时未用完尝试次数则在退避时间后重新排队，
+    否则标记为失败
+
+    只有仍持有租约时才写入，租约已被其他工作进程接管时返回 False
+    """
+    now = time.time()
+    not_before = None
+    if error is None and not result["failed"]:
+        status = "done"
+    elif job["attempts"] < config.WORK_QUEUE_CONFIG["MAX_ATTEMPTS"]:
+        status = "pending"
+        not_before = now + get_retry_delay(job["attempts"])
+    else:
+        status = "failed"
+    cursor = conn.execute(
+        "UPDATE jobs SET status = ?, owner = NULL, lease_expires = NULL, result = ?, "
+        "error = ?, updated = ?, not_before = ? "
+        "WHERE id = ? AND owner = ? AND status = 'leased'",
+        (
+            status,
+            json.dumps(result) if result is not None else None,
+            error,
+            now,
+            not_before,
+            job["id"],
+            owner,
+        ),
+    )
+    return cursor.rowcount == 1
+
+
+class Heartbeat:
+    """在后台线程中定期续约，任务运行时间超过租约时长也不会被重新分配"""
+
+    def __init__(self, job_id, owner):
+        self.job_id = job_id
+        self.owner = owner
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        queue_config = config.WORK_QUEUE_CONFIG
+        conn = connect()
+        try:
+            while not self._stop.wait(queue_config["HEARTBEAT_SECONDS"]):
+                try:
+                    cursor = conn.execute(
+                        "UPDATE jobs SET lease_expires = ? "
+                        "WHERE id = ? AND owner = ? AND status = 'leased'",
+                        (
+                            time.time() + queue_config["LEASE_SECONDS"],
+                            self.job_id,
+                            self.owner,
+                        ),
+                    )
+                except sqlite3.Error as e:
+                    print(f"警告: 续约失败: {e}")
+                    continue
+                if cursor.rowcount == 0:
+                    print("警告: 任务租约已被其他工作进程接管")
+                    self.lost = True
+                    return
+        finally:
+            conn.close()
+
+
+def execute_job(job):
+    """
+    在当前进程中执行一个任务
+
+    返回:
+        dict: 统计增量（rendered/uploaded/failed）
+    """
+    server = config.find_server(job["server"])
+    if server is None:
+        raise ValueError(f"找不到服务器: {job['server']}")
+    payload = json.loads(job["payload"])
+
+    with config.use_server(server):
+        if job["kind"] == "library":
+            from main import process_library
+
+            entry = {
+                "library": payload["library"],
+                "action": payload["action"],
+                "reason": "",
+            }
+            return process_library(entry)
+        if job["kind"] == "collection":
+            from collection_batch import process_collection
+
+            return process_collection(payload["collection"])
+    raise ValueError(f"不支持的任务类型: {job['kind']}")
+
+
+def run_worker(run_id=None):
+    """
+    工作进程：不断领取并执行任务，直到本次运行的所有任务都已结束
+
+    其他工作进程持有的任务尚未结束时继续等待，它们的租约过期后会在这里重新执行
+
+    返回:
+        本进程执行的任务数量
+    """
+    owner = make_owner()
+    conn = connect()
+    executed = 0
+    try:
+        if run_id is None:
+            run_id = get_latest_run(conn)
+        if run_id is None:
+            print("队列中没有运行")
+            return 0
+
+        while True:
+            job = claim_job(conn, run_id, owner)
+            if job is None:
+                remaining = conn.execute(
+                    "SELECT COUNT(*) FROM jobs "
+                    "WHERE run_id = ? AND status IN ('pending', 'leased')",
+                    (run_id,),
+                ).fetchone()[0]
+                if not remaining:
+                    break
+                time.sleep(config.WORK_QUEUE_CONFIG["POLL_SECONDS"])
+                continue
+
+            print(f"[{owner}]开始任务 {job['id']}: {job['name']}（第 {job['attempts']} 次）")
+            result, error = None, None
+            with Heartbeat(job["id"], owner):
+                try:
+                    result = execute_job(job)
+                except Exception as e:
+                    error = str(e)
+                    print(f"[{job['name']}]任务出错: {e}")
+            if not finish_job(conn, job, owner, result, error):
+                print(f"[{job['name']}]租约已被接管，结果由其他工作进程记录")
+            executed += 1
+    finally:
+        conn.close()
+    return executed
+
+
+def run_workers(processes=1, run_id=None):
+    """启动多个工作进程，返回执行的任务总数"""
+    if processes <= 1:
+        return run_worker(run_id)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(run_worker, run_id) for _ in range(processes)]
+        return sum(future.result() for future in futures)
+
+
+def collect_report(run_id=None):
+    """
+    汇总一次运行中所有工作进程的结果
+
+    返回:
+        (运行 ID, 按服务器汇总的统计列表)，没有运行时返回 (None, [])
+    """
+    conn = connect()
+    try:
+        if run_id is None:
+            run_id = get_latest_run(conn)
+        if run_id is None:
+            return None, []
+        run = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        rows = conn.execute("SELECT * FROM jobs WHERE run_id = ?", (run_id,)).fetchall()
+    finally:
+        conn.close()
+
+    reports = {}
+    for row in rows:
+        report = reports.setdefault(
+            row["server"],
+            {
+                "server": row["server"] or "默认服务器",
+                "jobs": 0,
+                "pending": 0,
+                "leased": 0,
+                "done": 0,
+                "failed": 0,
+                "retried": 0,
+                "rendered": 0,
+                "uploaded": 0,
+                "seconds": 0.0,
+            },
+        )
+        report["jobs"] += 1
+        report[row["status"]] += 1
+        report["retried"] += max(0, row["attempts"] - 1)
+        if row["result"]:
+            result = json.loads(row["result"])
+            report["rendered"] += result.get("rendered", 0)
+            report["uploaded"] += result.get("uploaded", 0)
+        if row["updated"] and run is not None:
+            report["seconds"] = max(report["seconds"], row["updated"] - run["started"])
+    return run_id, list(reports.values())
+
+
+def print_report(run_id=None):
+    """打印一次运行的汇总结果"""
+    run_id, reports = collect_report(run_id)
+    if run_id is None:
+        print("队列中没有运行")
+        return
+    print(f"\n运行 {run_id} 的处理结果:")
+    for report in reports:
+        print(
+            f"  {report['server']}: 任务 {report['jobs']} 个，完成 {report['done']} 个，"
+            f"失败 {report['failed']} 个，未完成 {report['pending'] + report['leased']} 个，"
+            f"重试 {report['retried']} 次；生成 {report['rendered']} 个，"
+            f"上传 {report['uploaded']} 个，耗时 {report['seconds']:.1f} 秒"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式工作队列：多个工作进程共同完成一次运行")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinate = subparsers.add_parser("coordinate", help="展开一次运行的任务")
+    coordinate.add_argument("--collections", action="store_true", help="同时为每个合集创建任务")
+    coordinate.add_argument("--work", type=int, default=0, help="展开后在本机启动 N 个工作进程")
+
+    work = subparsers.add_parser("work", help="领取并执行任务")
+    work.add_argument("--processes", type=int, default=1, help="工作进程数，默认 1")
+    work.add_argument("--run", type=int, default=None, help="运行 ID，默认为最近一次运行")
+
+    report = subparsers.add_parser("report", help="汇总运行结果")
+    report.add_argument("--run", type=int, default=None, help="运行 ID，默认为最近一次运行")
+    args = parser.parse_args()
+
+    if args.command == "coordinate":
+        run_id, _ = enqueue_run(args.collections)
+        if args.work:
+            run_workers(args.work, run_id)
+            print_report(run_id)
+    elif args.command == "work":
+        executed = run_workers(args.processes, args.run)
+        print(f"共执行 {executed} 个任务")
+        print_report(args.run)
+    else:
+        print_report(args.run)
+
+
+if __name__ == "__main__":
+    # 打包为可执行文件后，子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    main()